@@ -0,0 +1,187 @@
+"""
+Chat throughput of one process at 1, 10 and 50 concurrent sessions.
+
+Each session is its own conversation of --turns questions, driven through
+AsyncChatManager (real SQLite, real AsyncOpenAI client). The model and the
+retrieval path are stand-ins so the numbers reflect how the process overlaps
+waiting, not model speed: a local OpenAI-compatible server streams the answer
+after --llm-latency seconds, and the encoder and Chroma lookup block their
+worker thread for --encode-latency and --rag-latency seconds. With --llm fake
+the in-process fake backend (LLM_BACKEND=fake) waits the same latency instead,
+so the HTTP client and server are left out.
+
+The "sync" line runs the same sessions one after another through ChatManager,
+which is what a single synchronous process can do.
+
+Usage:
+    python benchmarks/bench_async_load.py --sessions 1 10 50 --turns 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'preprocessing'))
+
+from loguru import logger
+
+from app.async_chat_manager import AsyncChatManager
+from app.chat_manager import ChatManager
+
+QUESTIONS = [
+    "What percentage of remote workers in Denver prefer coffee shops?",
+    "And how does that compare to Seattle?",
+    "Which city has the most productive mornings?",
+]
+CHUNKS = [{"text": "42% of remote workers in Denver prefer coffee shops.", "score": 0.9, "metadata": {}}]
+
+
+def start_fake_llm(latency: float) -> ThreadingHTTPServer:
+    """OpenAI-compatible endpoint that streams a fixed answer after a delay."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for delta in ["42% of remote workers ", "in Denver prefer coffee shops."]:
+                chunk = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stand_ins(encode_latency: float, rag_latency: float):
+    """Classifier and rag_search replacements that block like the real ones."""
+
+    class BlockingClassifier:
+        # No encoder: the context packer falls back to the retrieved content as is
+        model = None
+
+        def embed_query(self, query):
+            time.sleep(encode_latency)
+            return [1.0, 0.0, 0.0]
+
+        def score(self, query, content, query_embedding=None):
+            time.sleep(encode_latency)
+            return 0.9
+
+    def blocking_rag_search(query, **kwargs):
+        time.sleep(rag_latency)
+        return [dict(chunk) for chunk in CHUNKS]
+
+    return BlockingClassifier, blocking_rag_search
+
+
+async def run_async(manager: AsyncChatManager, user_id: int, sessions: int, turns: int):
+    """Run sessions concurrently; returns (wall seconds, per-turn latencies)."""
+    latencies = []
+
+    async def session():
+        conversation_id = None
+        for i in range(turns):
+            start = time.perf_counter()
+            result = await manager.chat(user_id, QUESTIONS[i % len(QUESTIONS)], conversation_id)
+            latencies.append(time.perf_counter() - start)
+            conversation_id = result["conversation_id"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    return time.perf_counter() - start, latencies
+
+
+def run_sync(manager: ChatManager, user_id: int, sessions: int, turns: int):
+    """Run the same sessions back to back on the synchronous manager."""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(sessions):
+        conversation_id = None
+        for i in range(turns):
+            turn_start = time.perf_counter()
+            result = manager.chat(user_id, QUESTIONS[i % len(QUESTIONS)], conversation_id)
+            latencies.append(time.perf_counter() - turn_start)
+            conversation_id = result["conversation_id"]
+    return time.perf_counter() - start, latencies
+
+
+def report(label: str, sessions: int, wall: float, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    print(f"{label:>5} {sessions:>4} sessions: {len(latencies) / wall:7.1f} turns/s, "
+          f"p50 {1000 * statistics.median(ordered):7.1f} ms, p95 {1000 * p95:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--llm", choices=["server", "fake"], default="server",
+                        help="local OpenAI-compatible server, or the in-process fake backend")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--encode-latency", type=float, default=0.01)
+    parser.add_argument("--rag-latency", type=float, default=0.02)
+    parser.add_argument("--skip-sync", action="store_true", help="only run the async manager")
+    args = parser.parse_args()
+
+    logger.remove()
+    server = None
+    if args.llm == "fake":
+        os.environ["LLM_BACKEND"] = "fake"
+        os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    else:
+        server = start_fake_llm(args.llm_latency)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    classifier_class, rag = stand_ins(args.encode_latency, args.rag_latency)
+    # Prompt assembly is not what is measured; avoid downloading the tiktoken vocabulary
+    tokenizer = Mock()
+    tokenizer.encode.side_effect = lambda text: text.split()
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            patch('agent.agent.Classifier', classifier_class), \
+            patch('agent.agent.rag_search', rag), \
+            patch('agent.async_agent.rag_search', rag), \
+            patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        # SQLiteChatDB writes ./chat.db
+        os.chdir(workdir)
+
+        async def async_levels():
+            manager = AsyncChatManager()
+            user_id = await manager.login_user("bench@example.com")
+            for sessions in args.sessions:
+                report("async", sessions, *await run_async(manager, user_id, sessions, args.turns))
+
+        asyncio.run(async_levels())
+
+        if not args.skip_sync:
+            manager = ChatManager()
+            user_id = manager.login_user("bench@example.com")
+            for sessions in args.sessions:
+                report("sync", sessions, *run_sync(manager, user_id, sessions, args.turns))
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
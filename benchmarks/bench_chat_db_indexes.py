@@ -0,0 +1,143 @@
+"""
+Chat database lookups on a synthetic million-message database, before and
+after the schema migrations.
+
+Builds an unversioned database with the original tables (no secondary
+indexes), times the three hot lookups (conversation list, history, sources),
+upgrades it in place with SQLiteChatDB and times them again.
+
+Usage:
+    python benchmarks/bench_chat_db_indexes.py --messages 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from loguru import logger
+
+from app.database import MIGRATIONS, SQLiteChatDB
+
+BATCH = 50_000
+
+
+def build_legacy_database(path: str, users: int, conversations: int, messages: int):
+    """Create the original schema and fill it with synthetic rows."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    for statement in MIGRATIONS[0]:
+        conn.execute(statement)
+
+    conn.executemany("INSERT INTO users (id, email) VALUES (?, ?)",
+                     ((i, f"user{i}@example.com") for i in range(1, users + 1)))
+    conn.executemany(
+        "INSERT INTO conversations (id, user_id, title, updated_at) VALUES (?, ?, ?, datetime('now', ?))",
+        ((i, random.randint(1, users), f"Conversation {i}", f"-{random.randint(0, 10_000)} minutes")
+         for i in range(1, conversations + 1))
+    )
+
+    for start in range(1, messages + 1, BATCH):
+        ids = range(start, min(start + BATCH, messages + 1))
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, method_used, created_at) "
+            "VALUES (?, ?, ?, ?, 'rag', datetime('now', ?))",
+            ((i, random.randint(1, conversations), 'user' if i % 2 else 'assistant',
+              "Remote workers in Denver prefer coffee shops. " * 4, f"-{messages - i} seconds") for i in ids)
+        )
+        # Assistant messages carry two sources each
+        conn.executemany(
+            "INSERT INTO message_sources (message_id, type, source, title, text, score, metadata) "
+            "VALUES (?, 'rag', 'Knowledge Base', 'Chunk', 'Denver | 42%', ?, '{}')",
+            ((i, random.random()) for i in ids if i % 2 == 0 for _ in range(2))
+        )
+        conn.commit()
+    conn.close()
+
+
+def time_lookups(db: SQLiteChatDB, users: int, conversations: int, messages: int, queries: int):
+    """Mean milliseconds per call of each hot lookup."""
+    rng = random.Random(7)
+    lookups = {
+        "conversation list": lambda: db.get_user_conversations(rng.randint(1, users)),
+        "history": lambda: db.get_conversation_messages(rng.randint(1, conversations)),
+        "sources": lambda: db.get_message_sources(2 * rng.randint(1, messages // 2)),
+    }
+    timings = {}
+    for name, lookup in lookups.items():
+        start = time.perf_counter()
+        for _ in range(queries):
+            lookup()
+        timings[name] = 1000 * (time.perf_counter() - start) / queries
+    return timings
+
+
+class UnmigratedDB(SQLiteChatDB):
+    """SQLiteChatDB that leaves the schema as it finds it, with the original conversation list and history queries."""
+
+    def init_db(self):
+        pass
+
+    def get_user_conversations(self, user_id: int):
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                SELECT c.id, c.title, c.created_at, c.updated_at, COUNT(m.id) as message_count
+                FROM conversations c
+                LEFT JOIN messages m ON c.id = m.conversation_id
+                WHERE c.user_id = ?
+                GROUP BY c.id
+                ORDER BY c.updated_at DESC
+            ''', (user_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_conversation_messages(self, conversation_id: int):
+        # The original schema has no token_count column
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                SELECT id, role, content, method_used, rag_score, web_score, feedback, created_at
+                FROM messages
+                WHERE conversation_id = ?
+                ORDER BY created_at ASC
+            ''', (conversation_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    logger.remove()
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "chat.db")
+        start = time.perf_counter()
+        build_legacy_database(path, args.users, args.conversations, args.messages)
+        print(f"built {args.messages:,} messages in {time.perf_counter() - start:.1f} s")
+
+        legacy = UnmigratedDB(path)
+        before = time_lookups(legacy, args.users, args.conversations, args.messages, args.queries)
+        legacy.close()
+
+        start = time.perf_counter()
+        db = SQLiteChatDB(path)
+        print(f"migrated in place in {time.perf_counter() - start:.1f} s")
+        after = time_lookups(db, args.users, args.conversations, args.messages, args.queries)
+        db.close()
+
+        for name in before:
+            print(f"{name:>18}: {before[name]:9.2f} ms -> {after[name]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Peak Python memory of chunking a synthetic markdown table of --rows rows.
+
+"before" is the previous pipeline: load_markdown_file reads the whole file
+and chunk_text(method="table_rows") splits it into a list of lines and
+builds a list of chunks. "after" iterates preprocessing.chunker.iter_chunks,
+which streams the file line by line (or through a memory map, whose pages
+belong to the page cache and are not counted here) and yields one chunk at
+a time, as ChromaDBLoader.sync_chunks consumes them.
+
+Peak memory is measured with tracemalloc, so only Python allocations count.
+
+Usage:
+    python benchmarks/bench_chunker_memory.py --rows 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'preprocessing'))
+
+from chunker import chunk_text, iter_chunks, load_markdown_file
+from bench_ingest import table_lines
+
+
+def measure(chunk):
+    """Run chunk() and return (number of chunks, peak MB, seconds)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = chunk()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, peak / 1e6, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            path = os.path.join(workdir, f"table_{rows}.md")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.writelines(f"{line}\n" for line in table_lines(rows))
+            print(f"{rows:,} rows, {os.path.getsize(path) / 1e6:,.0f} MB file")
+
+            runs = (
+                ("before", lambda: len(chunk_text(load_markdown_file(path), method="table_rows"))),
+                ("after", lambda: sum(1 for _ in iter_chunks(path, method="table_rows", use_mmap=False))),
+                ("after, mmap", lambda: sum(1 for _ in iter_chunks(path, method="table_rows", use_mmap=True))),
+            )
+            for label, chunk in runs:
+                count, peak_mb, seconds = measure(chunk)
+                print(f"{label:>12}: {count:>9,} chunks, peak {peak_mb:8.2f} MB, {seconds:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
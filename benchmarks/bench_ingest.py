@@ -0,0 +1,114 @@
+"""
+Ingestion throughput on a synthetic markdown table of --rows rows.
+
+"before" is the previous ChromaDBLoader.add_chunks: the whole list goes to
+collection.add in one call and the collection's embedding function encodes
+it serially. Chroma rejects calls above client.get_max_batch_size(), so for
+a large table it can only be timed on the first max-batch-size rows.
+
+"after" streams the rows into ChromaDBLoader.sync_chunks, which embeds and
+writes --batch-size chunks at a time, in one process and then in a pool of
+--workers encoding processes (SentenceTransformer.encode_multi_process).
+
+Unless --model names a real SentenceTransformer, a small offline stand-in
+(word embeddings, mean pooling and two dense layers) is used so the numbers
+do not depend on downloading a model; the pool then pays the same
+inter-process overhead it would with a real encoder, but a real encoder
+spends far longer per row, which is what extra processes win back.
+
+Usage:
+    python benchmarks/bench_ingest.py --rows 1000000 --workers 1 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'preprocessing'))
+
+from loguru import logger
+
+from tools import model_registry
+from chroma_loader import ChromaDBLoader, WRITE_BATCH_SIZE
+from chunker import iter_table_rows
+
+CITIES = ["Denver", "Seattle", "Austin", "Boston", "Chicago", "Portland", "Atlanta", "Phoenix"]
+PLACES = ["coffee shops", "libraries", "home offices", "coworking spaces", "parks"]
+
+
+def table_lines(rows: int):
+    """Lines of a markdown table with a header, generated lazily."""
+    yield "| text |"
+    yield "| :--- |"
+    for i in range(rows):
+        yield (f"| Survey row {i}: {10 + i % 80}% of remote workers in {CITIES[i % len(CITIES)]} "
+               f"prefer {PLACES[i % len(PLACES)]} and report {i % 9} focus hours |")
+
+
+def stand_in_encoder(dim: int):
+    """Offline SentenceTransformer: word embeddings, mean pooling and two dense layers."""
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Dense, Pooling, WordEmbeddings
+    from sentence_transformers.models.tokenizer import WhitespaceTokenizer
+
+    vocab = sorted({word.lower() for line in table_lines(1000) for word in line.split()} | {str(i) for i in range(100)})
+    weights = np.random.default_rng(0).standard_normal((len(vocab), dim)).astype(np.float32)
+    modules = [WordEmbeddings(WhitespaceTokenizer(vocab, do_lower_case=True), weights),
+               Pooling(dim), Dense(dim, 2 * dim), Dense(2 * dim, dim)]
+    return SentenceTransformer(modules=modules, device="cpu")
+
+
+def report(label: str, rows: int, seconds: float):
+    print(f"{label:>18}: {rows:>9,} rows in {seconds:7.1f} s, {rows / seconds:8,.0f} chunks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--model", default=None, help="real SentenceTransformer to use instead of the stand-in")
+    parser.add_argument("--dim", type=int, default=384, help="stand-in embedding size")
+    parser.add_argument("--skip-before", action="store_true")
+    args = parser.parse_args()
+
+    logger.remove()
+    if args.model is None:
+        encoder, name = stand_in_encoder(args.dim), f"offline stand-in ({args.dim} dims)"
+    else:
+        from sentence_transformers import SentenceTransformer
+        encoder, name = SentenceTransformer(args.model, device="cpu"), args.model
+    # The loader's embedding function and worker pool both resolve the encoder through the registry
+    model_registry._encoders[model_registry.DEFAULT_MODEL_NAME] = encoder
+    print(f"encoder: {name}, {os.cpu_count()} CPUs")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "chroma_db")
+
+        if not args.skip_before:
+            loader = ChromaDBLoader("bench_before", path=path)
+            limit = loader.client.get_max_batch_size()
+            chunks = list(iter_table_rows(table_lines(min(args.rows, limit))))
+            if args.rows > limit:
+                print(f"before: one add() of {args.rows:,} rows exceeds Chroma's max batch size "
+                      f"({limit:,}); timing the first {len(chunks):,}")
+            start = time.perf_counter()
+            loader.collection.add(documents=chunks, metadatas=[{"chunk_index": i} for i in range(len(chunks))],
+                                  ids=[f"chunk_{i}" for i in range(len(chunks))])
+            report("before", len(chunks), time.perf_counter() - start)
+            del chunks
+
+        for workers in args.workers:
+            loader = ChromaDBLoader(f"bench_after_{workers}", path=path)
+            start = time.perf_counter()
+            stats = loader.sync_chunks(iter_table_rows(table_lines(args.rows)), batch_size=args.batch_size, workers=workers)
+            report(f"after, {workers} worker{'s' if workers > 1 else ''}", stats["added"], time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Per-turn latency of the retrieval + classification path, with and without the
+shared model registry.
+
+"before" drops the registry ahead of every component, which reproduces the old
+behaviour of loading all-mpnet-base-v2 for the Chroma loader and for each
+Classifier() built by the RAG and web nodes. "after" reuses the shared encoder
+and Chroma client.
+
+Usage:
+    python benchmarks/bench_model_registry.py --turns 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'preprocessing'))
+
+from tools import model_registry
+from tools.classifier import Classifier
+from chroma_loader import ChromaDBLoader
+from chunker import chunk_text, load_markdown_file
+
+QUERIES = [
+    "What percentage of remote workers in Denver prefer coffee shops?",
+    "Are remote workers in Seattle productive in the morning?",
+    "Do remote workers in Austin take walking meetings?",
+]
+
+
+def run_turn(query: str, cold: bool) -> float:
+    """Run one RAG + classify turn and return its wall time in seconds."""
+    start = time.perf_counter()
+
+    if cold:
+        model_registry.reset()
+    loader = ChromaDBLoader("jedi_ai")
+    results = loader.query(query, n_results=5)
+    content = "\n\n".join(results['documents'][0])
+
+    # The RAG node and the web node each built their own Classifier
+    for _ in range(2):
+        if cold:
+            model_registry.reset()
+        Classifier().score(query, content)
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    data_path = os.path.join(ROOT, 'data', 'data.md')
+    chunks = chunk_text(load_markdown_file(data_path), method="table_rows")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # ChromaDBLoader persists to ./chroma_db
+        os.chdir(workdir)
+        ChromaDBLoader("jedi_ai").add_chunks(chunks)
+
+        for label, cold in (("before", True), ("after", False)):
+            model_registry.reset()
+            run_turn(QUERIES[0], cold=False)  # pay the first download/load outside the timing
+            timings = [run_turn(QUERIES[i % len(QUERIES)], cold) for i in range(args.turns)]
+            mean_ms = 1000 * sum(timings) / len(timings)
+            print(f"{label:>6}: {mean_ms:8.1f} ms/turn over {len(timings)} turns")
+
+
+if __name__ == "__main__":
+    main()
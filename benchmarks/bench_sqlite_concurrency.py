@@ -0,0 +1,100 @@
+"""
+Chat database throughput with concurrent writer and reader threads.
+
+Writers append messages to their own conversation (add_message); readers load
+conversation history and the conversation list, like sessions rendering the
+sidebar. "before" opens a fresh connection with default settings (rollback
+journal, no busy handling beyond sqlite3's default) for every call, as
+SQLiteChatDB used to; "after" uses the pooled WAL connections.
+
+Usage:
+    python benchmarks/bench_sqlite_concurrency.py --writers 4 --readers 8 --ops 200
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from app.database import SQLiteChatDB
+
+
+class PerCallConnectionDB(SQLiteChatDB):
+    """Previous behaviour: a new default connection for every call."""
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def run(db: SQLiteChatDB, writers: int, readers: int, ops: int):
+    """Run all threads to completion; returns (seconds, writes, reads, errors)."""
+    user_id = db.get_or_create_user("bench@example.com")
+    conversation_ids = [db.create_conversation(user_id, f"Writer {i}") for i in range(writers)]
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def writer(conversation_id):
+        for i in range(ops):
+            try:
+                db.add_message(conversation_id, 'user' if i % 2 == 0 else 'assistant', "x" * 400, "rag", 0.8, 0.0)
+                with lock:
+                    counts["writes"] += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    counts["errors"] += 1
+
+    def reader(index):
+        for i in range(ops):
+            try:
+                if i % 4 == 0:
+                    db.get_user_conversations(user_id)
+                else:
+                    db.get_conversation_messages(conversation_ids[(index + i) % writers])
+                with lock:
+                    counts["reads"] += 1
+            except sqlite3.OperationalError:
+                with lock:
+                    counts["errors"] += 1
+
+    threads = [threading.Thread(target=writer, args=(cid,)) for cid in conversation_ids]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, counts["writes"], counts["reads"], counts["errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200, help="operations per thread")
+    args = parser.parse_args()
+
+    for label, db_class in (("before", PerCallConnectionDB), ("after", SQLiteChatDB)):
+        with tempfile.TemporaryDirectory() as workdir:
+            db = db_class(os.path.join(workdir, "chat.db"))
+            seconds, writes, reads, errors = run(db, args.writers, args.readers, args.ops)
+            db.close()
+            print(f"{label:>6}: {writes / seconds:8.0f} writes/s, {reads / seconds:8.0f} reads/s, "
+                  f"{errors} lock errors, {seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Prompt budgeting cost per chat turn with a 10k-token history.
+
+Each turn runs LLMGenerator.build_prompt over the last 10 messages of the
+conversation (about --history-tokens in total) and freshly retrieved
+content, then counts the answer and question for storage, as ChatManager
+does. The window slides by one user/assistant pair per turn.
+
+"before" counts every text with tiktoken on every call and re-encodes the
+final prompt and content for logging, with history messages that carry no
+stored token count; "after" is the current generator, which caches counts by
+content hash, reuses stored message counts and sums the parts.
+
+If tiktoken cannot load the gpt-4o encoding (no network), a byte-level BPE
+encoding with the same kind of split pattern stands in; counts are then in
+bytes rather than real tokens, but both sides pay the same per call.
+
+Usage:
+    python benchmarks/bench_token_budget.py --turns 20 --history-tokens 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from unittest.mock import patch
+
+import tiktoken
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from loguru import logger
+
+from agent.llm_generator import LLMGenerator
+
+WORDS = ("remote workers in Denver prefer coffee shops while Seattle teams report quieter "
+         "mornings and more focus hours according to the survey of productivity habits").split()
+
+
+def load_tokenizer():
+    """The gpt-4o encoding, or a byte-level stand-in when it cannot be downloaded."""
+    try:
+        return tiktoken.encoding_for_model("gpt-4o"), "gpt-4o"
+    except Exception:
+        import tiktoken_ext.openai_public
+        encoding = tiktoken.Encoding(
+            name="byte_level",
+            pat_str=tiktoken_ext.openai_public.r50k_pat_str,
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={}
+        )
+        return encoding, "byte-level stand-in"
+
+
+class UncachedLLMGenerator(LLMGenerator):
+    """Previous behaviour: encode on every count and re-encode the final prompt."""
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text)) if text else 0
+
+    def message_tokens(self, role, content, token_count=None, feedback_note=""):
+        return self.count_tokens(f"{role}: {content}{feedback_note}\n")
+
+    def build_prompt(self, query, content, history=None):
+        prompt = super().build_prompt(query, content, history)
+        self.count_tokens(prompt)
+        self.count_tokens(self.truncate_content(content, self.available_tokens))
+        return prompt
+
+
+def text_of(tokens: int, count) -> str:
+    """Random text of about the given number of tokens."""
+    words = []
+    while count(" ".join(words)) < tokens:
+        words.extend(random.choices(WORDS, k=max(1, (tokens - count(" ".join(words))) // 2)))
+    return " ".join(words)
+
+
+def run(generator: LLMGenerator, conversation, contents, questions, store_counts: bool) -> float:
+    """Mean milliseconds of prompt budgeting per turn."""
+    start = time.perf_counter()
+    for turn, (question, content) in enumerate(zip(questions, contents)):
+        history = conversation[2 * turn:2 * turn + 10]
+        if not store_counts:
+            history = [{k: v for k, v in msg.items() if k != 'token_count'} for msg in history]
+        generator.build_prompt(question, content, history)
+        generator.count_tokens(conversation[2 * turn + 11]['content'])  # the answer, logged
+        generator.count_tokens(question)                                # stored with the turn
+        generator.count_tokens(conversation[2 * turn + 11]['content'])  # stored with the turn
+    return 1000 * (time.perf_counter() - start) / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--history-tokens", type=int, default=10_000, help="tokens in the 10-message history window")
+    parser.add_argument("--content-tokens", type=int, default=20_000, help="tokens of retrieved content per turn")
+    args = parser.parse_args()
+
+    logger.remove()
+    random.seed(42)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    tokenizer, tokenizer_name = load_tokenizer()
+    count = lambda text: len(tokenizer.encode(text))
+
+    message_tokens = args.history_tokens // 10
+    conversation = []
+    for i in range(2 * args.turns + 12):
+        text = text_of(message_tokens, count)
+        conversation.append({"role": "user" if i % 2 == 0 else "assistant", "content": text, "token_count": count(text)})
+    contents = [text_of(args.content_tokens, count) for _ in range(args.turns)]
+    questions = [f"Question {i}: how do remote workers in Denver compare?" for i in range(args.turns)]
+
+    print(f"tokenizer: {tokenizer_name}, {args.turns} turns, "
+          f"{args.history_tokens:,}-token history, {args.content_tokens:,}-token content")
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        before = run(UncachedLLMGenerator(), conversation, contents, questions, store_counts=False)
+        after = run(LLMGenerator(), conversation, contents, questions, store_counts=True)
+    print(f"before: {before:7.2f} ms/turn")
+    print(f" after: {after:7.2f} ms/turn ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Content truncation on 200 KB inputs.
+
+"before" is the previous LLMGenerator.truncate_content: split on ". " and
+tokenize every sentence separately until the budget runs out. "after" encodes
+the content once and finds the cut in token space, either keeping the
+beginning (snapped back to a sentence end) or keeping the passages that best
+match the question.
+
+If tiktoken cannot load the gpt-4o encoding (no network), a byte-level BPE
+encoding stands in; counts are then in bytes rather than real tokens.
+
+Usage:
+    python benchmarks/bench_truncate_content.py --size-kb 200 --max-tokens 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from unittest.mock import patch
+
+import tiktoken
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from loguru import logger
+
+from agent.llm_generator import LLMGenerator, TRUNCATION_NOTE
+
+WORDS = ("remote workers in Denver prefer coffee shops while Seattle teams report quieter "
+         "mornings and more focus hours according to the survey of productivity habits").split()
+QUERY = "How many remote workers in Seattle report quieter mornings?"
+
+
+def load_tokenizer():
+    """The gpt-4o encoding, or a byte-level stand-in when it cannot be downloaded."""
+    try:
+        return tiktoken.encoding_for_model("gpt-4o"), "gpt-4o"
+    except Exception:
+        import tiktoken_ext.openai_public
+        encoding = tiktoken.Encoding(
+            name="byte_level",
+            pat_str=tiktoken_ext.openai_public.r50k_pat_str,
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={}
+        )
+        return encoding, "byte-level stand-in"
+
+
+def web_page(size: int) -> str:
+    """Paragraphs of random sentences totalling about size characters."""
+    paragraphs, length = [], 0
+    while length < size:
+        sentences = [" ".join(random.choices(WORDS, k=random.randint(8, 20))).capitalize() + "."
+                     for _ in range(random.randint(3, 8))]
+        paragraphs.append(" ".join(sentences))
+        length += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+
+def truncate_per_sentence(tokenizer, content: str, max_tokens: int) -> str:
+    """Previous implementation, one tiktoken call per sentence."""
+    if len(tokenizer.encode(content)) <= max_tokens:
+        return content
+    truncated_content, current_tokens = "", 0
+    for sentence in content.split('. '):
+        sentence_with_period = sentence + ". " if not sentence.endswith('.') else sentence + " "
+        sentence_tokens = len(tokenizer.encode(sentence_with_period))
+        if current_tokens + sentence_tokens > max_tokens:
+            truncated_content += TRUNCATION_NOTE
+            break
+        truncated_content += sentence_with_period
+        current_tokens += sentence_tokens
+    return truncated_content.strip()
+
+
+def mean_ms(func, pages) -> float:
+    start = time.perf_counter()
+    for page in pages:
+        func(page)
+    return 1000 * (time.perf_counter() - start) / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-kb", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=20_000)
+    parser.add_argument("--pages", type=int, default=10)
+    args = parser.parse_args()
+
+    logger.remove()
+    random.seed(42)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    tokenizer, tokenizer_name = load_tokenizer()
+    pages = [web_page(args.size_kb * 1000) for _ in range(args.pages)]
+
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        generator = LLMGenerator()
+
+    print(f"tokenizer: {tokenizer_name}, {args.pages} pages of {args.size_kb} KB, budget {args.max_tokens:,} tokens")
+    before = mean_ms(lambda page: truncate_per_sentence(tokenizer, page, args.max_tokens), pages)
+    print(f"           before: {before:8.1f} ms/page")
+    for label, query in (("after (beginning)", None), ("after (passages)", QUERY)):
+        # A fresh cache each run so every page is encoded
+        generator.token_cache.clear()
+        after = mean_ms(lambda page: generator.truncate_content(page, args.max_tokens, query), pages)
+        print(f"{label:>17}: {after:8.1f} ms/page ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
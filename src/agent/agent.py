@@ -1,25 +1,62 @@
 import sys
-from typing import Dict, Any, Literal, Callable, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Literal, Callable, Optional, List, Tuple
 from langgraph.graph import StateGraph, END
 from loguru import logger
 
 from agent.agent_state import AgentState
 from agent.llm_generator import LLMGenerator
+from agent.context_packer import ContextPacker
 
 sys.path.append('./tools')
-from tools.rag_tool import rag_search
+from tools.rag_tool import rag_search, get_index_version
 from tools.web_search import web_search_tool
 from tools.classifier import Classifier
+from agent.semantic_cache import SemanticAnswerCache
 
 class LangGraphAgent:
     """Agent using LangGraph."""
     
-    def __init__(self, threshold: float = 0.5, on_thought: Optional[Callable[[str], None]] = None):
+    def __init__(self, threshold: float = 0.5, on_thought: Optional[Callable[[str], None]] = None,
+                 rag_score_mode: str = "text", speculative_web: bool = False,
+                 semantic_cache: bool = False, semantic_cache_threshold: float = 0.92,
+                 on_token: Optional[Callable[[str], None]] = None, context_tokens: Optional[int] = 6000,
+                 collection: Optional[str] = None, web_num_results: int = 4, web_max_good: Optional[int] = 2):
+        """
+        rag_score_mode: "text" encodes the joined RAG content; "max", "mean" or "weighted"
+        score the stored chunk embeddings instead (see Classifier.score_chunks).
+        speculative_web: start the web search alongside RAG so a low RAG score does not
+        pay for it end-to-end. Costs a SerpAPI call on every turn.
+        semantic_cache: answer questions without history from previous answers to
+        near-identical questions (cosine similarity >= semantic_cache_threshold).
+        on_token: when set, the answer is streamed and each text delta is passed here.
+        context_tokens: pack the passages of the retrieved content most similar to the
+        question into this many tokens (see ContextPacker); None passes the content whole.
+        collection: knowledge base collection to search (default: CHROMA_COLLECTION or jedi_ai).
+        web_num_results: search results whose pages may be fetched; fetching stops once
+        web_max_good of them have relevant content (None fetches them all).
+        """
         self.threshold = threshold
+        self.collection = collection
+        self.web_num_results = web_num_results
+        self.web_max_good = web_max_good
+        self.rag_score_mode = rag_score_mode
+        self.speculative_web = speculative_web
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="web-prefetch") if speculative_web else None
         self.on_thought = on_thought or (lambda x: None)
+        self.on_token = on_token
         self.llm = LLMGenerator()
+        self.classifier = Classifier()
+        self.packer = ContextPacker(self.classifier, self.llm, context_tokens) if context_tokens else None
+        # Stored chunk vectors serve the chunk score modes and the packer, which would otherwise re-encode every chunk
+        self.include_chunk_embeddings = rag_score_mode != "text" or self.packer is not None
+        self.answer_cache = SemanticAnswerCache(
+            threshold=semantic_cache_threshold,
+            index_version=lambda: get_index_version(self.collection)
+        ) if semantic_cache else None
         self.graph = self._build_graph()
-        logger.info(f"LangGraphAgent initialized with threshold: {threshold}")
+        logger.info(f"LangGraphAgent initialized with threshold: {threshold}, RAG score mode: {rag_score_mode}, speculative web: {speculative_web}")
     
     def _build_graph(self):
         """Build LangGraph workflow."""
@@ -63,80 +100,119 @@ class LangGraphAgent:
         self.on_thought("Searching knowledge base...")
         logger.info(f"Starting RAG search for query: {state['original_query']}")
         
-        rag_chunks = rag_search(state["original_query"], similarity_threshold=0.0)
+        # Encode the query once; retrieval and both classifier passes reuse it
+        query_embedding = state.get("query_embedding")
+        if query_embedding is None:
+            query_embedding = self.classifier.embed_query(state["original_query"])
         
-        if rag_chunks:
-            rag_content = "\n\n".join([chunk["text"] for chunk in rag_chunks])
-            logger.info(f"RAG found {len(rag_chunks)} chunks")
-        else:
-            rag_content = f"No relevant information found for: '{state['original_query']}'"
-            logger.warning("No RAG chunks found")
-        
-        if self._has_content(rag_content):
-            classifier = Classifier()
-            score = classifier.score(state["original_query"], rag_content)
-        else:
-            score = 0.0
+        rag_chunks = rag_search(state["original_query"], similarity_threshold=0.0, query_embedding=query_embedding,
+                                include_embeddings=self.include_chunk_embeddings, collection=self.collection)
+        rag_content, score = self._score_rag(state["original_query"], rag_chunks, query_embedding)
         
         logger.info(f"RAG quality score: {score:.3f}")
         self.on_thought(f"RAG quality score: {score:.2f}")
         
         return {**state, 
+                "query_embedding": query_embedding,
                 "rag_content": rag_content, 
                 "rag_score": score,
                 "rag_chunks": rag_chunks}
     
+    def _score_rag(self, query: str, rag_chunks: List[Dict], query_embedding: Optional[List[float]]) -> Tuple[str, float]:
+        """Join the retrieved chunks and score them against the query."""
+        if rag_chunks:
+            rag_content = "\n\n".join([chunk["text"] for chunk in rag_chunks])
+            logger.info(f"RAG found {len(rag_chunks)} chunks")
+        else:
+            rag_content = f"No relevant information found for: '{query}'"
+            logger.warning("No RAG chunks found")
+        
+        use_chunk_embeddings = self.rag_score_mode != "text"
+        if self._has_content(rag_content) and use_chunk_embeddings and all("embedding" in chunk for chunk in rag_chunks):
+            score = self.classifier.score_chunks(
+                query,
+                [chunk["embedding"] for chunk in rag_chunks],
+                rag_content,
+                query_embedding,
+                aggregate=self.rag_score_mode
+            )
+        elif self._has_content(rag_content):
+            score = self.classifier.score(query, rag_content, query_embedding)
+        else:
+            score = 0.0
+        return rag_content, score
+    
     def _web_node(self, state: AgentState) -> AgentState:
         """Web search node with classification."""
         self.on_thought("RAG insufficient, searching web...")
         logger.info(f"Starting web search for query: {state['original_query']}")
         
-        web_results = web_search_tool(state["original_query"], num_results=2)
+        prefetch = state.get("web_prefetch")
+        if prefetch is not None:
+            # Started alongside RAG; whatever time it already ran is saved
+            wait_start = time.perf_counter()
+            web_results, search_seconds = prefetch.result()
+            waited = time.perf_counter() - wait_start
+            latency_saved = max(0.0, search_seconds - waited)
+            logger.info(f"Speculative web search saved {latency_saved * 1000:.0f} ms (ran {search_seconds * 1000:.0f} ms, waited {waited * 1000:.0f} ms)")
+        else:
+            web_results, _ = self._timed_web_search(state["original_query"])
+            latency_saved = 0.0
+        
+        web_content, score = self._score_web(state["original_query"], web_results, state.get("query_embedding"))
+        
+        logger.info(f"Web search quality score: {score:.3f}")
+        self.on_thought(f"Web search quality score: {score:.2f}")
         
+        return {**state, 
+                "web_content": web_content, 
+                "web_score": score,
+                "web_results": web_results,
+                "latency_saved": latency_saved}
+    
+    def _score_web(self, query: str, web_results: List[Dict], query_embedding: Optional[List[float]]) -> Tuple[str, float]:
+        """Join the fetched pages and score them against the query."""
         web_content = ""
         if web_results:
             web_content = "\n\n".join([result["content"] for result in web_results if result.get("content")])
             logger.info(f"Web search found {len(web_results)} results")
         
         if not web_content:
-            web_content = f"No useful web results found for: '{state['original_query']}'"
+            web_content = f"No useful web results found for: '{query}'"
             logger.warning("No useful web content found")
    
         if self._has_content(web_content):
-            classifier = Classifier()
-            score = classifier.score(state["original_query"], web_content)
+            score = self.classifier.score(query, web_content, query_embedding)
         else:
             score = 0.0
-        
-        logger.info(f"Web search quality score: {score:.3f}")
-        self.on_thought(f"Web search quality score: {score:.2f}")
-        
-        return {**state, 
-                "web_content": web_content, 
-                "web_score": score,
-                "web_results": web_results}
+        return web_content, score
+    
+    def _timed_web_search(self, query: str) -> Tuple[List[Dict], float]:
+        """Run the web search and return (results, elapsed seconds)."""
+        start = time.perf_counter()
+        web_results = web_search_tool(query, num_results=self.web_num_results, max_good=self.web_max_good)
+        return web_results, time.perf_counter() - start
     
     def _generate_node(self, state: AgentState) -> AgentState:
         """Generate final answer using LLM."""
-    
-        if state["rag_score"] >= self.threshold:
-            content = state["rag_content"]
-            method = "rag"
-            self.on_thought("Using knowledge base content")
-            logger.info("Using RAG content for answer generation")
-        else:
-            content = state["web_content"]
-            method = "web"
-            self.on_thought("Using web search content")
-            logger.info("Using web content for answer generation")
+        content, method = self._select_content(state)
+        content = self._pack_content(state, content, method)
         
         self.on_thought("Generating final answer...")
         
-        answer = self.llm.generate_answer(
-            state["original_query"],
-            content,
-            state.get("history", [])
-        )
+        if self.on_token is not None:
+            # Forward deltas as they arrive; the full answer is kept for the state
+            deltas = []
+            for delta in self.llm.stream_answer(state["original_query"], content, state.get("history", [])):
+                deltas.append(delta)
+                self.on_token(delta)
+            answer = "".join(deltas).strip()
+        else:
+            answer = self.llm.generate_answer(
+                state["original_query"],
+                content,
+                state.get("history", [])
+            )
         
         logger.info(f"Answer generated using {method} method")
         
@@ -146,6 +222,47 @@ class LangGraphAgent:
             "method_used": method
         }
     
+    def _select_content(self, state: AgentState) -> Tuple[str, str]:
+        """Pick the content (and method name) the answer is generated from."""
+        if state["rag_score"] >= self.threshold:
+            self.on_thought("Using knowledge base content")
+            logger.info("Using RAG content for answer generation")
+            return state["rag_content"], "rag"
+        self.on_thought("Using web search content")
+        logger.info("Using web content for answer generation")
+        return state["web_content"], "web"
+    
+    def _pack_content(self, state: AgentState, content: str, method: str) -> str:
+        """The selected content packed to the most relevant passages, or unchanged if packing is off or fails."""
+        if self.packer is None:
+            return content
+        
+        if method == "rag":
+            sources = [
+                {
+                    "text": chunk.get("text", ""),
+                    "embedding": chunk.get("embedding"),
+                    "tag": self._chunk_tag(chunk, i)
+                }
+                for i, chunk in enumerate(state.get("rag_chunks") or [])
+            ]
+        else:
+            sources = [
+                {"text": result["content"], "tag": f"{result.get('title') or 'Web page'} ({result.get('url', '')})"}
+                for result in state.get("web_results") or [] if result.get("content")
+            ]
+        
+        packed = self.packer.pack(state["original_query"], sources, state.get("query_embedding"))
+        return packed if packed else content
+    
+    @staticmethod
+    def _chunk_tag(chunk: Dict, index: int) -> str:
+        """Packed-context tag of a knowledge base chunk: its file, section and row when indexed with them."""
+        metadata = chunk.get("metadata") or {}
+        if metadata.get("source") and chunk.get("title"):
+            return f"Knowledge base, {chunk['title']}"
+        return f"Knowledge base, chunk {metadata.get('chunk_index', index)}"
+    
     def _fallback_node(self, state: AgentState) -> AgentState:
         """Fallback when both fail."""
         self.on_thought("Both searches failed, using fallback")
@@ -161,6 +278,11 @@ class LangGraphAgent:
         if state["rag_score"] >= self.threshold:
             self.on_thought("RAG quality is sufficient")
             logger.debug(f"RAG score {state['rag_score']:.3f} >= threshold {self.threshold}, routing to answer generation")
+            prefetch = state.get("web_prefetch")
+            if prefetch is not None:
+                # A fetch that already started cannot be interrupted; its result is discarded
+                cancelled = prefetch.cancel()
+                logger.debug(f"Speculative web search {'cancelled' if cancelled else 'discarded'}")
             return "good"
         else:
             self.on_thought("RAG quality too low, trying web search")
@@ -194,10 +316,38 @@ class LangGraphAgent:
         
         logger.info(f"Processing question: {question}")
         
-        #initial state setup
-        initial_state = {
+        # Earlier turns can change what a question means, so only standalone questions use the cache
+        use_cache = self.answer_cache is not None and not history
+        question_embedding = None
+        if use_cache:
+            question_embedding = self.classifier.embed_query(question)
+            cached = self.answer_cache.lookup(question_embedding)
+            if cached is not None:
+                self.on_thought("Found a previous answer to this question")
+                return {**cached, "latency_saved": 0.0, "cache_hit": True}
+        
+        initial_state = self._initial_state(question, history, question_embedding)
+        
+        if self._executor is not None:
+            initial_state["web_prefetch"] = self._executor.submit(self._timed_web_search, question)
+        
+        result = self.graph.invoke(initial_state)
+        
+        logger.info(f"Question answered using {result['method_used']} method")
+        
+        response = self._build_response(result)
+        
+        if use_cache and response["method"] != "fallback":
+            self.answer_cache.store(question, question_embedding, response)
+        
+        return response
+    
+    def _initial_state(self, question: str, history, question_embedding: Optional[List[float]]) -> AgentState:
+        """Graph input for a new question."""
+        return {
             "original_query": question,
             "history": history or [],
+            "query_embedding": question_embedding,
             "rag_content": "",
             "rag_score": 0.0,
             "rag_chunks": [],
@@ -205,18 +355,23 @@ class LangGraphAgent:
             "web_score": 0.0,
             "web_results": [],
             "final_answer": "",
-            "method_used": ""
+            "method_used": "",
+            "web_prefetch": None,
+            "latency_saved": 0.0
         }
-        
-        result = self.graph.invoke(initial_state)
-        
-        logger.info(f"Question answered using {result['method_used']} method")
-        
+    
+    def _build_response(self, result: AgentState) -> Dict[str, Any]:
+        """Response dict returned to the caller from the final graph state."""
+        # Stored chunk vectors only serve scoring and packing; keep them out of responses and the answer cache
+        rag_chunks = [{key: value for key, value in chunk.items() if key != "embedding"}
+                      for chunk in result.get("rag_chunks") or []]
         return {
             "answer": result["final_answer"],
             "method": result["method_used"],
             "rag_score": result["rag_score"],
             "web_score": result["web_score"],
-            "rag_chunks": result.get("rag_chunks", []),
-            "web_results": result.get("web_results", [])
+            "rag_chunks": rag_chunks,
+            "web_results": result.get("web_results", []),
+            "latency_saved": result.get("latency_saved", 0.0),
+            "cache_hit": False
         }
\ No newline at end of file
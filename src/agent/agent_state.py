@@ -1,9 +1,11 @@
-from typing import TypedDict, List, Dict, Any
+from concurrent.futures import Future
+from typing import TypedDict, List, Dict, Any, Optional
 
 class AgentState(TypedDict, total=False):
     """State of the agent during processing."""
     query: str                     
     original_query: str
+    query_embedding: Optional[List[float]]
     history: List[Dict[str, Any]]
     rag_content: str
     rag_score: float
@@ -11,5 +13,7 @@ class AgentState(TypedDict, total=False):
     web_content: str
     web_score: float
     web_results: List[Dict]
+    web_prefetch: Optional[Future]
+    latency_saved: float
     final_answer: str
     method_used: str
\ No newline at end of file
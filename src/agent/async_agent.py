@@ -0,0 +1,161 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from agent.agent import LangGraphAgent
+from agent.agent_state import AgentState
+from tools.rag_tool import rag_search
+from tools.web_search import async_web_search_tool
+
+
+class AsyncLangGraphAgent(LangGraphAgent):
+    """
+    asyncio variant of LangGraphAgent for serving many conversations from one process.
+
+    Same graph, routing and scoring as the sync agent. The LLM call and page
+    fetches are awaited on the event loop; query encoding, classifier scoring
+    and Chroma lookups are CPU-bound or blocking, so they run on a bounded
+    thread pool (cpu_workers) instead of stalling other conversations.
+    """
+
+    def __init__(self, *args, cpu_workers: int = 4, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The prefetch is an asyncio task here, so the sync agent's thread pool is not needed
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="agent-cpu")
+
+    async def _run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on the agent's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._cpu_pool, lambda: func(*args, **kwargs))
+
+    async def _rag_node(self, state: AgentState) -> AgentState:
+        """RAG search node with classification."""
+        self.on_thought("Searching knowledge base...")
+        logger.info(f"Starting RAG search for query: {state['original_query']}")
+
+        query_embedding = state.get("query_embedding")
+        if query_embedding is None:
+            query_embedding = await self._run_blocking(self.classifier.embed_query, state["original_query"])
+
+        rag_chunks = await self._run_blocking(
+            rag_search, state["original_query"], similarity_threshold=0.0, query_embedding=query_embedding,
+            include_embeddings=self.include_chunk_embeddings, collection=self.collection
+        )
+        rag_content, score = await self._run_blocking(self._score_rag, state["original_query"], rag_chunks, query_embedding)
+
+        logger.info(f"RAG quality score: {score:.3f}")
+        self.on_thought(f"RAG quality score: {score:.2f}")
+
+        return {**state,
+                "query_embedding": query_embedding,
+                "rag_content": rag_content,
+                "rag_score": score,
+                "rag_chunks": rag_chunks}
+
+    async def _web_node(self, state: AgentState) -> AgentState:
+        """Web search node with classification."""
+        self.on_thought("RAG insufficient, searching web...")
+        logger.info(f"Starting web search for query: {state['original_query']}")
+
+        prefetch = state.get("web_prefetch")
+        if prefetch is not None:
+            wait_start = time.perf_counter()
+            web_results, search_seconds = await prefetch
+            waited = time.perf_counter() - wait_start
+            latency_saved = max(0.0, search_seconds - waited)
+            logger.info(f"Speculative web search saved {latency_saved * 1000:.0f} ms (ran {search_seconds * 1000:.0f} ms, waited {waited * 1000:.0f} ms)")
+        else:
+            web_results, _ = await self._timed_web_search_async(state["original_query"])
+            latency_saved = 0.0
+
+        web_content, score = await self._run_blocking(
+            self._score_web, state["original_query"], web_results, state.get("query_embedding")
+        )
+
+        logger.info(f"Web search quality score: {score:.3f}")
+        self.on_thought(f"Web search quality score: {score:.2f}")
+
+        return {**state,
+                "web_content": web_content,
+                "web_score": score,
+                "web_results": web_results,
+                "latency_saved": latency_saved}
+
+    async def _route_rag(self, state: AgentState):
+        """Route after RAG classification, on the event loop so a prefetch task can be cancelled safely."""
+        return super()._route_rag(state)
+
+    async def _timed_web_search_async(self, query: str) -> Tuple[List[Dict], float]:
+        """Run the web search and return (results, elapsed seconds)."""
+        start = time.perf_counter()
+        web_results = await async_web_search_tool(query, num_results=self.web_num_results, max_good=self.web_max_good)
+        return web_results, time.perf_counter() - start
+
+    async def _generate_node(self, state: AgentState) -> AgentState:
+        """Generate final answer using LLM."""
+        content, method = self._select_content(state)
+        # Embedding the passages is CPU-bound
+        content = await self._run_blocking(self._pack_content, state, content, method)
+
+        self.on_thought("Generating final answer...")
+
+        if self.on_token is not None:
+            deltas = []
+            async for delta in self.llm.astream_answer(state["original_query"], content, state.get("history", [])):
+                deltas.append(delta)
+                self.on_token(delta)
+            answer = "".join(deltas).strip()
+        else:
+            answer = await self.llm.agenerate_answer(state["original_query"], content, state.get("history", []))
+
+        logger.info(f"Answer generated using {method} method")
+
+        return {
+            **state,
+            "final_answer": answer,
+            "method_used": method
+        }
+
+    async def answer(self, question: str, history=None) -> Dict[str, Any]:
+        """Answer a question using the agent with optional conversation history."""
+
+        logger.info(f"Processing question: {question}")
+
+        use_cache = self.answer_cache is not None and not history
+        question_embedding = None
+        if use_cache:
+            question_embedding = await self._run_blocking(self.classifier.embed_query, question)
+            # A lookup may re-read the index version from Chroma
+            cached = await self._run_blocking(self.answer_cache.lookup, question_embedding)
+            if cached is not None:
+                self.on_thought("Found a previous answer to this question")
+                return {**cached, "latency_saved": 0.0, "cache_hit": True}
+
+        initial_state = self._initial_state(question, history, question_embedding)
+
+        prefetch: Optional[asyncio.Task] = None
+        if self.speculative_web:
+            prefetch = asyncio.ensure_future(self._timed_web_search_async(question))
+            initial_state["web_prefetch"] = prefetch
+
+        try:
+            result = await self.graph.ainvoke(initial_state)
+        finally:
+            # _route_rag cancels an unneeded prefetch; this covers errors in the graph
+            if prefetch is not None and not prefetch.done():
+                prefetch.cancel()
+
+        logger.info(f"Question answered using {result['method_used']} method")
+
+        response = self._build_response(result)
+
+        if use_cache and response["method"] != "fallback":
+            await self._run_blocking(self.answer_cache.store, question, question_embedding, response)
+
+        return response
@@ -0,0 +1,128 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from agent.llm_generator import split_passages
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class ContextPacker:
+    """
+    Build the generation context from the passages most relevant to the question.
+
+    Retrieved chunks and web pages are split into passages, all passages are
+    embedded in one batch and scored against the query embedding with a single
+    matrix product, and the best ones are packed greedily into a token budget.
+    Chunks that are a single passage are scored from their stored embedding.
+    At most max_encoded passages are encoded per call: when there are more,
+    those sharing the most words with the question are encoded (the earliest
+    on ties) and the others are left out, however relevant they would score.
+    Kept passages are grouped under a numbered tag naming their source, in
+    their original order, so the model can tell sources apart.
+    """
+
+    def __init__(self, classifier, llm, max_tokens: int = 6000, min_similarity: float = 0.1,
+                 max_encoded: int = 32):
+        self.classifier = classifier
+        self.llm = llm
+        self.max_tokens = max_tokens
+        # Bounds the encoder work per answer, e.g. on long web pages split into many passages
+        self.max_encoded = max_encoded
+        # Passages less similar than this are left out even if they fit (unless nothing is above it)
+        self.min_similarity = min_similarity
+
+    def pack(self, query: str, sources: List[Dict[str, Any]],
+             query_embedding: Optional[List[float]] = None) -> Optional[str]:
+        """
+        Packed context for the query, or None when it cannot be built.
+
+        sources: dicts with "text" and "tag", plus an optional "embedding" that is
+        reused when the whole text is a single passage. On None the caller should
+        fall back to the unpacked content.
+        """
+        passages = [(index, passage) for index, source in enumerate(sources)
+                    for passage in split_passages(source.get("text") or "")]
+        if not passages:
+            return None
+
+        scores = self._score(query, sources, passages, query_embedding)
+        if scores is None:
+            return None
+
+        sizes = [self.llm.count_tokens(passage) + 1 for _, passage in passages]
+        tag_sizes = [self.llm.count_tokens(self._tag(i, source)) + 1 for i, source in enumerate(sources)]
+
+        ranked = [i for i in np.argsort(-scores, kind="stable") if np.isfinite(scores[i])]
+        candidates = [i for i in ranked if scores[i] >= self.min_similarity] or ranked
+        chosen, tagged, used = [], set(), 0
+        for i in candidates:
+            source_index = passages[i][0]
+            size = sizes[i] + (0 if source_index in tagged else tag_sizes[source_index])
+            if used + size <= self.max_tokens:
+                chosen.append(i)
+                tagged.add(source_index)
+                used += size
+
+        if not chosen:
+            return None
+
+        blocks = []
+        for source_index, source in enumerate(sources):
+            kept = [passages[i][1] for i in sorted(chosen) if passages[i][0] == source_index]
+            if kept:
+                blocks.append("\n".join([self._tag(source_index, source)] + kept))
+
+        logger.info(f"Packed context: {len(chosen)}/{len(passages)} passages from {len(blocks)} sources, "
+                    f"{used} tokens packed from {sum(sizes)} retrieved")
+        return "\n\n".join(blocks)
+
+    def _score(self, query: str, sources: List[Dict[str, Any]], passages,
+               query_embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        """Cosine similarity of every passage to the query (-inf if not encoded), or None without the encoder."""
+        if self.classifier.model is None:
+            logger.warning("Model not available for context packing")
+            return None
+
+        try:
+            if query_embedding is None:
+                query_embedding = self.classifier.embed_query(query)
+                if query_embedding is None:
+                    return None
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+
+            # Chunks that are a single passage keep their stored embedding; the rest are encoded together
+            counts = Counter(index for index, _ in passages)
+            single = {index for index, count in counts.items()
+                      if count == 1 and sources[index].get("embedding") is not None}
+            to_encode = [i for i, (index, _) in enumerate(passages) if index not in single]
+            skipped = []
+            if len(to_encode) > self.max_encoded:
+                # Cheap word overlap with the question picks which passages are worth encoding
+                query_words = set(WORD_PATTERN.findall(query.lower()))
+                overlap = {i: len(query_words & set(WORD_PATTERN.findall(passages[i][1].lower()))) for i in to_encode}
+                ranked = sorted(to_encode, key=lambda i: -overlap[i])
+                to_encode, skipped = sorted(ranked[:self.max_encoded]), ranked[self.max_encoded:]
+                logger.info(f"Encoding {len(to_encode)} passages for packing, leaving out {len(skipped)}")
+
+            matrix = np.zeros((len(passages), query_vector.shape[0]), dtype=np.float32)
+            for i, (index, _) in enumerate(passages):
+                if index in single:
+                    matrix[i] = sources[index]["embedding"]
+            if to_encode:
+                matrix[to_encode] = self.classifier.model.encode([passages[i][1] for i in to_encode])
+
+            norms = np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector), 1e-12)
+            scores = (matrix @ query_vector) / norms
+            scores[skipped] = -np.inf
+            return scores
+        except Exception as e:
+            logger.error(f"Error scoring passages: {str(e)}")
+            return None
+
+    @staticmethod
+    def _tag(index: int, source: Dict[str, Any]) -> str:
+        return f"[{index + 1}] {source['tag']}"
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Iterator, Optional
+
+from openai import OpenAI, AsyncOpenAI
+from loguru import logger
+
+BACKENDS = ("openai", "local", "fake")
+
+
+class LLMBackend(ABC):
+    """
+    Chat completion backend behind LLMGenerator.
+
+    Implementations send one user prompt and return the answer whole or as a
+    stream of text deltas; errors are raised to the generator. A backend
+    missing any of the four methods cannot be instantiated.
+    """
+    model: str = ""
+
+    @abstractmethod
+    def complete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        """The whole answer."""
+
+    @abstractmethod
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        """The answer as text deltas."""
+
+    @abstractmethod
+    async def acomplete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        """complete, without blocking the event loop."""
+
+    @abstractmethod
+    def astream(self, prompt: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        """stream as an async iterator."""
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions API (or any server speaking it, via base_url)."""
+
+    def __init__(self, model: str = "gpt-4o", base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.model = model
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=base_url)
+        # Used by the async agent; its connection pool belongs to the event loop it first runs on
+        self.async_client = AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=base_url)
+
+    def _request(self, prompt: str, temperature: float, max_tokens: int, stream: bool = False) -> dict:
+        request = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if stream:
+            request["stream"] = True
+        return request
+
+    def complete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        response = self.client.chat.completions.create(**self._request(prompt, temperature, max_tokens))
+        return response.choices[0].message.content.strip()
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        stream = self.client.chat.completions.create(**self._request(prompt, temperature, max_tokens, stream=True))
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    async def acomplete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        response = await self.async_client.chat.completions.create(**self._request(prompt, temperature, max_tokens))
+        return response.choices[0].message.content.strip()
+
+    async def astream(self, prompt: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(**self._request(prompt, temperature, max_tokens, stream=True))
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+class LocalBackend(OpenAIBackend):
+    """OpenAI-compatible server run locally (vLLM, llama.cpp, Ollama, ...); no API key needed."""
+
+    def __init__(self, model: str, base_url: str, api_key: Optional[str] = None):
+        if not base_url:
+            raise ValueError("LocalBackend needs the server's base_url")
+        super().__init__(model=model, base_url=base_url, api_key=api_key or "local")
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic offline stand-in for load tests and profiling.
+
+    The answer depends only on the prompt's question. It arrives after
+    `latency` seconds, then one word every `token_delay` seconds when streamed.
+    """
+
+    def __init__(self, model: str = "fake", latency: float = 0.0, token_delay: float = 0.0):
+        self.model = model
+        self.latency = latency
+        self.token_delay = token_delay
+
+    def answer_for(self, prompt: str) -> str:
+        match = re.search(r"^Current Question: (.*)$", prompt, re.MULTILINE)
+        question = match.group(1).strip() if match else prompt[:80].strip()
+        return f"Offline answer to: {question}"
+
+    def _deltas(self, prompt: str, max_tokens: int):
+        words = self.answer_for(prompt).split(" ")[:max_tokens]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def complete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        time.sleep(self.latency + self.token_delay * len(self._deltas(prompt, max_tokens)))
+        return "".join(self._deltas(prompt, max_tokens))
+
+    def stream(self, prompt: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        time.sleep(self.latency)
+        for delta in self._deltas(prompt, max_tokens):
+            time.sleep(self.token_delay)
+            yield delta
+
+    async def acomplete(self, prompt: str, temperature: float, max_tokens: int) -> str:
+        await asyncio.sleep(self.latency + self.token_delay * len(self._deltas(prompt, max_tokens)))
+        return "".join(self._deltas(prompt, max_tokens))
+
+    async def astream(self, prompt: str, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for delta in self._deltas(prompt, max_tokens):
+            await asyncio.sleep(self.token_delay)
+            yield delta
+
+
+def create_backend(name: Optional[str] = None, model: Optional[str] = None,
+                   base_url: Optional[str] = None) -> LLMBackend:
+    """
+    Backend chosen by name, or by the LLM_BACKEND env var (default "openai").
+
+    LLM_MODEL sets the model and LLM_BASE_URL the server for "local" (and
+    optionally "openai"). The fake backend reads FAKE_LLM_LATENCY and
+    FAKE_LLM_TOKEN_DELAY (seconds).
+    """
+    name = (name or os.getenv("LLM_BACKEND", "openai")).lower()
+    base_url = base_url or os.getenv("LLM_BASE_URL") or None
+
+    if name == "openai":
+        backend = OpenAIBackend(model or os.getenv("LLM_MODEL", "gpt-4o"), base_url)
+    elif name == "local":
+        backend = LocalBackend(model or os.getenv("LLM_MODEL", "local-model"), base_url, os.getenv("LLM_API_KEY"))
+    elif name == "fake":
+        backend = FakeBackend(
+            model or os.getenv("LLM_MODEL", "fake"),
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0")),
+            token_delay=float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0"))
+        )
+    else:
+        raise ValueError(f"Unknown LLM backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+    logger.info(f"LLM backend: {name}, model {backend.model}")
+    return backend
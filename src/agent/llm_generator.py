@@ -1,44 +1,141 @@
 import os
-from openai import OpenAI
-from typing import List, Dict, Any
+import re
+import math
+import asyncio
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 import tiktoken
 from loguru import logger
 
+from tools.cache import TTLCache
+from agent.llm_backends import LLMBackend, create_backend
+
+PROMPT_INSTRUCTIONS = """Provide a helpful answer to the current question based on the information above. 
+Consider the conversation history and any feedback on previous responses to improve your answer.
+If the user previously disliked a response, try to avoid similar issues in your current answer.
+Focus on being accurate, concise, and helpful:"""
+
+HISTORY_HEADER = "Previous conversation:\n"
+TRUNCATION_NOTE = "\n\n[Content truncated due to length...]"
+
+# Where truncated content may end: after sentence punctuation or at a line break
+SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+# Passage boundaries for passage selection: paragraph breaks, or sentence ends once a passage is long enough
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+PASSAGE_CHARS = 800
+# How far back from the cut to look for a sentence end
+SNAP_WINDOW = 2000
+# Characters per token assumed for the first slice encoded when checking the limit (doubled if short)
+PREFIX_CHARS_PER_TOKEN = 5
+WORD = re.compile(r"\w+")
+
+
+def split_passages(content: str) -> List[str]:
+    """Paragraphs of content, with long paragraphs split at sentence ends."""
+    passages = []
+    for paragraph in PARAGRAPH_BREAK.split(content):
+        start = 0
+        for sentence in SENTENCE_BREAK.finditer(paragraph):
+            if sentence.start() - start >= PASSAGE_CHARS:
+                passages.append(paragraph[start:sentence.start()].strip())
+                start = sentence.end()
+        passages.append(paragraph[start:].strip())
+    return [passage for passage in passages if passage]
+
+
+def byte_level_tokenizer() -> tiktoken.Encoding:
+    """
+    Offline stand-in for the gpt-4o encoding: one token per UTF-8 byte.
+
+    Counts are never lower than real BPE counts, so prompts budgeted with it
+    still fit the context window.
+    """
+    import tiktoken_ext.openai_public
+    return tiktoken.Encoding(
+        name="byte_level",
+        pat_str=tiktoken_ext.openai_public.r50k_pat_str,
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={}
+    )
+
+
 class LLMGenerator:
-    """Generate final answers using OpenAI."""
+    """Generate final answers with an LLM backend (OpenAI by default)."""
     
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, truncation: str = "passages",
+                 backend: Optional[LLMBackend] = None, temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None, context_window: Optional[int] = None):
+        """
+        backend: defaults to create_backend(), i.e. the LLM_BACKEND env var
+        ("openai", "local" or "fake"); base_url is passed on to it.
+        temperature, max_tokens (answer length) and context_window default to
+        LLM_TEMPERATURE, LLM_MAX_TOKENS and LLM_CONTEXT_TOKENS, then to GPT-4o's values.
+        """
         try:
-            self.client = OpenAI(
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-            logger.info("OpenAI client initialized successfully")
+            self.backend = backend or create_backend(base_url=base_url)
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
+            logger.error(f"Failed to initialize LLM backend: {str(e)}")
             raise
         
         try:
             self.tokenizer = tiktoken.encoding_for_model("gpt-4o")
             logger.debug("Tokenizer initialized for GPT-4o")
         except Exception as e:
-            logger.error(f"Failed to initialize tokenizer: {str(e)}")
-            raise
+            # e.g. offline with the fake or a local backend: budget in bytes instead
+            logger.warning(f"GPT-4o tokenizer unavailable ({str(e)}), counting bytes instead")
+            self.tokenizer = byte_level_tokenizer()
+        
+        self.temperature = temperature if temperature is not None else float(os.getenv("LLM_TEMPERATURE", "0.3"))
         
         #leaving buffer for response
-        self.max_context_tokens = 128000  # GPT-4o context window
-        self.max_response_tokens = 4000    # Increased for better responses
+        self.max_context_tokens = context_window or int(os.getenv("LLM_CONTEXT_TOKENS", "128000"))  # GPT-4o context window
+        self.max_response_tokens = max_tokens or int(os.getenv("LLM_MAX_TOKENS", "4000"))    # Increased for better responses
         self.available_tokens = self.max_context_tokens - self.max_response_tokens
         
         # Hardcoded approximately 150 tokens for base prompt template
         self.base_prompt_tokens = 150  
         
+        # How over-long content is cut: "passages" keeps the passages most relevant
+        # to the question, "beginning" keeps the start
+        if truncation not in ("passages", "beginning"):
+            raise ValueError(f"Unknown truncation strategy: {truncation}")
+        self.truncation = truncation
+        
+        # Token counts by content hash: history, answers and retrieved content recur across turns
+        self.token_cache = TTLCache("token_counts", max_size=4096, ttl=24 * 3600)
+        
+        # Fixed parts of the prompt, counted once
+        self.template_tokens = self.count_tokens(f"\nInformation: \n\n{PROMPT_INSTRUCTIONS}")
+        
         logger.info(f"Token limits set - Context: {self.max_context_tokens}, Response: {self.max_response_tokens}, Available: {self.available_tokens}")
     
     def count_tokens(self, text: str) -> int:
-        """Count tokens in text using tiktoken."""
+        """Count tokens in text using tiktoken, cached by content hash."""
         if not text:
             return 0
-        return len(self.tokenizer.encode(text))
+        key = self._token_cache_key(text)
+        count = self.token_cache.get(key)
+        if count is None:
+            count = len(self.tokenizer.encode(text))
+            self.token_cache.set(key, count)
+        return count
+    
+    @staticmethod
+    def _token_cache_key(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def message_tokens(self, role: str, content: str, token_count: Optional[int] = None, feedback_note: str = "") -> int:
+        """
+        Tokens of a formatted history line ("{role}: {content}{feedback_note}\\n").
+        
+        With the content's stored token_count only the short wrapper is counted;
+        the sum can differ from encoding the whole line by a token at the joins.
+        """
+        if token_count is None:
+            return self.count_tokens(f"{role}: {content}{feedback_note}\n")
+        return token_count + self.count_tokens(f"{role}: {feedback_note}\n")
     
     def truncate_history(self, history: List[Dict[str, Any]], max_tokens: int) -> tuple[str, int]:
         """
@@ -68,7 +165,7 @@ class LLMGenerator:
                 feedback_note = f" [{feedback}]"
             
             message_text = f"{role}: {content_text}{feedback_note}\n"
-            message_tokens = self.count_tokens(message_text)
+            message_tokens = self.message_tokens(role, content_text, msg.get('token_count'), feedback_note)
             
             # Check if adding this message would exceed limit
             if total_tokens + message_tokens > max_tokens:
@@ -80,9 +177,9 @@ class LLMGenerator:
         
         if formatted_messages:
             # Reverse back to chronological order
-            history_text = "Previous conversation:\n" + "".join(reversed(formatted_messages)) + "\n"
+            history_text = HISTORY_HEADER + "".join(reversed(formatted_messages)) + "\n"
             # Add the header tokens
-            header_tokens = self.count_tokens("Previous conversation:\n\n")
+            header_tokens = self.count_tokens(HISTORY_HEADER + "\n")
             final_tokens = total_tokens + header_tokens
             logger.debug(f"History formatted: {len(formatted_messages)} messages, {final_tokens} tokens")
             return history_text, final_tokens
@@ -90,59 +187,121 @@ class LLMGenerator:
         logger.debug("No history messages fit within token limit")
         return "", 0
     
-    def truncate_content(self, content: str, max_tokens: int) -> str:
+    def truncate_content(self, content: str, max_tokens: int, query: Optional[str] = None) -> str:
         """
-        Truncate content to fit within token limit, prioritizing the beginning.
-        For web search results, keep the most relevant parts.
+        Truncate content to fit within token limit.
+        
+        Without a query the beginning is kept, cut at the last sentence end that
+        fits. With a query the passages that best match it are kept (in their
+        original order), so the relevant parts of long web pages survive.
         """
+        return self._truncate_content(content, max_tokens, query)[0]
+    
+    def _truncate_content(self, content: str, max_tokens: int, query: Optional[str] = None) -> Tuple[str, int]:
+        """truncate_content that also returns the token count of the result."""
         if not content:
-            return content
-            
-        content_tokens = self.count_tokens(content)
+            return content, 0
         
-        if content_tokens <= max_tokens:
+        key = self._token_cache_key(content)
+        content_tokens = self.token_cache.peek(key)
+        if content_tokens is not None and content_tokens <= max_tokens:
             logger.debug(f"Content fits within limit: {content_tokens}/{max_tokens} tokens")
-            return content
+            return content, content_tokens
         
-        logger.warning(f"Content too long ({content_tokens} tokens), truncating to {max_tokens}")
+        # Nothing fits (and the prefix below could never grow past zero characters)
+        if max_tokens <= 0:
+            logger.warning("No token budget for content, truncating all of it")
+            return TRUNCATION_NOTE, self.count_tokens(TRUNCATION_NOTE)
         
-        # If content is too long, truncate it
-        sentences = content.split('. ')
+        # Encode only as much of the start as it takes to exceed the limit: that proves the
+        # text does not fit and gives the tokens to cut at, without tokenizing the rest
+        end = min(len(content), PREFIX_CHARS_PER_TOKEN * max_tokens)
+        while True:
+            tokens = self.tokenizer.encode(content[:end])
+            if len(tokens) > max_tokens:
+                break
+            if end == len(content):
+                self.token_cache.set(key, len(tokens))
+                logger.debug(f"Content fits within limit: {len(tokens)}/{max_tokens} tokens")
+                return content, len(tokens)
+            end = min(len(content), 2 * end)
         
-        truncated_content = ""
-        current_tokens = 0
-        sentences_kept = 0
+        logger.warning(f"Content too long (over {max_tokens} tokens in its first {end} characters), truncating")
         
-        for sentence in sentences:
-            sentence_with_period = sentence + ". " if not sentence.endswith('.') else sentence + " "
-            sentence_tokens = self.count_tokens(sentence_with_period)
-            
-            if current_tokens + sentence_tokens > max_tokens:
-                # Add truncation indicator
-                truncated_content += "\n\n[Content truncated due to length...]"
-                break
-                
-            truncated_content += sentence_with_period
-            current_tokens += sentence_tokens
-            sentences_kept += 1
+        budget = max_tokens - self.count_tokens(TRUNCATION_NOTE)
+        if budget <= 0:
+            return "", 0
         
-        logger.debug(f"Content truncated: kept {sentences_kept}/{len(sentences)} sentences, {current_tokens} tokens")
-        return truncated_content.strip()
+        if query:
+            kept, kept_tokens = self._best_passages(content, len(tokens) / end, budget, query)
+        else:
+            kept, kept_tokens = self._leading_sentences(tokens, budget)
+        
+        logger.debug(f"Content truncated: kept {len(kept)}/{len(content)} characters, {kept_tokens} tokens")
+        return kept + TRUNCATION_NOTE, kept_tokens + self.count_tokens(TRUNCATION_NOTE)
     
-    def generate_answer(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> str:
-        """
-        Generate final answer with smart token management.
+    def _leading_sentences(self, tokens: List[int], budget: int) -> Tuple[str, int]:
+        """The start of the text within budget tokens, snapped back to the last sentence end."""
+        prefix = self.tokenizer.decode_bytes(tokens[:budget]).decode("utf-8", errors="ignore")
         
-        Args:
-            query: The current user query
-            content: The information to use for answering (from RAG or web search)
-            history: Previous messages in the conversation with optional feedback
-            
-        Returns:
-            Generated answer
-        """
-        logger.info(f"Generating answer for query: {query[:100]}...")
+        # Only the tail is searched; with no sentence end there the cut stays on a token boundary
+        last_end = None
+        for last_end in SENTENCE_END.finditer(prefix, max(0, len(prefix) - SNAP_WINDOW)):
+            pass
+        kept = (prefix[:last_end.end()] if last_end else prefix).rstrip()
+        
+        # Drop the tokens after the cut, walking back from the budget
+        kept_tokens, surplus = budget, len(prefix.encode("utf-8")) - len(kept.encode("utf-8"))
+        while surplus > 0:
+            kept_tokens -= 1
+            surplus -= len(self.tokenizer.decode_single_token_bytes(tokens[kept_tokens]))
+        return kept, kept_tokens
+    
+    def _best_passages(self, content: str, tokens_per_char: float, budget: int, query: str) -> Tuple[str, int]:
+        """The passages that best match the query within budget tokens, in document order."""
+        passages = split_passages(content)
+        scores = self._passage_scores(passages, query)
+        
+        # Sizes are estimated from the text's tokens per character; the result is then counted exactly
+        chosen, used = [], 0
+        for i in sorted(range(len(passages)), key=lambda i: (-scores[i], i)):
+            size = math.ceil(len(passages[i]) * tokens_per_char) + 1
+            if used + size <= budget:
+                chosen.append(i)
+                used += size
+        
+        while True:
+            kept = "\n\n".join(passages[i] for i in sorted(chosen))
+            kept_tokens = self.count_tokens(kept)
+            if kept_tokens <= budget or not chosen:
+                break
+            # Estimate was short: drop the lowest scoring passage
+            chosen.pop()
         
+        logger.debug(f"Kept {len(chosen)}/{len(passages)} passages by relevance to the question")
+        return kept, kept_tokens
+    
+    def _passage_scores(self, passages: List[str], query: str) -> List[float]:
+        """BM25 score of each passage for the query's words."""
+        terms = set(WORD.findall(query.lower()))
+        counts = [Counter(WORD.findall(passage.lower())) for passage in passages]
+        lengths = [sum(c.values()) for c in counts]
+        average_length = (sum(lengths) / len(lengths)) or 1
+        document_frequency = {term: sum(1 for c in counts if term in c) for term in terms}
+        
+        scores = []
+        for c, length in zip(counts, lengths):
+            score = 0.0
+            for term in terms:
+                frequency = c.get(term, 0)
+                if frequency:
+                    idf = math.log(1 + (len(counts) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                    score += idf * frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * length / average_length))
+            scores.append(score)
+        return scores
+    
+    def build_prompt(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> str:
+        """Assemble the prompt, truncating history and content to the token budget."""
         #query tokens
         query_tokens = self.count_tokens(f"Current Question: {query}\n")
         
@@ -162,34 +321,100 @@ class LLMGenerator:
         final_content_tokens = remaining_tokens - actual_history_tokens
         
         #truncate content if necessary
-        truncated_content = self.truncate_content(content, final_content_tokens)
+        truncated_content, content_tokens_used = self._truncate_content(
+            content, final_content_tokens, query if self.truncation == "passages" else None
+        )
         
         prompt = f"""{history_text}Current Question: {query}
 
 Information: {truncated_content}
 
-Provide a helpful answer to the current question based on the information above. 
-Consider the conversation history and any feedback on previous responses to improve your answer.
-If the user previously disliked a response, try to avoid similar issues in your current answer.
-Focus on being accurate, concise, and helpful:"""
+{PROMPT_INSTRUCTIONS}"""
         
-        final_tokens = self.count_tokens(prompt)
-        content_tokens_used = self.count_tokens(truncated_content)
+        # Sum of the parts already counted; the prompt itself is not re-encoded
+        final_tokens = actual_history_tokens + query_tokens + content_tokens_used + self.template_tokens
         logger.info(f"Final prompt - Total tokens: {final_tokens}, History: {actual_history_tokens}, Content: {content_tokens_used}")
+        return prompt
+    
+    def generate_answer(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> str:
+        """
+        Generate final answer with smart token management.
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=self.max_response_tokens
-            )
+        Args:
+            query: The current user query
+            content: The information to use for answering (from RAG or web search)
+            history: Previous messages in the conversation with optional feedback
             
-            answer = response.choices[0].message.content.strip()
+        Returns:
+            Generated answer
+        """
+        logger.info(f"Generating answer for query: {query[:100]}...")
+        
+        prompt = self.build_prompt(query, content, history)
+        
+        try:
+            answer = self.backend.complete(prompt, self.temperature, self.max_response_tokens)
             answer_tokens = self.count_tokens(answer)
             logger.info(f"Answer generated successfully, {answer_tokens} tokens")
             return answer
             
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
-            return f"Error generating answer: {str(e)}"
\ No newline at end of file
+            return f"Error generating answer: {str(e)}"
+    
+    def stream_answer(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Generate the final answer as a stream of text deltas.
+        
+        Same prompt and token management as generate_answer, but yields each
+        piece of the answer as soon as the model produces it.
+        """
+        logger.info(f"Streaming answer for query: {query[:100]}...")
+        
+        prompt = self.build_prompt(query, content, history)
+        
+        try:
+            for delta in self.backend.stream(prompt, self.temperature, self.max_response_tokens):
+                yield delta
+            
+            logger.info("Answer stream completed")
+            
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield f"Error generating answer: {str(e)}"
+    
+    async def agenerate_answer(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> str:
+        """
+        Async version of generate_answer.
+        
+        Prompt assembly (tokenizing) runs in a worker thread so it does not
+        block other conversations on the event loop.
+        """
+        logger.info(f"Generating answer for query: {query[:100]}...")
+        
+        prompt = await asyncio.to_thread(self.build_prompt, query, content, history)
+        
+        try:
+            answer = await self.backend.acomplete(prompt, self.temperature, self.max_response_tokens)
+            logger.info("Answer generated successfully")
+            return answer
+            
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            return f"Error generating answer: {str(e)}"
+    
+    async def astream_answer(self, query: str, content: str, history: List[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Async version of stream_answer."""
+        logger.info(f"Streaming answer for query: {query[:100]}...")
+        
+        prompt = await asyncio.to_thread(self.build_prompt, query, content, history)
+        
+        try:
+            async for delta in self.backend.astream(prompt, self.temperature, self.max_response_tokens):
+                yield delta
+            
+            logger.info("Answer stream completed")
+            
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield f"Error generating answer: {str(e)}"
\ No newline at end of file
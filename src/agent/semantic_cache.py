@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+
+class SemanticAnswerCache:
+    """
+    Cache of previous answers looked up by question similarity.
+
+    Questions are compared by cosine similarity of their embeddings in one
+    vectorized pass. Entries expire after ttl seconds, the least recently used
+    entry is evicted past max_size, and everything is dropped when the
+    knowledge base reports a new index version. Reading the version opens the
+    collection, so it is re-read at most every version_ttl seconds.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_size: int = 256, ttl: float = 24 * 3600,
+                 index_version: Optional[Callable[[], Any]] = None, version_ttl: float = 30.0):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.index_version = index_version or (lambda: None)
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._current_version = None
+        self._version_checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def lookup(self, question_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached response of the most similar fresh question above threshold."""
+        query = self._normalize(question_embedding)
+        if query is None:
+            return None
+
+        self._check_index_version()
+
+        with self._lock:
+            self._drop_expired()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[i]["embedding"] for i in self._matrix_ids])
+
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id]
+            logger.info(f"Semantic cache hit ({similarities[best]:.3f}) for cached question: {entry['question'][:100]}")
+            return dict(entry["response"])
+
+    def store(self, question: str, question_embedding: List[float], response: Dict[str, Any]) -> None:
+        """Add an answered question to the cache."""
+        embedding = self._normalize(question_embedding)
+        if embedding is None:
+            return
+
+        self._check_index_version()
+
+        with self._lock:
+            self._entries[self._next_id] = {
+                "question": question,
+                "embedding": embedding,
+                "response": dict(response),
+                "expires_at": time.time() + self.ttl
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _check_index_version(self) -> None:
+        """Invalidate all entries when the knowledge base has been re-indexed."""
+        now = time.monotonic()
+        with self._lock:
+            if self._version_checked_at is not None and now - self._version_checked_at < self.version_ttl:
+                return
+            # Claimed before reading, so concurrent callers do not all hit the database
+            self._version_checked_at = now
+
+        try:
+            version = self.index_version()
+        except Exception as e:
+            logger.error(f"Could not read knowledge base index version: {str(e)}")
+            return
+
+        with self._lock:
+            if version != self._current_version:
+                if self._entries:
+                    logger.info("Knowledge base re-indexed, clearing semantic answer cache")
+                self._entries.clear()
+                self._matrix = None
+                self._current_version = version
+
+    def _drop_expired(self) -> None:
+        now = time.time()
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry["expires_at"] <= now]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
@@ -0,0 +1,101 @@
+import sys
+import os
+import asyncio
+import contextvars
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.chat_manager import ChatManager
+from agent.async_agent import AsyncLangGraphAgent
+from loguru import logger
+
+# Thoughts and streaming callback of the turn running in the current task
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("current_turn", default=None)
+
+
+class AsyncChatManager(ChatManager):
+    """
+    ChatManager for asyncio servers handling many conversations at once.
+
+    The agent is awaited and SQLite calls run in worker threads. Thoughts and
+    the streaming callback belong to the turn (a context variable) rather than
+    the manager, so concurrent chats never see each other's stream.
+    """
+    agent_class = AsyncLangGraphAgent
+
+    def _capture_thought(self, thought: str):
+        """Capture agent's thoughts and stream them to the current turn's callback."""
+        logger.debug(f"Agent thought: {thought}")
+        turn = _current_turn.get()
+        if turn is None:
+            return
+        turn["thoughts"].append(thought)
+        self._emit(turn, "thought", thought)
+
+    def _capture_token(self, token: str):
+        """Stream answer text deltas to the current turn's callback."""
+        turn = _current_turn.get()
+        if turn is not None:
+            self._emit(turn, "token", token)
+
+    def _emit(self, turn, event: str, content: str):
+        if turn["callback"]:
+            try:
+                turn["callback"](event, content)
+            except Exception as e:
+                logger.error(f"Error in streaming callback: {str(e)}")
+
+    async def login_user(self, email: str) -> int:
+        return await asyncio.to_thread(super().login_user, email)
+
+    async def get_conversation(self, conversation_id: int):
+        return await asyncio.to_thread(super().get_conversation, conversation_id)
+
+    async def get_user_conversations(self, user_id: int, limit: int = None, before=None):
+        return await asyncio.to_thread(super().get_user_conversations, user_id, limit, before)
+
+    async def get_conversation_messages(self, conversation_id: int, limit: int = None, before=None):
+        return await asyncio.to_thread(super().get_conversation_messages, conversation_id, limit, before)
+
+    async def get_message_sources(self, message_id: int):
+        return await asyncio.to_thread(super().get_message_sources, message_id)
+
+    async def get_sources_for_messages(self, message_ids: list):
+        return await asyncio.to_thread(super().get_sources_for_messages, message_ids)
+
+    async def add_message_feedback(self, message_id: int, feedback: str):
+        return await asyncio.to_thread(super().add_message_feedback, message_id, feedback)
+
+    async def delete_conversation(self, conversation_id: int):
+        return await asyncio.to_thread(super().delete_conversation, conversation_id)
+
+    async def chat(self, user_id: int, message: str, conversation_id: int = None, streaming_callback=None):
+        """Handle a chat message with history context."""
+        logger.info(f"Starting chat for user {user_id}: {message[:100]}...")
+
+        turn = {"thoughts": [], "callback": streaming_callback}
+        token = _current_turn.set(turn)
+
+        try:
+            conversation_id, history = await asyncio.to_thread(self._start_turn, user_id, message, conversation_id)
+
+            logger.debug("Awaiting agent.answer()...")
+            response = await self.agent.answer(message, history)
+            logger.info(f"Agent responded using {response['method']} method with {len(turn['thoughts'])} thoughts")
+
+            message_id = await asyncio.to_thread(self._save_response, conversation_id, message, response)
+
+            self._emit(turn, "answer", response['answer'])
+
+            logger.info(f"Chat completed successfully for conversation {conversation_id}")
+            return {
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'response': response,
+                'thoughts': turn["thoughts"].copy()
+            }
+
+        except Exception as e:
+            logger.error(f"Error in chat processing: {str(e)}")
+            raise
+        finally:
+            _current_turn.reset(token)
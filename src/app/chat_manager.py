@@ -3,10 +3,19 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from app.database import SQLiteChatDB
+from app.history_cache import HistoryCache
 from agent.agent import LangGraphAgent
 from loguru import logger
 
 class ChatManager:
+    agent_class = LangGraphAgent
+    # Messages of history handed to the agent (LLMGenerator.truncate_history keeps the last 10)
+    history_window = 10
+    history_cache_size = 256
+    # Shared by every ChatManager of the process (the UI creates one per session), so
+    # turns saved from one session are in the history the others send to the agent
+    history_cache = HistoryCache(history_cache_size, history_window)
+    
     def __init__(self):
         try:
             self.db = SQLiteChatDB()
@@ -19,10 +28,14 @@ class ChatManager:
         self.streaming_callback = None
         
         try:
-            self.agent = LangGraphAgent(on_thought=self._capture_thought)
-            logger.info("ChatManager initialized with LangGraphAgent")
+            self.agent = self.agent_class(
+                on_thought=self._capture_thought,
+                on_token=self._capture_token,
+                semantic_cache=os.getenv("SEMANTIC_CACHE", "false").lower() == "true"
+            )
+            logger.info(f"ChatManager initialized with {self.agent_class.__name__}")
         except Exception as e:
-            logger.error(f"Failed to initialize LangGraphAgent: {str(e)}")
+            logger.error(f"Failed to initialize {self.agent_class.__name__}: {str(e)}")
             raise
     
     def _capture_thought(self, thought: str):
@@ -37,6 +50,14 @@ class ChatManager:
             except Exception as e:
                 logger.error(f"Error in streaming callback: {str(e)}")
     
+    def _capture_token(self, token: str):
+        """Stream answer text deltas to the callback as they are generated."""
+        if self.streaming_callback:
+            try:
+                self.streaming_callback("token", token)
+            except Exception as e:
+                logger.error(f"Error in streaming callback: {str(e)}")
+    
     def login_user(self, email: str) -> int:
         """Simple login - just get/create user."""
         try:
@@ -47,20 +68,28 @@ class ChatManager:
             logger.error(f"Failed to login user {email}: {str(e)}")
             raise
     
-    def get_user_conversations(self, user_id: int):
-        """Get all conversations for user."""
+    def get_conversation(self, conversation_id: int):
+        """Get a single conversation."""
         try:
-            conversations = self.db.get_user_conversations(user_id)
+            return self.db.get_conversation(conversation_id)
+        except Exception as e:
+            logger.error(f"Failed to get conversation {conversation_id}: {str(e)}")
+            return None
+    
+    def get_user_conversations(self, user_id: int, limit: int = None, before=None):
+        """Get conversations for user, newest first; limit/before page through them (see SQLiteChatDB)."""
+        try:
+            conversations = self.db.get_user_conversations(user_id, limit, before)
             logger.debug(f"Retrieved {len(conversations)} conversations for user {user_id}")
             return conversations
         except Exception as e:
             logger.error(f"Failed to get conversations for user {user_id}: {str(e)}")
             return []
     
-    def get_conversation_messages(self, conversation_id: int):
-        """Get messages in conversation."""
+    def get_conversation_messages(self, conversation_id: int, limit: int = None, before=None):
+        """Get messages in conversation; limit/before load the latest page or older ones (see SQLiteChatDB)."""
         try:
-            messages = self.db.get_conversation_messages(conversation_id)
+            messages = self.db.get_conversation_messages(conversation_id, limit, before)
             logger.debug(f"Retrieved {len(messages)} messages for conversation {conversation_id}")
             return messages
         except Exception as e:
@@ -77,10 +106,21 @@ class ChatManager:
             logger.error(f"Failed to get sources for message {message_id}: {str(e)}")
             return []
     
+    def get_sources_for_messages(self, message_ids: list):
+        """Get sources for several messages at once, as {message_id: sources}."""
+        try:
+            sources = self.db.get_sources_for_messages(message_ids)
+            logger.debug(f"Retrieved sources for {len(sources)} messages")
+            return sources
+        except Exception as e:
+            logger.error(f"Failed to get sources for messages {message_ids}: {str(e)}")
+            return {}
+    
     def add_message_feedback(self, message_id: int, feedback: str):
         """Add user feedback (like/dislike) to a message."""
         try:
             self.db.update_message_feedback(message_id, feedback)
+            self.history_cache.update_feedback(message_id, feedback)
             logger.info(f"Saved {feedback} feedback for message ID {message_id}")
             return True
         except Exception as e:
@@ -99,74 +139,16 @@ class ChatManager:
         logger.debug("Cleared thoughts array for new chat")
         
         try:
-            # Create new conversation if needed
-            if not conversation_id:
-                title = self._generate_smart_title(message)
-                conversation_id = self.db.create_conversation(user_id, title)
-                logger.info(f"Created new conversation {conversation_id} with title: {title}")
-            
-            # Save user message
-            self.db.add_message(conversation_id, 'user', message)
-            logger.debug("Saved user message to database")
-            
-            # Get conversation history
-            history = []
-            if conversation_id:
-                messages = self.db.get_conversation_messages(conversation_id)
-                # Exclude the message we just added
-                history = messages[:-1] if messages else []
-                logger.debug(f"Retrieved {len(history)} previous messages for context")
+            conversation_id, history = self._start_turn(user_id, message, conversation_id)
             
             # Get agent response
             logger.debug("Calling agent.answer()...")
             response = self.agent.answer(message, history)
             logger.info(f"Agent responded using {response['method']} method with {len(self.current_thoughts)} thoughts")
             
-            # Save assistant response
-            message_id = self.db.add_message(
-                conversation_id, 
-                'assistant', 
-                response['answer'],
-                response['method'],
-                response.get('rag_score'),
-                response.get('web_score')
-            )
-            logger.debug(f"Saved assistant message with ID {message_id}")
-            
-            # Save sources
-            sources_saved = 0
-            if response['method'] == 'rag' and response.get('rag_chunks'):
-                for chunk in response.get('rag_chunks', []):
-                    self.db.add_message_source(
-                        message_id=message_id,
-                        source_type='rag',
-                        source=chunk.get('source', 'Knowledge Base'),
-                        title=chunk.get('title', 'Document Chunk'),
-                        text=chunk.get('text', ''),
-                        score=chunk.get('score', 0.0),
-                        metadata=chunk.get('metadata', {})
-                    )
-                    sources_saved += 1
-                logger.debug(f"Saved {sources_saved} RAG sources")
-            
-            elif response['method'] == 'web' and response.get('web_results'):
-                for result in response.get('web_results', []):
-                    self.db.add_message_source(
-                        message_id=message_id,
-                        source_type='web',
-                        source=result.get('url', ''),
-                        title=result.get('title', ''),
-                        text=result.get('content', ''),
-                        score=result.get('score', 0.0),
-                        metadata={
-                            'date': result.get('date', ''),
-                            'source': result.get('source', '')
-                        }
-                    )
-                    sources_saved += 1
-                logger.debug(f"Saved {sources_saved} web sources")
+            message_id = self._save_response(conversation_id, message, response)
             
-            # Stream the answer
+            # Final answer (after the token stream, or the whole answer for cache hits and fallbacks)
             if self.streaming_callback:
                 try:
                     self.streaming_callback("answer", response['answer'])
@@ -193,10 +175,92 @@ class ChatManager:
             self.streaming_callback = None
             raise
     
+    def _start_turn(self, user_id: int, message: str, conversation_id: int = None):
+        """Create the conversation if needed and return (conversation_id, history)."""
+        # Create new conversation if needed
+        if not conversation_id:
+            title = self._generate_smart_title(message)
+            conversation_id = self.db.create_conversation(user_id, title)
+            self.history_cache.set(conversation_id, [])
+            logger.info(f"Created new conversation {conversation_id} with title: {title}")
+            return conversation_id, []
+        
+        # The user message is saved with the answer, so history is the latest messages stored so far
+        history = self.history_cache.get(conversation_id)
+        if history is None:
+            history = self.db.get_conversation_messages(conversation_id, limit=self.history_cache.window)
+            self.history_cache.set(conversation_id, history)
+            logger.debug(f"Loaded {len(history)} previous messages for context from the database")
+        else:
+            logger.debug(f"Using {len(history)} cached previous messages for context")
+        
+        return conversation_id, history
+    
+    def _save_response(self, conversation_id: int, message: str, response) -> int:
+        """Save the user message, assistant message and its sources in one transaction; returns the message id."""
+        sources = self._response_sources(response)
+        # Stored with the messages so later prompts budget history without re-tokenizing it
+        user_tokens = self.agent.llm.count_tokens(message)
+        answer_tokens = self.agent.llm.count_tokens(response['answer'])
+        message_id = self.db.persist_turn(
+            conversation_id,
+            message,
+            response['answer'],
+            response['method'],
+            response.get('rag_score'),
+            response.get('web_score'),
+            sources,
+            user_tokens=user_tokens,
+            answer_tokens=answer_tokens
+        )
+        logger.debug(f"Saved turn with assistant message ID {message_id} and {len(sources)} {response['method']} sources")
+        
+        self.history_cache.extend(conversation_id, [
+            {'id': None, 'role': 'user', 'content': message, 'feedback': None, 'token_count': user_tokens},
+            {'id': message_id, 'role': 'assistant', 'content': response['answer'], 'method_used': response['method'],
+             'rag_score': response.get('rag_score'), 'web_score': response.get('web_score'), 'feedback': None,
+             'token_count': answer_tokens}
+        ])
+        return message_id
+    
+    def _response_sources(self, response) -> list:
+        """Sources to store with the answer: RAG chunks or web results, depending on the method used."""
+        if response['method'] == 'rag':
+            return [
+                {
+                    'type': 'rag',
+                    'source': chunk.get('source', 'Knowledge Base'),
+                    'title': chunk.get('title', 'Document Chunk'),
+                    'text': chunk.get('text', ''),
+                    'score': chunk.get('score', 0.0),
+                    'metadata': chunk.get('metadata', {})
+                }
+                for chunk in response.get('rag_chunks') or []
+            ]
+        
+        if response['method'] == 'web':
+            return [
+                {
+                    'type': 'web',
+                    'source': result.get('url', ''),
+                    'title': result.get('title', ''),
+                    'text': result.get('content', ''),
+                    'score': result.get('score', 0.0),
+                    'metadata': {
+                        'date': result.get('date', ''),
+                        'source': result.get('source', '')
+                    }
+                }
+                for result in response.get('web_results') or []
+            ]
+        
+        return []
+    
     def delete_conversation(self, conversation_id: int):
         """Delete a conversation."""
         try:
             self.db.delete_conversation(conversation_id)
+            self.history_cache.discard(conversation_id)
             logger.info(f"Deleted conversation {conversation_id}")
         except Exception as e:
             logger.error(f"Failed to delete conversation {conversation_id}: {str(e)}")
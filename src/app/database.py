@@ -1,69 +1,255 @@
 
 import sqlite3
-from typing import Dict, List
+import queue
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
+from loguru import logger
+
+# Applied to every pooled connection. WAL lets readers run alongside the writer,
+# and synchronous=NORMAL is durable under WAL except for the last commits on power loss.
+CONNECTION_PRAGMAS = (
+    # Only takes effect on a new file (it must precede WAL) or after a full VACUUM
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -16000",      # 16 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Schema history. Each entry upgrades the database by one version and
+# PRAGMA user_version records the last one applied, so existing files are
+# upgraded in place. Append new migrations; never edit applied ones.
+MIGRATIONS = [
+    # 1: original tables (a no-op on databases created before versioning)
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            title TEXT DEFAULT 'New Chat',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            conversation_id INTEGER,
+            role TEXT CHECK (role IN ('user', 'assistant')),
+            content TEXT,
+            method_used TEXT,
+            rag_score REAL,
+            web_score REAL,
+            feedback TEXT CHECK (feedback IN ('like', 'dislike', NULL)),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS message_sources (
+            id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            type TEXT CHECK (type IN ('rag', 'web')),
+            source TEXT,
+            title TEXT,
+            text TEXT,
+            score REAL,
+            metadata TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (message_id) REFERENCES messages (id)
+        )
+        ''',
+    ),
+    # 2: ON DELETE CASCADE foreign keys (SQLite needs a table rebuild for that;
+    # rows already orphaned by the old schema are not copied) and indexes for
+    # the conversation list, history and sources lookups
+    (
+        '''
+        CREATE TABLE conversations_v2 (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER REFERENCES users (id) ON DELETE CASCADE,
+            title TEXT DEFAULT 'New Chat',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        INSERT INTO conversations_v2 (id, user_id, title, created_at, updated_at)
+        SELECT id, user_id, title, created_at, updated_at FROM conversations
+        WHERE user_id IN (SELECT id FROM users)
+        ''',
+        "DROP TABLE conversations",
+        "ALTER TABLE conversations_v2 RENAME TO conversations",
+        '''
+        CREATE TABLE messages_v2 (
+            id INTEGER PRIMARY KEY,
+            conversation_id INTEGER REFERENCES conversations (id) ON DELETE CASCADE,
+            role TEXT CHECK (role IN ('user', 'assistant')),
+            content TEXT,
+            method_used TEXT,
+            rag_score REAL,
+            web_score REAL,
+            feedback TEXT CHECK (feedback IN ('like', 'dislike', NULL)),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        INSERT INTO messages_v2 (id, conversation_id, role, content, method_used, rag_score, web_score, feedback, created_at)
+        SELECT id, conversation_id, role, content, method_used, rag_score, web_score, feedback, created_at FROM messages
+        WHERE conversation_id IN (SELECT id FROM conversations)
+        ''',
+        "DROP TABLE messages",
+        "ALTER TABLE messages_v2 RENAME TO messages",
+        '''
+        CREATE TABLE message_sources_v2 (
+            id INTEGER PRIMARY KEY,
+            message_id INTEGER REFERENCES messages (id) ON DELETE CASCADE,
+            type TEXT CHECK (type IN ('rag', 'web')),
+            source TEXT,
+            title TEXT,
+            text TEXT,
+            score REAL,
+            metadata TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        INSERT INTO message_sources_v2 (id, message_id, type, source, title, text, score, metadata, created_at)
+        SELECT id, message_id, type, source, title, text, score, metadata, created_at FROM message_sources
+        WHERE message_id IN (SELECT id FROM messages)
+        ''',
+        "DROP TABLE message_sources",
+        "ALTER TABLE message_sources_v2 RENAME TO message_sources",
+        # Sidebar list: filter on user, newest first; title/created_at make it covering
+        "CREATE INDEX idx_conversations_user_updated ON conversations (user_id, updated_at DESC, created_at, title)",
+        # History (and the per-conversation message count): filter on conversation, oldest first
+        "CREATE INDEX idx_messages_conversation_created ON messages (conversation_id, created_at)",
+        # Sources of a message, best first
+        "CREATE INDEX idx_message_sources_message_score ON message_sources (message_id, score DESC)",
+    ),
+    # 3: age-based retention scans conversations by last update across all users
+    (
+        "CREATE INDEX idx_conversations_updated ON conversations (updated_at)",
+    ),
+    # 4: message_count kept on the conversation instead of counted per listing,
+    # and the sidebar index ordered for keyset pages by (updated_at, id)
+    (
+        "ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0",
+        '''
+        UPDATE conversations SET message_count =
+            (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id)
+        ''',
+        "DROP INDEX idx_conversations_user_updated",
+        '''
+        CREATE INDEX idx_conversations_user_recent
+        ON conversations (user_id, updated_at DESC, id DESC, title, created_at, message_count)
+        ''',
+    ),
+    # 5: token count of each message's content, so prompt budgeting does not
+    # re-tokenize history (NULL for messages saved before this version)
+    (
+        "ALTER TABLE messages ADD COLUMN token_count INTEGER",
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Message ids per IN (...) query, well below SQLite's bound parameter limit
+SOURCES_BATCH_SIZE = 500
+
+
+def apply_migrations(conn: sqlite3.Connection, target_version: int = SCHEMA_VERSION) -> int:
+    """
+    Upgrade the database on conn to target_version, one transaction per migration.
+    
+    Each step re-reads user_version under a write lock, so processes starting at
+    the same time do not apply a migration twice. Returns the resulting version.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    # Table rebuilds must not trigger cascades; the pragma only changes outside a transaction
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version in range(1, target_version + 1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                    for statement in MIGRATIONS[version - 1]:
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {version}")
+                    logger.info(f"Chat database migrated to schema version {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return conn.execute("PRAGMA user_version").fetchone()[0]
 
 class SQLiteChatDB:
-    def __init__(self, db_path: str = "chat.db"):
+    def __init__(self, db_path: str = "chat.db", pool_size: int = 8, busy_timeout: float = 5.0):
+        """
+        pool_size: idle connections kept open for reuse; extra ones are opened on demand and closed after use.
+        busy_timeout: seconds a connection waits on a locked database before raising.
+        """
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
         self.init_db()
     
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a connection with the shared pragmas applied."""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection; the block is one transaction, committed on success."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_connection()
+        
+        try:
+            with conn:
+                yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def close(self):
+        """Close all idle pooled connections."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+    
     def init_db(self):
-        """Create tables if they don't exist."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    email TEXT UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY,
-                    user_id INTEGER,
-                    title TEXT DEFAULT 'New Chat',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY,
-                    conversation_id INTEGER,
-                    role TEXT CHECK (role IN ('user', 'assistant')),
-                    content TEXT,
-                    method_used TEXT,
-                    rag_score REAL,
-                    web_score REAL,
-                    feedback TEXT CHECK (feedback IN ('like', 'dislike', NULL)),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-                )
-            ''')
-            
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS message_sources (
-                    id INTEGER PRIMARY KEY,
-                    message_id INTEGER,
-                    type TEXT CHECK (type IN ('rag', 'web')),
-                    source TEXT,
-                    title TEXT,
-                    text TEXT,
-                    score REAL,
-                    metadata TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (message_id) REFERENCES messages (id)
-                )
-            ''')
-            conn.commit()
+        """Create the schema or upgrade an existing database to the latest version."""
+        with self._connection() as conn:
+            apply_migrations(conn)
     
     def get_or_create_user(self, email: str) -> int:
         """Get user ID or create new user."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.execute("SELECT id FROM users WHERE email = ?", (email,))
             result = cursor.fetchone()
             
@@ -75,7 +261,7 @@ class SQLiteChatDB:
     
     def create_conversation(self, user_id: int, title: str = "New Chat") -> int:
         """Create new conversation."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.execute(
                 "INSERT INTO conversations (user_id, title) VALUES (?, ?) RETURNING id",
                 (user_id, title)
@@ -84,18 +270,18 @@ class SQLiteChatDB:
     
     def add_message(self, conversation_id: int, role: str, content: str, 
                    method_used: str = None, rag_score: float = None, 
-                   web_score: float = None) -> int:
+                   web_score: float = None, token_count: int = None) -> int:
         """Add message to conversation and return message ID."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             cursor = conn.execute('''
-                INSERT INTO messages (conversation_id, role, content, method_used, rag_score, web_score)
-                VALUES (?, ?, ?, ?, ?, ?) RETURNING id
-            ''', (conversation_id, role, content, method_used, rag_score, web_score))
+                INSERT INTO messages (conversation_id, role, content, method_used, rag_score, web_score, token_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id
+            ''', (conversation_id, role, content, method_used, rag_score, web_score, token_count))
             
             message_id = cursor.fetchone()[0]
             
             conn.execute(
-                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP, message_count = message_count + 1 WHERE id = ?",
                 (conversation_id,)
             )
             conn.commit()
@@ -110,7 +296,7 @@ class SQLiteChatDB:
             metadata = {}
         metadata_json = json.dumps(metadata)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.execute('''
                 INSERT INTO message_sources
                 (message_id, type, source, title, text, score, metadata)
@@ -118,47 +304,129 @@ class SQLiteChatDB:
             ''', (message_id, source_type, source, title, text, score, metadata_json))
             conn.commit()
     
+    def persist_turn(self, conversation_id: int, user_message: str, answer: str,
+                     method_used: str = None, rag_score: float = None, web_score: float = None,
+                     sources: Optional[List[Dict]] = None, user_tokens: Optional[int] = None,
+                     answer_tokens: Optional[int] = None) -> int:
+        """
+        Save a whole chat turn in one transaction and return the assistant message ID.
+        
+        Writes the user message, the assistant message, its sources and the
+        conversation timestamp together, so a failure leaves no half-saved turn.
+        sources: dicts with type, source, title, text, score and metadata.
+        user_tokens/answer_tokens: token counts of the two messages, if known.
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, token_count) VALUES (?, 'user', ?, ?)",
+                (conversation_id, user_message, user_tokens)
+            )
+            cursor = conn.execute('''
+                INSERT INTO messages (conversation_id, role, content, method_used, rag_score, web_score, token_count)
+                VALUES (?, 'assistant', ?, ?, ?, ?, ?) RETURNING id
+            ''', (conversation_id, answer, method_used, rag_score, web_score, answer_tokens))
+            message_id = cursor.fetchone()[0]
+            
+            if sources:
+                conn.executemany('''
+                    INSERT INTO message_sources
+                    (message_id, type, source, title, text, score, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (message_id, source['type'], source.get('source'), source.get('title'), source.get('text'),
+                     source.get('score'), json.dumps(source.get('metadata') or {}))
+                    for source in sources
+                ])
+            
+            conn.execute(
+                "UPDATE conversations SET updated_at = CURRENT_TIMESTAMP, message_count = message_count + 2 WHERE id = ?",
+                (conversation_id,)
+            )
+            
+            return message_id
+    
     def update_message_feedback(self, message_id: int, feedback: str):
         """Update feedback (like/dislike) for a message."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connection() as conn:
             conn.execute(
                 "UPDATE messages SET feedback = ? WHERE id = ?",
                 (feedback, message_id)
             )
             conn.commit()
     
-    def get_user_conversations(self, user_id: int) -> List[Dict]:
-        """Get all conversations for user."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
-                SELECT c.id, c.title, c.created_at, c.updated_at, COUNT(m.id) as message_count
-                FROM conversations c
-                LEFT JOIN messages m ON c.id = m.conversation_id
-                WHERE c.user_id = ?
-                GROUP BY c.id
-                ORDER BY c.updated_at DESC
-            ''', (user_id,))
-            
+    def get_conversation(self, conversation_id: int) -> Optional[Dict]:
+        """Get a single conversation, or None if it does not exist."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, user_id, title, created_at, updated_at, message_count FROM conversations WHERE id = ?",
+                (conversation_id,)
+            ).fetchone()
+            return dict(row) if row else None
+    
+    def get_user_conversations(self, user_id: int, limit: Optional[int] = None,
+                               before: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """
+        Get conversations for user, most recently updated first.
+        
+        Pass limit for one page; for the next page pass before=(updated_at, id)
+        of the last conversation on the previous one.
+        """
+        query = '''
+            SELECT id, title, created_at, updated_at, message_count
+            FROM conversations
+            WHERE user_id = ?
+        '''
+        params: list = [user_id]
+        if before is not None:
+            query += " AND (updated_at, id) < (?, ?)"
+            params.extend(before)
+        query += " ORDER BY updated_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._connection() as conn:
+            cursor = conn.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
     
-    def get_conversation_messages(self, conversation_id: int) -> List[Dict]:
-        """Get all messages in conversation."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute('''
-                SELECT id, role, content, method_used, rag_score, web_score, feedback, created_at
+    def get_conversation_messages(self, conversation_id: int, limit: Optional[int] = None,
+                                  before: Optional[Tuple[str, int]] = None) -> List[Dict]:
+        """
+        Get messages in conversation, oldest first.
+        
+        With limit, returns only the latest limit messages; for older ones pass
+        before=(created_at, id) of the first message already loaded.
+        """
+        with self._connection() as conn:
+            if limit is None and before is None:
+                cursor = conn.execute('''
+                    SELECT id, role, content, method_used, rag_score, web_score, feedback, token_count, created_at
+                    FROM messages
+                    WHERE conversation_id = ?
+                    ORDER BY created_at ASC, id ASC
+                ''', (conversation_id,))
+                return [dict(row) for row in cursor.fetchall()]
+            
+            query = '''
+                SELECT id, role, content, method_used, rag_score, web_score, feedback, token_count, created_at
                 FROM messages
                 WHERE conversation_id = ?
-                ORDER BY created_at ASC
-            ''', (conversation_id,))
+            '''
+            params: list = [conversation_id]
+            if before is not None:
+                query += " AND (created_at, id) < (?, ?)"
+                params.extend(before)
+            query += " ORDER BY created_at DESC, id DESC"
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
             
-            return [dict(row) for row in cursor.fetchall()]
+            cursor = conn.execute(query, params)
+            return [dict(row) for row in reversed(cursor.fetchall())]
     
     def get_message_sources(self, message_id: int) -> List[Dict]:
         """Get all sources for a message with parsed metadata."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connection() as conn:
             cursor = conn.execute('''
                 SELECT id, type, source, title, text, score, metadata
                 FROM message_sources
@@ -166,38 +434,123 @@ class SQLiteChatDB:
                 ORDER BY score DESC
             ''', (message_id,))
             
-            sources = []
-            for row in cursor.fetchall():
-                source_dict = dict(row)
-                
-                # Parse metadata JSON string back to dict
-                if source_dict['metadata']:
-                    try:
-                        source_dict['metadata'] = json.loads(source_dict['metadata'])
-                    except json.JSONDecodeError:
-                        # If parsing fails, set to empty dict
-                        source_dict['metadata'] = {}
-                else:
-                    source_dict['metadata'] = {}
-                
-                sources.append(source_dict)
-            
-            return sources
+            return [self._source_from_row(row) for row in cursor.fetchall()]
+    
+    def get_sources_for_messages(self, message_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Get the sources of several messages in one query per batch.
+        
+        Returns {message_id: sources} with sources ordered by score, and an
+        empty list for messages without sources.
+        """
+        message_ids = list(dict.fromkeys(message_ids))
+        sources: Dict[int, List[Dict]] = {message_id: [] for message_id in message_ids}
+        with self._connection() as conn:
+            for start in range(0, len(message_ids), SOURCES_BATCH_SIZE):
+                batch = message_ids[start:start + SOURCES_BATCH_SIZE]
+                cursor = conn.execute(f'''
+                    SELECT message_id, id, type, source, title, text, score, metadata
+                    FROM message_sources
+                    WHERE message_id IN ({", ".join("?" * len(batch))})
+                    ORDER BY message_id, score DESC
+                ''', batch)
+                for row in cursor.fetchall():
+                    source_dict = self._source_from_row(row)
+                    sources[source_dict.pop('message_id')].append(source_dict)
+        
+        return sources
+    
+    @staticmethod
+    def _source_from_row(row: sqlite3.Row) -> Dict:
+        """Source row as a dict with its metadata JSON parsed."""
+        source_dict = dict(row)
+        
+        # Parse metadata JSON string back to dict
+        if source_dict['metadata']:
+            try:
+                source_dict['metadata'] = json.loads(source_dict['metadata'])
+            except json.JSONDecodeError:
+                # If parsing fails, set to empty dict
+                source_dict['metadata'] = {}
+        else:
+            source_dict['metadata'] = {}
+        
+        return source_dict
     
     def delete_conversation(self, conversation_id: int):
         """Delete conversation and its messages."""
-        with sqlite3.connect(self.db_path) as conn:
-            # Get all message IDs first to delete their sources
-            cursor = conn.execute("SELECT id FROM messages WHERE conversation_id = ?", (conversation_id,))
-            message_ids = [row[0] for row in cursor.fetchall()]
-            
-            # Delete sources for each message
-            for message_id in message_ids:
-                conn.execute("DELETE FROM message_sources WHERE message_id = ?", (message_id,))
-            
-            # Delete messages
-            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
-            
-            # Delete conversation
+        with self._connection() as conn:
+            # Messages and their sources follow through ON DELETE CASCADE
             conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
-            conn.commit()
\ No newline at end of file
+    
+    def purge_conversations(self, older_than_days: Optional[float] = None, max_per_user: Optional[int] = None,
+                            batch_size: int = 200) -> int:
+        """
+        Retention: delete conversations not updated for older_than_days, and each
+        user's conversations beyond their max_per_user most recently updated.
+        
+        Deletes batch_size conversations (with their messages and sources) per
+        transaction, so the write lock is released between batches and chat
+        turns are not blocked for long. Returns the number of conversations deleted.
+        """
+        queries = []
+        if older_than_days is not None:
+            queries.append((
+                "SELECT id FROM conversations WHERE updated_at < datetime('now', ?) LIMIT ?",
+                (f"-{older_than_days} days",)
+            ))
+        if max_per_user is not None:
+            queries.append(('''
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY updated_at DESC, id DESC) AS position
+                    FROM conversations
+                ) WHERE position > ? LIMIT ?
+            ''', (max_per_user,)))
+        
+        deleted = 0
+        for query, params in queries:
+            while True:
+                with self._connection() as conn:
+                    conversation_ids = [row[0] for row in conn.execute(query, params + (batch_size,))]
+                    conn.executemany("DELETE FROM conversations WHERE id = ?", [(cid,) for cid in conversation_ids])
+                deleted += len(conversation_ids)
+                if len(conversation_ids) < batch_size:
+                    break
+        
+        logger.info(f"Purged {deleted} conversations")
+        return deleted
+    
+    def incremental_vacuum(self, max_pages: Optional[int] = None) -> int:
+        """
+        Return up to max_pages free pages (all when None) to the filesystem.
+        
+        Needs incremental auto-vacuum, which new databases get; older files
+        must be rebuilt once with vacuum() (invoke purge --vacuum). Returns the
+        number of pages released.
+        """
+        with self._connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.warning("Incremental auto-vacuum is off for this database; run vacuum() (invoke purge --vacuum) once to enable it")
+                return 0
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({max_pages or 0})")
+            released = free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        logger.info(f"Incremental vacuum released {released} pages")
+        return released
+    
+    def vacuum(self) -> int:
+        """
+        Rebuild the whole file; also switches older databases to incremental auto-vacuum.
+        
+        Blocks writers while it runs. Returns the number of pages released.
+        """
+        with self._connection() as conn:
+            pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.commit()
+            conn.execute("VACUUM")
+            # Switching to auto-vacuum adds pointer-map pages, so a small file can grow
+            released = max(0, pages_before - conn.execute("PRAGMA page_count").fetchone()[0])
+        logger.info(f"Vacuum released {released} pages")
+        return released
\ No newline at end of file
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class HistoryCache:
+    """
+    Thread-safe LRU of the most recent messages of each conversation.
+
+    Keeps the last `window` messages of up to `max_conversations`
+    conversations, so a chat turn gets its history without reading the whole
+    conversation from SQLite. The cache is per process: writes made by other
+    processes are only seen after the conversation is evicted.
+    """
+
+    def __init__(self, max_conversations: int = 256, window: int = 10):
+        self.max_conversations = max_conversations
+        self.window = window
+        self.hits = 0
+        self.misses = 0
+        self._windows: "OrderedDict[int, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the conversation's window, or None on a miss."""
+        with self._lock:
+            messages = self._windows.get(conversation_id)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._windows.move_to_end(conversation_id)
+            self.hits += 1
+            return [dict(message) for message in messages]
+
+    def set(self, conversation_id: int, messages: List[Dict[str, Any]]) -> None:
+        """Store the latest messages of a conversation, evicting the least recently used."""
+        with self._lock:
+            self._windows[conversation_id] = [dict(message) for message in messages[-self.window:]]
+            self._windows.move_to_end(conversation_id)
+            while len(self._windows) > self.max_conversations:
+                self._windows.popitem(last=False)
+
+    def extend(self, conversation_id: int, messages: List[Dict[str, Any]]) -> None:
+        """
+        Append newly saved messages to a cached window; uncached conversations are left to load cold.
+
+        Message ids grow with every insert, so messages older than the window's
+        latest were saved by a turn that finished later; the window is dropped
+        and reloaded in order instead.
+        """
+        with self._lock:
+            window = self._windows.get(conversation_id)
+            if window is None:
+                return
+            cached_ids = [message['id'] for message in window if message.get('id') is not None]
+            new_ids = [message['id'] for message in messages if message.get('id') is not None]
+            if cached_ids and new_ids and min(new_ids) < max(cached_ids):
+                del self._windows[conversation_id]
+                return
+            window.extend(dict(message) for message in messages)
+            del window[:-self.window]
+
+    def update_feedback(self, message_id: int, feedback: str) -> None:
+        """Apply feedback to a cached message so the next prompt sees it."""
+        with self._lock:
+            for window in self._windows.values():
+                for message in window:
+                    if message.get('id') == message_id:
+                        message['feedback'] = feedback
+                        return
+
+    def discard(self, conversation_id: int) -> None:
+        """Forget a conversation (e.g. after it is deleted)."""
+        with self._lock:
+            self._windows.pop(conversation_id, None)
+
+    def clear(self) -> None:
+        """Drop all windows and reset counters."""
+        with self._lock:
+            self._windows.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._windows)}
@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.database import SQLiteChatDB
+from loguru import logger
+
+
+def main():
+    """Purge old conversations from the chat database and release the freed space."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--db", default="chat.db", help="chat database file")
+    parser.add_argument("--days", type=float, help="delete conversations not updated for this many days")
+    parser.add_argument("--max-per-user", type=int, help="keep only this many most recent conversations per user")
+    parser.add_argument("--batch-size", type=int, default=200, help="conversations deleted per transaction")
+    parser.add_argument("--max-pages", type=int, help="cap on pages released by incremental vacuum (default: all)")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="rebuild the whole file instead of an incremental vacuum; needed once for databases "
+                             "created without incremental auto-vacuum, and blocks writers while it runs")
+    args = parser.parse_args()
+
+    if args.days is None and args.max_per_user is None and not args.vacuum:
+        parser.error("give --days, --max-per-user and/or --vacuum")
+
+    try:
+        db = SQLiteChatDB(args.db)
+        deleted = 0
+        if args.days is not None or args.max_per_user is not None:
+            deleted = db.purge_conversations(args.days, args.max_per_user, args.batch_size)
+        released = db.vacuum() if args.vacuum else db.incremental_vacuum(args.max_pages)
+        db.close()
+        logger.success(f"Deleted {deleted} conversations, released {released} pages")
+    except Exception as e:
+        logger.error(f"Retention job failed: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
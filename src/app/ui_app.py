@@ -5,8 +5,13 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from app.chat_manager import ChatManager
+from tools.model_registry import warmup
 from loguru import logger
 
+# Sidebar and history load this many rows at a time; "Load older" adds a page
+CONVERSATIONS_PAGE_SIZE = 20
+MESSAGES_PAGE_SIZE = 20
+
 #custom page configuration
 st.set_page_config(
     page_title="AI Insight", 
@@ -14,6 +19,13 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def warmup_models():
+    """Load the shared encoder and ChromaDB client once per process."""
+    warmup()
+
+warmup_models()
+
 if "chat_manager" not in st.session_state:
     try:
         st.session_state.chat_manager = ChatManager()
@@ -40,6 +52,20 @@ if "message_feedback" not in st.session_state:
 if "current_conversation" not in st.session_state:
     st.session_state.current_conversation = None
 
+if "conversation_pages" not in st.session_state:
+    st.session_state.conversation_pages = 1
+
+if "message_pages" not in st.session_state:
+    st.session_state.message_pages = 1
+
+# Rendered conversations (messages and sources) per conversation, reused across reruns
+if "render_cache" not in st.session_state:
+    st.session_state.render_cache = {}
+
+# Latest message id per conversation chatted in this session; a new id invalidates its render cache entry
+if "last_message_ids" not in st.session_state:
+    st.session_state.last_message_ids = {}
+
 def add_custom_css():
     """Add custom CSS styling"""
     st.markdown("""
@@ -183,6 +209,7 @@ def sidebar():
                 logger.info("New chat started")
                 st.session_state.current_conversation = None
                 st.session_state.first_message_sent = False
+                st.session_state.message_pages = 1
                 # Clear message feedback for new chat
                 st.session_state.message_feedback = {}
                 st.rerun()
@@ -191,11 +218,11 @@ def sidebar():
         
         # Display conversations
         try:
-            conversations = st.session_state.chat_manager.get_user_conversations(st.session_state.user_id)
+            conversations, has_older = load_sidebar_conversations()
             logger.debug(f"Loaded {len(conversations)} conversations for sidebar")
         except Exception as e:
             logger.error(f"Failed to load conversations: {str(e)}")
-            conversations = []
+            conversations, has_older = [], False
         
         for conv in conversations:
             col1, col2 = st.columns([4, 1])
@@ -206,6 +233,7 @@ def sidebar():
                     logger.info(f"Switched to conversation {conv['id']}: {conv['title']}")
                     st.session_state.current_conversation = conv['id']
                     st.session_state.first_message_sent = True
+                    st.session_state.message_pages = 1
                     # Load existing feedback for this conversation
                     load_conversation_feedback(conv['id'])
                     st.rerun()
@@ -215,19 +243,76 @@ def sidebar():
                     try:
                         st.session_state.chat_manager.delete_conversation(conv['id'])
                         logger.info(f"Deleted conversation {conv['id']}")
+                        st.session_state.render_cache.pop(conv['id'], None)
                         if st.session_state.get('current_conversation') == conv['id']:
                             st.session_state.current_conversation = None
                             st.session_state.first_message_sent = False
+                            st.session_state.message_pages = 1
                             st.session_state.message_feedback = {}
                         st.rerun()
                     except Exception as e:
                         logger.error(f"Failed to delete conversation {conv['id']}: {str(e)}")
                         st.error("Failed to delete conversation")
+        
+        if has_older and st.button("Load older chats", use_container_width=True):
+            st.session_state.conversation_pages += 1
+            st.rerun()
+
+def load_sidebar_conversations():
+    """Load the sidebar's pages of conversations, newest first. Returns (conversations, has_older)."""
+    conversations, before = [], None
+    for _ in range(st.session_state.conversation_pages):
+        page = st.session_state.chat_manager.get_user_conversations(
+            st.session_state.user_id, CONVERSATIONS_PAGE_SIZE, before
+        )
+        conversations.extend(page)
+        if len(page) < CONVERSATIONS_PAGE_SIZE:
+            return conversations, False
+        before = (page[-1]['updated_at'], page[-1]['id'])
+    return conversations, True
+
+def load_visible_messages(conversation_id):
+    """Load the latest pages of a conversation, oldest first. Returns (messages, has_older)."""
+    messages, before = [], None
+    for _ in range(st.session_state.message_pages):
+        page = st.session_state.chat_manager.get_conversation_messages(conversation_id, MESSAGES_PAGE_SIZE, before)
+        messages = page + messages
+        if len(page) < MESSAGES_PAGE_SIZE:
+            return messages, False
+        before = (page[0]['created_at'], page[0]['id'])
+    return messages, True
+
+def load_conversation_view(conversation_id):
+    """
+    Messages of the visible pages with their sources: (messages, has_older, sources).
+    
+    Cached in the session under (conversation, pages, last message id), so
+    reruns of an unchanged conversation do no database work.
+    """
+    key = (st.session_state.message_pages, st.session_state.last_message_ids.get(conversation_id))
+    cached = st.session_state.render_cache.get(conversation_id)
+    if cached and cached['key'] == key:
+        return cached['messages'], cached['has_older'], cached['sources']
+    
+    messages, has_older = load_visible_messages(conversation_id)
+    sources = st.session_state.chat_manager.get_sources_for_messages(
+        [msg['id'] for msg in messages if msg['role'] == 'assistant']
+    )
+    st.session_state.render_cache[conversation_id] = {
+        'key': key, 'messages': messages, 'has_older': has_older, 'sources': sources
+    }
+    return messages, has_older, sources
 
 def load_conversation_feedback(conversation_id):
-    """Load existing feedback for all messages in a conversation"""
+    """
+    Load existing feedback for the visible messages of a conversation.
+    
+    Taken from the pages load_conversation_view reads (and caches for the
+    render), so switching conversations never reads the whole history;
+    older pages bring their feedback along when they are displayed.
+    """
     try:
-        messages = st.session_state.chat_manager.get_conversation_messages(conversation_id)
+        messages, _, _ = load_conversation_view(conversation_id)
         st.session_state.message_feedback = {}
         feedback_count = 0
         for msg in messages:
@@ -290,10 +375,9 @@ def display_message_feedback(message_id, has_existing_feedback, existing_feedbac
             if st.button("👎", key=f"dislike_msg_{message_id}"):
                 handle_feedback(message_id, 'dislike')
 
-def display_message_sources(message_id):
+def display_message_sources(message_id, sources):
     """Display sources for a message in an expander"""
     try:
-        sources = st.session_state.chat_manager.get_message_sources(message_id)
         if not sources:
             return
         
@@ -330,18 +414,20 @@ def display_message_sources(message_id):
 
 def display_messages():
     """Display all conversation messages"""
-    messages = []
+    messages, has_older, sources = [], False, {}
     if st.session_state.get('current_conversation'):
         try:
-            messages = st.session_state.chat_manager.get_conversation_messages(
-                st.session_state.current_conversation
-            )
+            messages, has_older, sources = load_conversation_view(st.session_state.current_conversation)
             logger.debug(f"Displaying {len(messages)} messages for conversation {st.session_state.current_conversation}")
         except Exception as e:
             logger.error(f"Failed to load messages: {str(e)}")
             st.error("Failed to load conversation messages")
             return
     
+    if has_older and st.button("Load older messages"):
+        st.session_state.message_pages += 1
+        st.rerun()
+    
     for msg in messages:
         if msg['role'] == 'user':
             with st.chat_message(msg['role'], avatar="app/static/user.png"):
@@ -389,7 +475,7 @@ def display_messages():
                         
                         st.markdown("---")
 
-                        display_message_sources(msg['id'])
+                        display_message_sources(msg['id'], sources.get(msg['id'], []))
 
 def chat_page():
     """Main chat page"""
@@ -401,8 +487,7 @@ def chat_page():
         #conversation title if we have one
         if has_conversation:
             try:
-                conversations = st.session_state.chat_manager.get_user_conversations(st.session_state.user_id)
-                current_conv = next((conv for conv in conversations if conv['id'] == st.session_state.current_conversation), None)
+                current_conv = st.session_state.chat_manager.get_conversation(st.session_state.current_conversation)
                 if current_conv:
                     st.markdown(f"### {current_conv['title']}")
             except Exception as e:
@@ -428,6 +513,7 @@ def chat_page():
         with st.chat_message("assistant", avatar="app/static/bot_logo.png"):
             # Create placeholder for answer
             answer_placeholder = st.empty()
+            streamed_tokens = []
             
             # Define streaming callback function
             def streaming_callback(update_type, content):
@@ -438,6 +524,11 @@ def chat_page():
                     # Show the current thought in the answer area
                     answer_placeholder.markdown(f'<div class="thought-item">{content}</div>', unsafe_allow_html=True)
                 
+                elif update_type == "token":
+                    # Grow the answer as tokens arrive
+                    streamed_tokens.append(content)
+                    answer_placeholder.markdown(f"<div class='assistant-message'>{''.join(streamed_tokens)}</div>", unsafe_allow_html=True)
+                
                 elif update_type == "answer":
                     # Final answer - update with the complete response
                     answer_placeholder.markdown(f"<div class='assistant-message'>{content}</div>", unsafe_allow_html=True)
@@ -453,6 +544,7 @@ def chat_page():
                 
                 # Update conversation ID
                 st.session_state.current_conversation = result['conversation_id']
+                st.session_state.last_message_ids[result['conversation_id']] = result['message_id']
                 
                 # Ensure final answer is displayed
                 final_answer = result['response']['answer']
@@ -1,47 +1,367 @@
-import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
-from typing import List, Dict, Any
+import sys
+import os
+import json
+import time
+import hashlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple, Union
 # import uuid
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from tools.model_registry import DEFAULT_MODEL_NAME, get_chroma_client, get_embedding_function, get_encoder
+from entities import ENTITY_FIELDS, EntityIndex, extract_entities
+from loguru import logger
+
 #TODO
-import os
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
+DEFAULT_COLLECTION = "jedi_ai"
+DEFAULT_SOURCE = "data.md"
+# Chunks embedded and written to Chroma per call (Chroma rejects calls above client.get_max_batch_size())
+WRITE_BATCH_SIZE = 1000
+# Sentences per forward pass inside each encoding process
+ENCODE_BATCH_SIZE = 64
+
+
+Chunk = Union[str, Tuple[str, Dict[str, Any]]]
+
+# Manifest path -> (modification time, EntityIndex built from it), shared by every loader
+_entity_indexes: Dict[str, Tuple[int, EntityIndex]] = {}
+
+
+def default_collection() -> str:
+    """Knowledge base collection name: CHROMA_COLLECTION, or jedi_ai."""
+    return os.getenv("CHROMA_COLLECTION") or DEFAULT_COLLECTION
+
+
+def iter_chunk_ids(chunks: Iterable[Chunk], source: str = DEFAULT_SOURCE) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Stable (id, text, metadata) triples from each chunk's source, section and text.
+    
+    Chunks are texts or (text, metadata) pairs. An unchanged chunk keeps its id
+    wherever it moves in the file; repeated chunks get an occurrence suffix so
+    ids stay unique. The section heading is part of the id, so renaming a
+    section re-indexes its chunks with the new heading.
+    """
+    seen = Counter()
+    for chunk in chunks:
+        text, metadata = (chunk, {}) if isinstance(chunk, str) else chunk
+        section = metadata.get("section")
+        key = f"{source}\0{section}\0{text}" if section else f"{source}\0{text}"
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+        yield (f"chunk_{digest}" if not seen[digest] else f"chunk_{digest}_{seen[digest]}"), text, metadata
+        seen[digest] += 1
+
+
+def chunk_ids(chunks: Iterable[Chunk], source: str = DEFAULT_SOURCE) -> List[str]:
+    """Ids of the chunks, as assigned when they are indexed."""
+    return [chunk_id for chunk_id, _, _ in iter_chunk_ids(chunks, source)]
+
+
 class ChromaDBLoader:
-    """Simple ChromaDB loader for text chunks."""
+    """
+    Simple ChromaDB loader for text chunks.
+    
+    A JSON manifest next to the database records the ordered chunk ids indexed
+    for each source file, so re-indexing a source only embeds new or changed
+    chunks and deletes the ones that are gone. It also records the entities
+    (cities, metrics) each source mentions, from which queries are filtered.
+    """
     
-    def __init__(self, collection_name: str = "markdown_chunks"):
+    def __init__(self, collection_name: str = "markdown_chunks", path: str = "./chroma_db"):
         """Initialize ChromaDB client and collection."""
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+        # Client and encoder are shared process-wide, so a new loader is cheap
+        self.path = path
+        self.client = get_chroma_client(path)
+        # Embedding function of an open encoding_pool, shared by every sync inside it
+        self._pool_embed = None
         
         # Use better embedding model
-        sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-mpnet-base-v2"
-        )
+        self.embedding_function = get_embedding_function("all-mpnet-base-v2")
         
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
-            embedding_function=sentence_transformer_ef
+            embedding_function=self.embedding_function
         )
     
-    def add_chunks(self, chunks: List[str]) -> None:
-        """Add text chunks to ChromaDB."""
-        # Generate simple IDs and metadata
-        ids = [f"chunk_{i}" for i in range(len(chunks))]
-        metadatas = [{"chunk_index": i} for i in range(len(chunks))]
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, f"{self.collection.name}.manifest.json")
+    
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {str(e)}")
+            return {}
+    
+    def load_manifest(self) -> Dict[str, List[str]]:
+        """Indexed chunk ids per source, in file order ({} when there is no manifest yet)."""
+        return self._read_manifest().get("sources", {})
+    
+    def load_entities(self) -> Dict[str, Dict[str, List[str]]]:
+        """Entity values per source and field, e.g. {"data.md": {"city": ["Denver", ...]}}."""
+        return self._read_manifest().get("entities", {})
+    
+    def save_manifest(self, sources: Dict[str, List[str]],
+                      entities: Optional[Dict[str, Dict[str, List[str]]]] = None) -> None:
+        """
+        Write the manifest atomically so an interrupted run never leaves half a file.
+        
+        entities defaults to what the manifest already records; entries of
+        sources that are no longer indexed are dropped.
+        """
+        entities = self.load_entities() if entities is None else entities
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                "collection": self.collection.name,
+                "sources": sources,
+                "entities": {source: values for source, values in entities.items() if source in sources}
+            }, file)
+        os.replace(temp_path, self.manifest_path)
+    
+    def entity_index(self) -> EntityIndex:
+        """Index of every entity in the collection, rebuilt only when the manifest changes."""
+        try:
+            version = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return EntityIndex()
+        cached = _entity_indexes.get(self.manifest_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        known = {field: set() for field in ENTITY_FIELDS}
+        for values in self.load_entities().values():
+            for field, names in values.items():
+                known.setdefault(field, set()).update(names)
+        index = EntityIndex({field: sorted(names) for field, names in known.items()})
+        _entity_indexes[self.manifest_path] = (version, index)
+        logger.info(f"Built entity index for {self.collection.name}: {index.size} names")
+        return index
+    
+    def add_chunks(self, chunks: Iterable[Chunk], source: str = DEFAULT_SOURCE, **kwargs) -> Dict[str, int]:
+        """Index the chunks of a source file, replacing what was indexed for it before."""
+        return self.sync_chunks(chunks, source, **kwargs)
+    
+    def sync_chunks(self, chunks: Iterable[Chunk], source: str = DEFAULT_SOURCE,
+                    batch_size: int = WRITE_BATCH_SIZE, workers: int = 1) -> Dict[str, int]:
+        """
+        Bring the collection in line with the current chunks of a source.
+        
+        Chunks are texts or (text, metadata) pairs; every chunk is stored with
+        its "source", "chunk_index" (position in the source) and the entities
+        found in its text (extract_entities) besides its own metadata. Chunks
+        are consumed lazily and only those whose id is new are embedded,
+        batch_size at a time, in `workers` encoding processes when workers > 1;
+        each batch is written before the next is read, so memory stays bounded
+        by the batch and the id list. Chunks no longer present are deleted and
+        chunks that only moved (or were indexed before entities were extracted)
+        get their metadata updated. Safe to re-run:
+        writes are upserts and the manifest is saved last.
         
-        self.collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids
+        Returns counts of added, removed, moved and unchanged chunks.
+        """
+        sources = self.load_manifest()
+        previous = self._previous_positions(sources, source)
+        # Sources indexed before entities were extracted get them written without re-embedding
+        refresh = source in sources and source not in self.load_entities()
+        found = {field: set() for field in ENTITY_FIELDS}
+        
+        ids = []
+        new_chunks, moved_chunks = [], []
+        added = moved = 0
+        started = time.perf_counter()
+        
+        with self._embedder(workers) as embed:
+            for index, (chunk_id, text, metadata) in enumerate(iter_chunk_ids(chunks, source)):
+                ids.append(chunk_id)
+                entities = extract_entities(text)
+                for field, value in entities.items():
+                    found[field].add(value)
+                if chunk_id not in previous:
+                    new_chunks.append((chunk_id, text, {**entities, **metadata, "source": source, "chunk_index": index}))
+                elif previous[chunk_id] != index or refresh:
+                    moved_chunks.append((chunk_id, {**entities, **metadata, "source": source, "chunk_index": index}))
+                
+                if len(new_chunks) >= batch_size:
+                    added += self._write_new(new_chunks, embed)
+                    new_chunks = []
+                    self._report_progress(source, added, started)
+                if len(moved_chunks) >= batch_size:
+                    moved += self._write_moved(moved_chunks)
+                    moved_chunks = []
+            
+            if new_chunks:
+                added += self._write_new(new_chunks, embed)
+                self._report_progress(source, added, started)
+            if moved_chunks:
+                moved += self._write_moved(moved_chunks)
+        
+        current = set(ids)
+        removed = [chunk_id for chunk_id in previous if chunk_id not in current]
+        self._delete(removed, batch_size)
+        
+        # Re-read so sources synced by other loaders meanwhile are kept
+        sources = self.load_manifest()
+        sources[source] = ids
+        entities = self.load_entities()
+        entities[source] = {field: sorted(values) for field, values in found.items() if values}
+        self.save_manifest(sources, entities)
+        if added or removed or moved:
+            self.mark_indexed()
+        
+        stats = {"added": added, "removed": len(removed), "moved": moved,
+                 "unchanged": len(ids) - added - moved}
+        logger.info(f"Synced {source} into {self.collection.name} in {time.perf_counter() - started:.1f}s: {stats}")
+        return stats
+    
+    def remove_source(self, source: str, batch_size: int = WRITE_BATCH_SIZE) -> int:
+        """Delete every chunk indexed for a source (e.g. a deleted file); returns how many."""
+        sources = self.load_manifest()
+        removed = sources.pop(source, [])
+        self._delete(removed, batch_size)
+        self.save_manifest(sources)
+        if removed:
+            self.mark_indexed()
+        logger.info(f"Removed {source} from {self.collection.name}: {len(removed)} chunks")
+        return len(removed)
+    
+    def _delete(self, ids: List[str], batch_size: int) -> None:
+        for start in range(0, len(ids), batch_size):
+            self.collection.delete(ids=ids[start:start + batch_size])
+    
+    def _write_new(self, batch: List[Tuple[str, str, Dict[str, Any]]], embed: Callable[[List[str]], Any]) -> int:
+        documents = [text for _, text, _ in batch]
+        self.collection.upsert(
+            documents=documents,
+            embeddings=list(embed(documents)),
+            metadatas=[metadata for _, _, metadata in batch],
+            ids=[chunk_id for chunk_id, _, _ in batch]
+        )
+        return len(batch)
+    
+    def _write_moved(self, batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+        # Metadata only, so nothing is re-embedded
+        self.collection.update(
+            metadatas=[metadata for _, metadata in batch],
+            ids=[chunk_id for chunk_id, _ in batch]
+        )
+        return len(batch)
+    
+    def _report_progress(self, source: str, added: int, started: float) -> None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        logger.info(f"{source}: embedded {added:,} chunks ({added / elapsed:,.0f} chunks/s)")
+    
+    @contextmanager
+    def encoding_pool(self, workers: int) -> Iterator[None]:
+        """Keep one pool of encoding processes for every sync run inside the block."""
+        with self._embedder(workers) as embed:
+            self._pool_embed = embed
+            try:
+                yield
+            finally:
+                self._pool_embed = None
+    
+    @contextmanager
+    def _embedder(self, workers: int) -> Iterator[Callable[[List[str]], Any]]:
+        """
+        Function embedding a batch of documents.
+        
+        With more than one worker the shared SentenceTransformer runs in a pool
+        of CPU processes (encode_multi_process), started once for the whole sync
+        (or reused from encoding_pool).
+        """
+        if self._pool_embed is not None:
+            yield self._pool_embed
+            return
+        if workers <= 1:
+            yield self.embedding_function
+            return
+        
+        encoder = get_encoder(getattr(self.embedding_function, "model_name", DEFAULT_MODEL_NAME))
+        normalize = getattr(self.embedding_function, "normalize_embeddings", False)
+        logger.info(f"Starting {workers} encoding processes")
+        pool = encoder.start_multi_process_pool(["cpu"] * workers)
+        try:
+            yield lambda documents: encoder.encode_multi_process(
+                documents, pool, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=normalize
+            )
+        finally:
+            encoder.stop_multi_process_pool(pool)
+    
+    def _previous_positions(self, sources: Dict[str, List[str]], source: str) -> Dict[str, Optional[int]]:
+        """
+        Chunk id -> position of what is indexed for the source.
+        
+        When the manifest does not match the collection (first run on an older
+        database, or a run interrupted before saving it), the ids are re-read from
+        Chroma; their positions are unknown (None), so their metadata is rewritten.
+        """
+        if sum(len(ids) for ids in sources.values()) == self.collection.count():
+            return {chunk_id: i for i, chunk_id in enumerate(sources.get(source, []))}
+        
+        logger.warning(f"Manifest for {self.collection.name} is out of date, re-reading ids from the collection")
+        others = {chunk_id for name, ids in sources.items() if name != source for chunk_id in ids}
+        stored = self.collection.get(include=[])["ids"]
+        return {chunk_id: None for chunk_id in stored if chunk_id not in others}
+    
+    def reset(self) -> None:
+        """Drop the collection and its manifest, for a full rebuild."""
+        name = self.collection.name
+        self.client.delete_collection(name)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.collection = self.client.get_or_create_collection(
+            name=name,
+            embedding_function=self.embedding_function
+        )
+    
+    def mark_indexed(self) -> None:
+        """Stamp the collection so answer caches built on it know to invalidate."""
+        metadata = dict(self.collection.metadata or {})
+        metadata["indexed_at"] = time.time()
+        self.collection.modify(metadata=metadata)
+    
+    def get_index_version(self) -> Any:
+        """Return the collection's last indexing stamp, re-read from the database."""
+        collection = self.client.get_or_create_collection(
+            name=self.collection.name,
+            embedding_function=self.embedding_function
         )
-        print(f"Added {len(chunks)} chunks to database")
+        return (collection.metadata or {}).get("indexed_at")
     
-    def query(self, query_text: str, n_results: int = 5) -> Dict[str, Any]:
-        """Query similar chunks from the database."""
+    def query(self, query_text: str, n_results: int = 5, query_embedding: Optional[List[float]] = None,
+              include_embeddings: bool = False, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Query similar chunks from the database.
+        
+        The encoder is skipped when query_embedding is given; include_embeddings
+        also returns the stored vector of every matched chunk. where restricts
+        the search to chunks whose metadata matches (e.g. {"city": "Denver"}).
+        """
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        
+        if query_embedding is not None:
+            return self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=include
+            )
         return self.collection.query(
             query_texts=[query_text],
-            n_results=n_results
+            n_results=n_results,
+            where=where,
+            include=include
         )
     
     def get_count(self) -> int:
@@ -1,6 +1,16 @@
-from typing import List
+import os
+import re
+import mmap
+from itertools import chain, groupby, islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+SEPARATORS = ["\n\n", "\n", " ", ""]
+# Prose is buffered up to this many characters (ending at a blank line) before it is split
+STREAM_BLOCK_CHARS = 100_000
+# Row under a table's header: pipes, colons and at least three dashes per column
+TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+
 
 def chunk_text(text: str, method: str = "recursive", chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
     """
@@ -16,24 +26,13 @@ def chunk_text(text: str, method: str = "recursive", chunk_size: int = 1000, chu
         List of text chunks
     """
     if method == "table_rows":
-        # Split by table rows, extract content between pipes
-        lines = text.split('\n')
-        chunks = []
-        for line in lines:
-            line = line.strip()
-            # Skip header and separator rows
-            if line.startswith('|') and not line.startswith('| :') and 'text' not in line.lower():
-                # Extract content between pipes
-                content = line.strip('|').strip()
-                if content:  # Only add non-empty content
-                    chunks.append(content)
-        return chunks
+        return list(iter_table_rows(text.split('\n')))
     
     elif method == "recursive":
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", " ", ""]
+            separators=SEPARATORS
         )
         chunks = text_splitter.split_text(text)
         return chunks
@@ -42,7 +41,153 @@ def chunk_text(text: str, method: str = "recursive", chunk_size: int = 1000, chu
         raise ValueError(f"Unknown method: {method}")
 
 
+def iter_chunks(file_path: str, method: str = "table_rows", chunk_size: int = 1000, chunk_overlap: int = 200,
+                use_mmap: bool = False) -> Iterator[str]:
+    """
+    Chunk a file lazily: file -> lines -> chunks, never holding the whole text.
+    
+    Same methods and parameters as chunk_text. use_mmap reads through a memory
+    map instead of buffered file reads (slower for line iteration, but the
+    pages stay in the page cache rather than the process heap).
+    """
+    if method not in ("table_rows", "recursive"):
+        raise ValueError(f"Unknown method: {method}")
+    
+    lines = read_lines(file_path, use_mmap)
+    if method == "table_rows":
+        return iter_table_rows(lines)
+    return iter_recursive_chunks(lines, chunk_size, chunk_overlap)
+
+
+def iter_document_chunks(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                         use_mmap: bool = False) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Chunk a markdown document section by section, streamed like iter_chunks.
+    
+    Tables become one chunk per row (the table_rows method) and prose between
+    them is split with the recursive method. Each chunk comes with metadata:
+    "section" (the nearest heading above it, "" before the first one) and,
+    for table rows, "row" (1-based within its table).
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS
+    )
+    section = ""
+    prose, size = [], 0
+    
+    def split_prose():
+        text = "".join(prose)
+        if text.strip():
+            for chunk in text_splitter.split_text(text):
+                yield chunk, {"section": section}
+    
+    # Runs of table lines and of other lines, both consumed lazily
+    for is_table, lines in groupby(read_lines(file_path, use_mmap), key=is_table_line):
+        if is_table:
+            yield from split_prose()
+            prose, size = [], 0
+            for row, content in enumerate(_table_rows(lines), start=1):
+                yield content, {"section": section, "row": row}
+            continue
+        
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith('#'):
+                yield from split_prose()
+                prose, size = [], 0
+                section = stripped.lstrip('#').strip()
+                continue
+            
+            prose.append(line)
+            size += len(line)
+            if size >= STREAM_BLOCK_CHARS and (not stripped or size >= 4 * STREAM_BLOCK_CHARS):
+                yield from split_prose()
+                prose, size = [], 0
+    
+    yield from split_prose()
+
+
+def load_document_chunks(file_path: str, chunk_size: int = 1000,
+                         chunk_overlap: int = 200) -> List[Tuple[str, Dict[str, Any]]]:
+    """iter_document_chunks as a list, for parsing files in worker processes."""
+    return list(iter_document_chunks(file_path, chunk_size, chunk_overlap))
+
+
+def is_table_line(line: str) -> bool:
+    return line.strip().startswith('|')
+
+
+def iter_table_rows(lines: Iterable[str]) -> Iterator[str]:
+    """Content of each markdown table row, skipping header and separator rows."""
+    for is_table, table in groupby(lines, key=is_table_line):
+        if is_table:
+            yield from _table_rows(table)
+
+
+def _table_rows(table: Iterable[str]) -> Iterator[str]:
+    """
+    Data rows of one table (consecutive '|' lines).
+    
+    The first line is the header when a separator row (---, :---, ---:)
+    follows it; separator rows are never data.
+    """
+    lines = (line.strip() for line in table)
+    head = list(islice(lines, 2))
+    if len(head) == 2 and TABLE_SEPARATOR.match(head[1]):
+        head = []
+    for line in chain(head, lines):
+        if TABLE_SEPARATOR.match(line):
+            continue
+        # Extract content between pipes
+        content = line.strip('|').strip()
+        if content:  # Only add non-empty content
+            yield content
+
+
+def iter_recursive_chunks(lines: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 200,
+                          block_chars: int = STREAM_BLOCK_CHARS) -> Iterator[str]:
+    """
+    Recursive chunks of streamed lines (with their line endings).
+    
+    Lines are collected into blocks of about block_chars that end at a blank
+    line, and each block is split on its own, so chunks never span blocks.
+    A paragraph with no blank line for 4 * block_chars is cut anyway.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS
+    )
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_chars and (not line.strip() or size >= 4 * block_chars):
+            yield from text_splitter.split_text("".join(block))
+            block, size = [], 0
+    if block:
+        yield from text_splitter.split_text("".join(block))
+
+
+def read_lines(file_path: str, use_mmap: bool = False) -> Iterator[str]:
+    """Lines of a UTF-8 file, streamed from disk or from a read-only memory map."""
+    if not use_mmap:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yield from file
+        return
+    
+    with open(file_path, 'rb') as file:
+        # Empty files cannot be mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode('utf-8')
+
+
 def load_markdown_file(file_path: str) -> str:
-    """Load markdown file content."""
+    """Load markdown file content (whole; see iter_chunks for large files)."""
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Entity fields stored in chunk metadata and usable as query filters
+ENTITY_FIELDS = ("city", "metric")
+# Fields rag_search filters on by default. Chroma's where cost grows with the
+# number of chunks a clause matches: a city matches a handful, a metric half
+# the collection, for no measured gain in precision
+FILTER_FIELDS = ("city",)
+
+# "... remote workers in Salt Lake City take ..." -> "Salt Lake City"
+CITY_PATTERN = re.compile(r"\bworkers in ((?:[A-Z][\w.'-]*)(?: [A-Z][\w.'-]*)*)")
+
+# What a row's percentage measures, and the query phrasings that ask for it
+METRIC_PATTERNS = {
+    "relative_likelihood": re.compile(r"\d+% (?:more|less) likely\b"),
+    "share_of_workers": re.compile(r"\b\d+% of\b"),
+}
+METRIC_PHRASES = {
+    "relative_likelihood": ["more likely", "less likely", "likelihood", "compared to the average"],
+    "share_of_workers": ["percent of", "percentage of", "% of", "share of", "proportion of", "how many"],
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+|%")
+
+
+def extract_entities(text: str) -> Dict[str, str]:
+    """City and metric a chunk is about, for the fields found in its text."""
+    entities = {}
+    match = CITY_PATTERN.search(text)
+    if match:
+        entities["city"] = match.group(1).rstrip(".")
+    for metric, pattern in METRIC_PATTERNS.items():
+        if pattern.search(text):
+            entities["metric"] = metric
+            break
+    return entities
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class EntityIndex:
+    """
+    Recognize known entities in a query.
+
+    Every entity name (and every phrasing of a metric) is inserted into a trie
+    of lowercased tokens, so a query is scanned in one pass with longest-match
+    lookups whatever the number of known entities; multi-word names such as
+    "Salt Lake City" match as a whole.
+    """
+
+    def __init__(self, entities: Optional[Dict[str, Iterable[str]]] = None):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+        for field, values in (entities or {}).items():
+            for value in values:
+                if field == "metric":
+                    for phrase in METRIC_PHRASES.get(value, []):
+                        self.add(phrase, field, value)
+                else:
+                    self.add(value, field, value)
+
+    def add(self, name: str, field: str, value: str) -> None:
+        """Recognize name in queries as field == value."""
+        tokens = tokenize(name)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, set()).add((field, value))
+        self.size += 1
+
+    def recognize(self, query: str) -> Dict[str, List[str]]:
+        """Values of each field named in the query, in order of appearance."""
+        tokens = tokenize(query)
+        found: Dict[str, List[str]] = {}
+        i = 0
+        while i < len(tokens):
+            match, length = self._longest_match(tokens, i)
+            for field, value in sorted(match):
+                if value not in found.setdefault(field, []):
+                    found[field].append(value)
+            i += length or 1
+        return found
+
+    def _longest_match(self, tokens: List[str], start: int) -> Tuple[set, int]:
+        node, match, length = self.root, set(), 0
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if None in node:
+                match, length = node[None], i - start + 1
+        return match, length
+
+    def filters(self, query: str, fields: Optional[Sequence[str]] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Chroma where filters for the query, from the most to the least specific.
+
+        Only `fields` (default FILTER_FIELDS) are filtered on. They are dropped
+        from the end one at a time, and the list always ends with None, the
+        unfiltered search.
+        """
+        fields = FILTER_FIELDS if fields is None else fields
+        found = self.recognize(query)
+        filters = []
+        for count in range(len(fields), -1, -1):
+            where = where_filter({field: found[field] for field in fields[:count] if field in found})
+            if where not in filters:
+                filters.append(where)
+        return filters
+
+
+def where_filter(entities: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+    """Chroma where clause matching any of the values of every field."""
+    clauses = [{field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+               for field, values in entities.items() if values]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
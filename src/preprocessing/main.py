@@ -1,5 +1,11 @@
-from chunker import chunk_text, load_markdown_file
-from chroma_loader import ChromaDBLoader
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from chunker import iter_document_chunks, load_document_chunks
+from chroma_loader import ChromaDBLoader, WRITE_BATCH_SIZE, default_collection
 from loguru import logger
 
 
@@ -7,30 +13,107 @@ from loguru import logger
 # import os
 # if os.getenv("DISABLE_SSL", "false").lower() == "true":
 #     os.environ["HF_HUB_DISABLE_SSL_VERIFICATION"] = "1"
- 
- 
 
-def main():
-    """Preprocessing pipeline."""
+# Files at least this large are streamed in this process instead of parsed whole in a worker
+STREAM_FILE_BYTES = 32 * 1024 * 1024
+
+
+def find_markdown_files(directory: str) -> List[str]:
+    """Markdown files under directory, recursively, in a stable order."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith((".md", ".markdown")))
+    return paths
+
+
+def ingest_directory(loader: ChromaDBLoader, directory: str, parse_workers: Optional[int] = None,
+                     batch_size: int = WRITE_BATCH_SIZE, use_mmap: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Sync every markdown file under directory into the loader's collection.
+    
+    Files are parsed in parallel worker processes (files of STREAM_FILE_BYTES
+    or more are streamed here instead) while this process embeds and writes
+    one file at a time; a few parsed files are kept in flight so neither side
+    waits. Sources are paths relative to directory, and sources in the
+    collection whose file no longer exists are removed.
+    
+    Returns sync stats per source.
+    """
+    paths = find_markdown_files(directory)
+    small = [path for path in paths if os.path.getsize(path) < STREAM_FILE_BYTES]
+    large = [path for path in paths if os.path.getsize(path) >= STREAM_FILE_BYTES]
+    source_of = lambda path: os.path.relpath(path, directory).replace(os.sep, "/")
+    logger.info(f"Found {len(paths)} markdown files in {directory} ({len(large)} streamed)")
+    
+    results = {}
+    
+    def sync(path, chunks):
+        results[source_of(path)] = loader.sync_chunks(chunks, source_of(path), batch_size=batch_size)
+    
+    parse_workers = parse_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        pending = deque()
+        for path in small:
+            pending.append((path, executor.submit(load_document_chunks, path)))
+            if len(pending) >= 2 * parse_workers:
+                path, future = pending.popleft()
+                sync(path, future.result())
+        while pending:
+            path, future = pending.popleft()
+            sync(path, future.result())
+    
+    for path in large:
+        sync(path, iter_document_chunks(path, use_mmap=use_mmap))
+    
+    for source in set(loader.load_manifest()) - set(results):
+        loader.remove_source(source, batch_size)
+    return results
+
+
+def main(full: bool = False, data_path: str = "../data/data.md", workers: int = 1,
+         batch_size: int = WRITE_BATCH_SIZE, use_mmap: bool = False, collection: Optional[str] = None,
+         parse_workers: Optional[int] = None):
+    """
+    Preprocessing pipeline.
+    
+    data_path is a markdown file or a directory of them; collection defaults
+    to CHROMA_COLLECTION or jedi_ai. Tables are indexed a row per chunk and
+    prose in recursive chunks, with source, section and row metadata.
+    
+    Incremental by default: only new or changed chunks are embedded and chunks
+    removed from the files are deleted. full=True rebuilds the collection.
+    New chunks are embedded batch_size at a time in `workers` processes.
+    A single file is streamed line by line (through a memory map with use_mmap),
+    so memory does not grow with its size.
+    """
     
     try:
-        # 1. Load markdown file
-        logger.info("Loading markdown file...")
-        text = load_markdown_file("../data/data.md")
-        logger.info(f"Loaded {len(text):,} characters")
+        # 1. Open the collection
+        collection = collection or default_collection()
+        logger.info(f"Loading into ChromaDB collection {collection}...")
+        loader = ChromaDBLoader(collection)
+        if full:
+            logger.info("Full rebuild: dropping the existing collection")
+            loader.reset()
         
-        # 2. Chunk the text
-        logger.info("Chunking text...")
-        chunks = chunk_text(text, method="table_rows")
-        logger.info(f"Created {len(chunks)} chunks")
+        # 2. Chunk the markdown as it is read and sync it into the collection
+        with loader.encoding_pool(workers):
+            if os.path.isdir(data_path):
+                synced = ingest_directory(loader, data_path, parse_workers, batch_size, use_mmap)
+            else:
+                logger.info(f"Streaming markdown file ({os.path.getsize(data_path):,} bytes)...")
+                chunks = iter_document_chunks(data_path, use_mmap=use_mmap)
+                source = os.path.basename(data_path)
+                synced = {source: loader.sync_chunks(chunks, source=source, batch_size=batch_size)}
         
-        # 3. Load into ChromaDB
-        logger.info("Loading into ChromaDB...")
-        loader = ChromaDBLoader("jedi_ai")
-        loader.add_chunks(chunks)
-        logger.info("Successfully loaded chunks into ChromaDB")
+        added = sum(stats['added'] for stats in synced.values())
+        removed = sum(stats['removed'] for stats in synced.values())
+        unchanged = sum(stats['unchanged'] for stats in synced.values())
+        logger.info(f"Successfully synced {len(synced)} files into ChromaDB ({added} embedded, "
+                    f"{removed} removed, {unchanged} unchanged)")
         
-        # 4. Test with a sample query
+        # 3. Test with a sample query
         logger.info("Testing with sample query...")
         results = loader.query("Remote workers in Seattle", n_results=3)
         
@@ -50,4 +133,14 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk markdown files and index them into ChromaDB")
+    parser.add_argument("--full", action="store_true", help="rebuild the collection instead of syncing changes")
+    parser.add_argument("--data", default="../data/data.md", help="markdown file, or directory of markdown files, to index")
+    parser.add_argument("--collection", default=None, help="collection name (default: CHROMA_COLLECTION or jedi_ai)")
+    parser.add_argument("--workers", type=int, default=1, help="encoding processes (e.g. the number of cores)")
+    parser.add_argument("--parse-workers", type=int, default=None, help="processes parsing files of a directory")
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE, help="chunks embedded and written per batch")
+    parser.add_argument("--mmap", action="store_true", help="read large files through a memory map")
+    args = parser.parse_args()
+    main(full=args.full, data_path=args.data, workers=args.workers, batch_size=args.batch_size, use_mmap=args.mmap,
+         collection=args.collection, parse_workers=args.parse_workers)
@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, name: str, max_size: int = 1024, ttl: float = 3600):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the fresh value for key, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Return the value for key even if expired (for revalidation), without counting."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store value for key, evicting expired then least recently used entries."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                now = time.time()
+                for expired_key in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+                    del self._entries[expired_key]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries and reset counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {"name": self.name, "hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class SQLiteTTLCache(TTLCache):
+    """TTLCache persisted to a SQLite file so entries survive restarts. Values must be JSON-serializable."""
+
+    def __init__(self, name: str, db_path: str, max_size: int = 1024, ttl: float = 3600):
+        super().__init__(name, max_size, ttl)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    expires_at REAL,
+                    accessed_at REAL,
+                    PRIMARY KEY (name, key)
+                )
+            ''')
+            self._conn.commit()
+
+    def _load(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE name = ? AND key = ?",
+            (self.name, key)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._load(key)
+            now = time.time()
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE name = ? AND key = ?",
+                (now, self.name, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._load(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (name, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.name, key, json.dumps(value), expires_at, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache_entries WHERE name = ?", (self.name,)).fetchone()[0]
+            if count > self.max_size:
+                self._conn.execute("DELETE FROM cache_entries WHERE name = ? AND expires_at <= ?", (self.name, now))
+                self._conn.execute('''
+                    DELETE FROM cache_entries WHERE name = ? AND key IN (
+                        SELECT key FROM cache_entries WHERE name = ?
+                        ORDER BY accessed_at ASC
+                        LIMIT MAX(0, (SELECT COUNT(*) FROM cache_entries WHERE name = ?) - ?)
+                    )
+                ''', (self.name, self.name, self.name, self.max_size))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE name = ?", (self.name,))
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM cache_entries WHERE name = ?", (self.name,)).fetchone()[0]
+            return {"name": self.name, "hits": self.hits, "misses": self.misses, "size": size}
+
+
+def create_cache(name: str, max_size: int, ttl: float, db_path: Optional[str] = None) -> TTLCache:
+    """Build an on-disk cache when db_path is set, otherwise an in-memory one."""
+    if db_path:
+        try:
+            return SQLiteTTLCache(name, db_path, max_size, ttl)
+        except Exception as e:
+            logger.error(f"Failed to open cache database {db_path}, using memory: {str(e)}")
+    return TTLCache(name, max_size, ttl)
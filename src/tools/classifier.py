@@ -1,22 +1,40 @@
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional
+
+import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from loguru import logger
 
+from tools.model_registry import get_encoder
+
+CHUNK_AGGREGATES = ("max", "mean", "weighted")
+
 class Classifier:
     def __init__(self):
         try:
-            self.model = SentenceTransformer("all-mpnet-base-v2")
+            self.model = get_encoder("all-mpnet-base-v2")
             logger.info("Successfully loaded SentenceTransformer model")
         except Exception as e:
             self.model = None
             logger.error(f"Failed to load SentenceTransformer model: {str(e)}")
     
-    def score(self, query: str, content: str) -> float:
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Encode the query once so retrieval and scoring can share the vector."""
+        if self.model is None:
+            logger.warning("Model not available for query embedding")
+            return None
+        
+        try:
+            return self.model.encode([query])[0].tolist()
+        except Exception as e:
+            logger.error(f"Error embedding query: {str(e)}")
+            return None
+    
+    def score(self, query: str, content: str, query_embedding: Optional[List[float]] = None) -> float:
         if not content or len(content.strip()) < 10:
             logger.debug(f"Content too short: {len(content)} chars")
             return 0.0
             
-        embedding_score = self._embedding_similarity(query, content)
+        embedding_score = self._embedding_similarity(query, content, query_embedding)
         
         keyword_score = self._keyword_overlap(query, content)
         
@@ -25,16 +43,71 @@ class Classifier:
         
         return min(1.0, max(0.0, final_score))
         
-    def _embedding_similarity(self, query: str, content: str) -> float:
-        """Calculate embedding similarity."""
+    def score_chunks(self, query: str, chunk_embeddings: List[List[float]], content: str,
+                     query_embedding: Optional[List[float]] = None, aggregate: str = "max") -> float:
+        """
+        Score retrieved chunks from their stored embeddings instead of re-encoding content.
+        
+        Every chunk is compared to the query in one vectorized pass, so nothing is lost
+        to the encoder's input truncation and no extra model call is made.
+        aggregate is "max", "mean" or "weighted" (similarity-weighted mean).
+        """
+        if aggregate not in CHUNK_AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+        
+        if not content or len(content.strip()) < 10 or len(chunk_embeddings) == 0:
+            logger.debug("No chunk content to score")
+            return 0.0
+        
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        embedding_score = self._aggregate_similarity(query_embedding, chunk_embeddings, aggregate) if query_embedding is not None else 0.0
+        keyword_score = self._keyword_overlap(query, content)
+        
+        final_score = 0.7 * embedding_score + 0.3 * keyword_score
+        logger.debug(f"Chunk scores ({aggregate}) - embedding: {embedding_score:.3f}, keyword: {keyword_score:.3f}, final: {final_score:.3f}")
+        
+        return min(1.0, max(0.0, final_score))
+    
+    def _aggregate_similarity(self, query_embedding: List[float], chunk_embeddings: List[List[float]], aggregate: str) -> float:
+        """Cosine similarity of the query against every chunk, reduced to one number."""
+        try:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            chunk_matrix = np.asarray(chunk_embeddings, dtype=np.float32)
+            
+            query_norm = np.linalg.norm(query_vector)
+            chunk_norms = np.linalg.norm(chunk_matrix, axis=1)
+            if query_norm == 0:
+                return 0.0
+            similarities = (chunk_matrix @ query_vector) / (np.maximum(chunk_norms, 1e-12) * query_norm)
+            similarities = np.clip(similarities, 0.0, 1.0)
+            
+            if aggregate == "max":
+                similarity = similarities.max()
+            elif aggregate == "mean":
+                similarity = similarities.mean()
+            else:
+                total = similarities.sum()
+                similarity = (similarities * similarities).sum() / total if total > 0 else 0.0
+            return float(similarity)
+        except Exception as e:
+            logger.error(f"Error aggregating chunk similarity: {str(e)}")
+            return 0.0
+    
+    def _embedding_similarity(self, query: str, content: str, query_embedding: Optional[List[float]] = None) -> float:
+        """Calculate embedding similarity, reusing query_embedding when given."""
         if self.model is None:
             logger.warning("Model not available for embedding similarity")
             return 0.0
         
         try:
-            query_embedding = self.model.encode([query])
+            if query_embedding is None:
+                query_vector = self.model.encode([query])
+            else:
+                query_vector = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
             content_embedding = self.model.encode([content])
-            similarity = cosine_similarity(query_embedding, content_embedding)[0][0]
+            similarity = cosine_similarity(query_vector, content_embedding)[0][0]
             return max(0.0, float(similarity))
         except Exception as e:
             logger.error(f"Error calculating embedding similarity: {str(e)}")
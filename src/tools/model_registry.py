@@ -0,0 +1,92 @@
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import chromadb
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from sentence_transformers import SentenceTransformer
+from loguru import logger
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+DEFAULT_MODEL_NAME = "all-mpnet-base-v2"
+DEFAULT_CHROMA_PATH = "./chroma_db"
+
+_lock = threading.Lock()
+_encoders: Dict[str, SentenceTransformer] = {}
+_chroma_clients: Dict[str, "chromadb.ClientAPI"] = {}
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL_NAME) -> SentenceTransformer:
+    """Return the process-wide SentenceTransformer for model_name, loading it on first use."""
+    encoder = _encoders.get(model_name)
+    if encoder is not None:
+        return encoder
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        if model_name not in _encoders:
+            logger.info(f"Loading SentenceTransformer model: {model_name}")
+            _encoders[model_name] = SentenceTransformer(model_name)
+        return _encoders[model_name]
+
+
+def get_chroma_client(path: str = DEFAULT_CHROMA_PATH) -> "chromadb.ClientAPI":
+    """Return the process-wide Chroma PersistentClient for path, creating it on first use."""
+    key = os.path.abspath(path)
+    client = _chroma_clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        if key not in _chroma_clients:
+            logger.info(f"Opening ChromaDB client at: {key}")
+            _chroma_clients[key] = chromadb.PersistentClient(path=path)
+        return _chroma_clients[key]
+
+
+class SharedEncoderEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function backed by the shared encoder from this registry."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, normalize_embeddings: bool = False):
+        self.model_name = model_name
+        self.normalize_embeddings = normalize_embeddings
+
+    def __call__(self, input: Documents) -> Embeddings:
+        # Resolved per call so creating a collection handle never loads the model
+        encoder = get_encoder(self.model_name)
+        return [
+            embedding
+            for embedding in encoder.encode(
+                list(input),
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings,
+            )
+        ]
+
+
+def get_embedding_function(model_name: str = DEFAULT_MODEL_NAME) -> SharedEncoderEmbeddingFunction:
+    """Return a Chroma embedding function that reuses the shared encoder."""
+    return SharedEncoderEmbeddingFunction(model_name)
+
+
+def warmup(model_names: Optional[Iterable[str]] = None, chroma_path: Optional[str] = DEFAULT_CHROMA_PATH) -> None:
+    """Load encoders and the Chroma client ahead of the first request."""
+    for model_name in model_names or [DEFAULT_MODEL_NAME]:
+        try:
+            get_encoder(model_name)
+        except Exception as e:
+            logger.error(f"Failed to warm up model {model_name}: {str(e)}")
+
+    if chroma_path:
+        try:
+            get_chroma_client(chroma_path)
+        except Exception as e:
+            logger.error(f"Failed to warm up ChromaDB client at {chroma_path}: {str(e)}")
+
+
+def reset() -> None:
+    """Drop all cached encoders and clients (used by tests)."""
+    with _lock:
+        _encoders.clear()
+        _chroma_clients.clear()
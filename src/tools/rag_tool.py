@@ -1,30 +1,48 @@
 import sys
 sys.path.append('./preprocessing')
-from chroma_loader import ChromaDBLoader
+from chroma_loader import ChromaDBLoader, default_collection
 from loguru import logger
 import os
+from typing import List, Optional
 
 
 # TODO
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
-def rag_search(query: str, num_results: int = 5, similarity_threshold: float = 0.2) -> list:
+def rag_search(query: str, num_results: int = 5, similarity_threshold: float = 0.2,
+               query_embedding: Optional[List[float]] = None, include_embeddings: bool = False,
+               collection: Optional[str] = None, entity_filters: bool = True) -> list:
     """
     Search the knowledge base for relevant information.
     
+    When the query names cities found in the knowledge base, only chunks
+    tagged with them are searched (see entities.FILTER_FIELDS); the filter is
+    relaxed, down to a plain vector search, while it matches nothing.
+    
     Args:
         query: Search query string
         num_results: Number of results to return
         similarity_threshold: Minimum similarity score (0.0 to 1.0)
+        query_embedding: Precomputed query vector; when given, Chroma does not re-encode the query
+        include_embeddings: Attach each chunk's stored vector under "embedding"
+        collection: Collection to search (default: CHROMA_COLLECTION or jedi_ai)
+        entity_filters: Restrict the search to the entities the query names
         
     Returns:
-        List of chunk objects with text and metadata
+        List of chunk objects with text and metadata (source file, section, row)
     """
     try:
-        loader = ChromaDBLoader("jedi_ai")
+        loader = ChromaDBLoader(collection or default_collection())
         logger.info(f"Collection count: {loader.get_count()}")
         
-        results = loader.query(query, n_results=num_results)
+        filters = loader.entity_index().filters(query) if entity_filters else [None]
+        for where in filters:
+            results = loader.query(query, n_results=num_results, query_embedding=query_embedding,
+                                   include_embeddings=include_embeddings, where=where)
+            if results and results.get('documents') and results['documents'][0]:
+                break
+        if where:
+            logger.info(f"Searched chunks matching {where}")
         
         if not results or not results.get('documents') or not results['documents'][0]:
             return []
@@ -32,18 +50,25 @@ def rag_search(query: str, num_results: int = 5, similarity_threshold: float = 0
         documents = results['documents'][0]
         distances = results['distances'][0]
         ids = results.get('ids', [0])[0]
+        metadatas = (results.get('metadatas') or [None])[0] or [{}] * len(documents)
+        embeddings = results['embeddings'][0] if include_embeddings and results.get('embeddings') is not None else None
         
         chunks = []
         for i, (doc, distance, chunk_id) in enumerate(zip(documents, distances, ids)):
             similarity = 1 - distance  #distance to similarity
             if similarity >= similarity_threshold:
-                chunks.append({
+                chunk = {
                     "text": doc,
                     "score": similarity,
                     "id": chunk_id,
                     "source": "Knowledge Base",
-                    "title": f"Document Chunk {i+1}"
-                })
+                    "title": chunk_title(metadatas[i] or {}, i),
+                    "metadata": metadatas[i] or {}
+                }
+                if embeddings is not None:
+                    embedding = embeddings[i]
+                    chunk["embedding"] = embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+                chunks.append(chunk)
         
         return chunks
         
@@ -52,6 +77,20 @@ def rag_search(query: str, num_results: int = 5, similarity_threshold: float = 0
         return []
     
 
+def chunk_title(metadata: dict, index: int) -> str:
+    """Where a chunk comes from, e.g. "cities.md, Denver, row 3" ("Document Chunk n" without metadata)."""
+    parts = [metadata.get("source"), metadata.get("section")]
+    if metadata.get("row"):
+        parts.append(f"row {metadata['row']}")
+    parts = [str(part) for part in parts if part]
+    return ", ".join(parts) if parts else f"Document Chunk {index + 1}"
+
+
+def get_index_version(collection_name: Optional[str] = None):
+    """Return the knowledge base's indexing stamp (changes on every re-index)."""
+    return ChromaDBLoader(collection_name or default_collection()).get_index_version()
+    
+
 # # Test
 # if __name__ == "__main__":
 #     result = rag_search("Tell me the percentage of remote workers in Denver", 3)
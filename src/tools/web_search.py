@@ -1,14 +1,49 @@
 import os
-from typing import List, Dict, Any, Optional
+import json
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Tuple, Union
 from dotenv import load_dotenv
+import httpx
+import requests
 import serpapi
+import urllib3
 from loguru import logger
 from urllib.parse import urlparse
 from trafilatura.settings import use_config
 from trafilatura import extract, fetch_url
 
+from tools.cache import create_cache
+
 load_dotenv()
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/121.0.0.0 Safari/537.36"
+
+# Page fetching limits
+FETCH_WORKERS = 4
+EXTRACT_WORKERS = 2
+URL_TIMEOUT = 5.0        # seconds per page
+FETCH_DEADLINE = 10.0    # seconds for the whole batch
+MAX_PAGE_BYTES = 5_000_000
+READ_CHUNK_BYTES = 64 * 1024
+
+# DISABLE_SSL=true skips certificate verification for page downloads (and silences its warnings)
+VERIFY_TLS = os.getenv("DISABLE_SSL", "false").lower() != "true"
+
+# Set WEB_CACHE_PATH to a SQLite file to keep cached searches and pages across restarts
+SEARCH_CACHE_TTL = 6 * 3600
+PAGE_CACHE_TTL = 24 * 3600
+search_cache = create_cache("search", max_size=512, ttl=SEARCH_CACHE_TTL, db_path=os.getenv("WEB_CACHE_PATH"))
+page_cache = create_cache("page", max_size=2048, ttl=PAGE_CACHE_TTL, db_path=os.getenv("WEB_CACHE_PATH"))
+
+_config = None
+_session = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
 class WebSearchError(Exception):
     """Exception for web search errors."""
     pass
@@ -33,6 +68,32 @@ def content_is_relevant(content: str = "") -> bool:
     """Check if the content is relevant."""
     return not (content is None or len(str(content)) < 100 or len(content.split()) < 10)
 
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups: case, whitespace and trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+def search_cache_key(
+    query: str,
+    num: int,
+    tbs: str,
+    accepted_urls: Optional[List[str]] = None,
+    rejected_urls: Optional[List[str]] = None,
+) -> str:
+    """Cache key covering every parameter that changes the search result."""
+    return json.dumps([
+        normalize_query(query), num, tbs,
+        sorted(accepted_urls or []), sorted(rejected_urls or [])
+    ])
+
+def web_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss counters of the search and page caches."""
+    return {"search": search_cache.stats(), "page": page_cache.stats()}
+
+def clear_web_caches() -> None:
+    """Empty the search and page caches."""
+    search_cache.clear()
+    page_cache.clear()
+
 def get_urls_from_google_search(
     query: str,
     num: int = 10,
@@ -42,6 +103,12 @@ def get_urls_from_google_search(
 ) -> Dict[str, Any]:
     """Perform Google search using SerpApi."""
     
+    cache_key = search_cache_key(query, num, tbs, accepted_urls, rejected_urls)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Search cache hit for: {query}")
+        return cached
+    
     logger.info(f"Searching Google for: {query}")
     
     try:
@@ -72,32 +139,151 @@ def get_urls_from_google_search(
                     })
         
         logger.info(f"Found {len(articles)} relevant articles")
-        return {
+        search_result = {
             "status": search_status,
             "articles": articles
         }
+        if search_status == "Success":
+            search_cache.set(cache_key, search_result)
+        return search_result
         
     except Exception as e:
         logger.error(f"Search failed: {str(e)}")
         raise WebSearchError(f"Google search failed: {str(e)}")
 
-def extract_content_from_url(url: str) -> Optional[str]:
-    """Extract content from URL using Trafilatura."""
+def get_trafilatura_config():
+    """Return the shared Trafilatura config, built once."""
+    global _config
+    if _config is None:
+        config = use_config()
+        config.set("DEFAULT", "user-agent", USER_AGENT)
+        _config = config
+    return _config
+
+def get_http_session() -> requests.Session:
+    """Return the shared keep-alive session used for page fetches."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=FETCH_WORKERS * 4, pool_maxsize=FETCH_WORKERS * 2)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": USER_AGENT})
+                if not VERIFY_TLS:
+                    session.verify = False
+                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                _session = session
+    return _session
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the keep-alive async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=FETCH_WORKERS * 8, max_keepalive_connections=FETCH_WORKERS * 2),
+            follow_redirects=True,
+            verify=VERIFY_TLS
+        )
+        _async_clients[loop] = client
+    return client
+
+def _validator_headers(cached: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Conditional GET headers for a cached page."""
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+def _wants_body(response) -> bool:
+    """Whether a streamed response's body should be read: a 200 not declared larger than MAX_PAGE_BYTES."""
+    length = response.headers.get("Content-Length")
+    return response.status_code == 200 and not (length and length.isdigit() and int(length) > MAX_PAGE_BYTES)
+
+def _add_chunk(body: bytearray, chunk: bytes) -> bool:
+    """Append a chunk of the body; False once it exceeds MAX_PAGE_BYTES."""
+    body.extend(chunk)
+    return len(body) <= MAX_PAGE_BYTES
+
+def _page_from_response(url: str, response, cached: Optional[Dict[str, Any]],
+                        body: Optional[bytes]) -> Dict[str, Any]:
+    """
+    Turn a streamed requests or httpx response into the dict returned by fetch_page.
+    
+    body is what was read of it: None when it was not read because it is
+    larger than MAX_PAGE_BYTES.
+    """
+    page = {"html": None, "etag": None, "last_modified": None, "not_modified": False}
+    if response.status_code == 304 and cached:
+        page["not_modified"] = True
+        return page
+    if response.status_code != 200:
+        logger.warning(f"Could not download {url}: HTTP {response.status_code}")
+        return page
+    if body is None:
+        logger.warning(f"Page too large, skipping: {url}")
+        return page
+    # Left undecoded: trafilatura detects the charset from the bytes and <meta charset>,
+    # whereas requests assumes ISO-8859-1 for text/html without one
+    page["html"] = bytes(body)
+    page["etag"] = response.headers.get("ETag")
+    page["last_modified"] = response.headers.get("Last-Modified")
+    return page
+
+def fetch_page(url: str, timeout: float = URL_TIMEOUT, cached: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Download a page over the shared connection pool.
+    
+    When a cached entry with an ETag or Last-Modified is given, the request is
+    conditional and a 304 comes back as not_modified without a body.
     
+    The body is streamed and the download abandoned as soon as it exceeds
+    MAX_PAGE_BYTES.
+    
+    Returns:
+        Dict with html (the undecoded body, None on failure), etag, last_modified and not_modified
+    """
     try:
-        # Configure Trafilatura
-        config = use_config()
-        config.set("DEFAULT", "user-agent", 
-                  "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/121.0.0.0 Safari/537.36")
-        
-        # Fetch URL
-        downloaded = fetch_url(url, config=config, no_ssl=True)
-        if not downloaded:
-            logger.warning(f"Could not download: {url}")
-            return None
-            
-        # Extract content
-        content = extract(downloaded, favor_precision=True)
+        with get_http_session().get(url, timeout=timeout, headers=_validator_headers(cached), stream=True) as response:
+            body = None
+            if _wants_body(response):
+                body = bytearray()
+                for chunk in response.iter_content(READ_CHUNK_BYTES):
+                    if not _add_chunk(body, chunk):
+                        body = None
+                        break
+            return _page_from_response(url, response, cached, body)
+    except Exception as e:
+        logger.warning(f"Could not download {url}: {str(e)}")
+        return {"html": None, "etag": None, "last_modified": None, "not_modified": False}
+
+async def async_fetch_page(url: str, timeout: float = URL_TIMEOUT, cached: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Async version of fetch_page over the event loop's httpx client."""
+    try:
+        client = get_async_http_client()
+        async with client.stream("GET", url, timeout=timeout, headers=_validator_headers(cached)) as response:
+            body = None
+            if _wants_body(response):
+                body = bytearray()
+                async for chunk in response.aiter_bytes(READ_CHUNK_BYTES):
+                    if not _add_chunk(body, chunk):
+                        body = None
+                        break
+            return _page_from_response(url, response, cached, body)
+    except Exception as e:
+        logger.warning(f"Could not download {url}: {str(e)}")
+        return {"html": None, "etag": None, "last_modified": None, "not_modified": False}
+
+def extract_text(html: Union[str, bytes], url: str = "") -> Optional[str]:
+    """Extract relevant article text from downloaded HTML (bytes are decoded by trafilatura)."""
+    try:
+        content = extract(html, favor_precision=True)
         
         if content and content_is_relevant(content):
             logger.info(f"Extracted content from: {url}")
@@ -110,13 +296,205 @@ def extract_content_from_url(url: str) -> Optional[str]:
         logger.error(f"Content extraction failed for {url}: {str(e)}")
         return None
 
-def web_search_tool(query: str, num_results: int = 3) -> List[Dict[str, Any]]:
+def extract_content_from_url(url: str) -> Optional[str]:
+    """Extract content from URL using Trafilatura."""
+    
+    try:
+        # Fetch URL
+        downloaded = fetch_url(url, config=get_trafilatura_config(), no_ssl=not VERIFY_TLS)
+        if not downloaded:
+            logger.warning(f"Could not download: {url}")
+            return None
+            
+        return extract_text(downloaded, url)
+            
+    except Exception as e:
+        logger.error(f"Content extraction failed for {url}: {str(e)}")
+        return None
+
+def _extract_and_cache(url: str, page: Dict[str, Any]) -> Optional[str]:
+    """Extract a downloaded page and cache the result with its validators."""
+    content = extract_text(page["html"], url)
+    # Irrelevant pages are cached too so they are not downloaded again
+    page_cache.set(url, {"content": content, "etag": page["etag"], "last_modified": page["last_modified"]})
+    return content
+
+def _revalidated_content(url: str, page: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+    """On a 304, refresh the cached extraction and return (True, content)."""
+    stale = page_cache.peek(url) if page["not_modified"] else None
+    if stale is None:
+        return False, None
+    page_cache.set(url, stale)
+    return True, stale["content"]
+
+def _cached_contents(urls: List[str]) -> Tuple[Dict[str, Optional[str]], int, List[str]]:
+    """Fill contents from fresh page cache entries; returns (contents, good count, urls to fetch)."""
+    contents: Dict[str, Optional[str]] = {url: None for url in urls}
+    good = 0
+    to_fetch = []
+    for url in urls:
+        cached = page_cache.get(url)
+        if cached is None:
+            to_fetch.append(url)
+        elif cached["content"]:
+            contents[url] = cached["content"]
+            good += 1
+    return contents, good, to_fetch
+
+def fetch_contents(
+    urls: List[str],
+    max_good: Optional[int] = None,
+    max_workers: int = FETCH_WORKERS,
+    url_timeout: float = URL_TIMEOUT,
+    deadline: float = FETCH_DEADLINE,
+) -> Dict[str, Optional[str]]:
+    """
+    Fetch and extract several pages concurrently.
+    
+    Downloads run on a bounded pool over one keep-alive session and each finished
+    page is handed to a separate extraction pool, so parsing never holds up a fetch.
+    Fresh pages come from the page cache; expired ones are revalidated with their
+    ETag/Last-Modified. Stops early once max_good pages have relevant content, or
+    when the overall deadline passes.
+    
+    Returns:
+        Mapping of url to extracted content (None when missing, irrelevant or unfinished)
+    """
+    end_time = time.monotonic() + deadline
+    contents, good, to_fetch = _cached_contents(urls)
+    
+    if not to_fetch or (max_good is not None and good >= max_good):
+        return contents
+    
+    fetch_pool = ThreadPoolExecutor(max_workers=min(max_workers, len(to_fetch)), thread_name_prefix="web-fetch")
+    extract_pool = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="web-extract")
+    
+    def fetch_with_validators(url: str) -> Dict[str, Any]:
+        # Expired entries still carry the ETag/Last-Modified for a conditional GET
+        return fetch_page(url, url_timeout, page_cache.peek(url))
+    
+    try:
+        pending = {fetch_pool.submit(fetch_with_validators, url): ("fetch", url) for url in to_fetch}
+        
+        while pending:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Page fetch deadline of {deadline}s reached with {len(pending)} pages pending")
+                break
+            
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, url = pending.pop(future)
+                result = future.result()
+                
+                if stage == "fetch":
+                    # 304: the cached extraction is still current
+                    revalidated, content = _revalidated_content(url, result)
+                    if revalidated:
+                        if content:
+                            contents[url] = content
+                            good += 1
+                    elif result["html"]:
+                        pending[extract_pool.submit(_extract_and_cache, url, result)] = ("extract", url)
+                elif result:
+                    contents[url] = result
+                    good += 1
+            
+            if max_good is not None and good >= max_good:
+                logger.info(f"Got {good} relevant pages, skipping {len(pending)} remaining")
+                break
+    finally:
+        # In-flight requests finish on their own timeout; nothing waits for them
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        extract_pool.shutdown(wait=False, cancel_futures=True)
+    
+    return contents
+
+async def async_fetch_contents(
+    urls: List[str],
+    max_good: Optional[int] = None,
+    max_workers: int = FETCH_WORKERS,
+    url_timeout: float = URL_TIMEOUT,
+    deadline: float = FETCH_DEADLINE,
+) -> Dict[str, Optional[str]]:
+    """
+    Async version of fetch_contents.
+    
+    Downloads share the event loop's httpx client, at most max_workers at a time,
+    and extraction runs in the default executor. Same caching, early exit and
+    deadline behaviour; unfinished downloads are cancelled.
+    """
+    contents, good, to_fetch = _cached_contents(urls)
+    
+    if not to_fetch or (max_good is not None and good >= max_good):
+        return contents
+    
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + deadline
+    semaphore = asyncio.Semaphore(max_workers)
+    
+    async def fetch_and_extract(url: str) -> Optional[str]:
+        async with semaphore:
+            page = await async_fetch_page(url, url_timeout, page_cache.peek(url))
+        revalidated, content = _revalidated_content(url, page)
+        if revalidated:
+            return content
+        if page["html"]:
+            return await loop.run_in_executor(None, _extract_and_cache, url, page)
+        return None
+    
+    pending = {asyncio.ensure_future(fetch_and_extract(url)): url for url in to_fetch}
+    try:
+        while pending:
+            remaining = end_time - loop.time()
+            if remaining <= 0:
+                logger.warning(f"Page fetch deadline of {deadline}s reached with {len(pending)} pages pending")
+                break
+            
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                url = pending.pop(task)
+                content = task.result()
+                if content:
+                    contents[url] = content
+                    good += 1
+            
+            if max_good is not None and good >= max_good:
+                logger.info(f"Got {good} relevant pages, skipping {len(pending)} remaining")
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    return contents
+
+def _build_results(articles: List[Dict[str, Any]], contents: Dict[str, Optional[str]]) -> List[Dict[str, Any]]:
+    """Combine search results with fetched page contents, falling back to snippets."""
+    processed_results = []
+    for article in articles:
+        content = contents.get(article["url"])
+        
+        # Create result object with full metadata
+        result = {
+            "title": article['title'],
+            "url": article['url'],
+            "source": article['source'],
+            "date": article['date'],
+            "content": content or article['snippet'],
+            "is_snippet": content is None
+        }
+        processed_results.append(result)
+    return processed_results
+
+def web_search_tool(query: str, num_results: int = 3, max_good: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Main web search function for agent use.
     
     Args:
         query: Search query string
         num_results: Number of results to return
+        max_good: Stop fetching pages once this many have relevant content;
+            the rest fall back to their search snippet
         
     Returns:
         List of result objects with all metadata and content
@@ -131,27 +509,39 @@ def web_search_tool(query: str, num_results: int = 3) -> List[Dict[str, Any]]:
         if not search_results["articles"]:
             return []
         
-        processed_results = []
+        contents = fetch_contents([article["url"] for article in search_results["articles"]], max_good=max_good)
+        return _build_results(search_results["articles"], contents)
+        
+    except WebSearchError as e:
+        logger.error(f"Web search error: {str(e)}")
+        return []
+    except Exception as e:
+        logger.error(f"Unexpected error in web_search_tool: {str(e)}")
+        return []
+
+async def async_web_search_tool(query: str, num_results: int = 3, max_good: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Async version of web_search_tool.
+    
+    The SerpAPI client is blocking, so the search runs in a worker thread;
+    pages are then fetched with async_fetch_contents.
+    """
+    
+    try:
+        search_results = await asyncio.to_thread(get_urls_from_google_search, query, num=num_results)
         
-        for article in search_results["articles"]:
-            content = extract_content_from_url(article["url"])
+        if search_results["status"] != "Success":
+            return []
             
-            # Create result object with full metadata
-            result = {
-                "title": article['title'],
-                "url": article['url'],
-                "source": article['source'],
-                "date": article['date'],
-                "content": content or article['snippet'],
-                "is_snippet": content is None
-            }
-            processed_results.append(result)
-        
-        return processed_results
+        if not search_results["articles"]:
+            return []
+        
+        contents = await async_fetch_contents([article["url"] for article in search_results["articles"]], max_good=max_good)
+        return _build_results(search_results["articles"], contents)
         
     except WebSearchError as e:
         logger.error(f"Web search error: {str(e)}")
         return []
     except Exception as e:
-        logger.error(f"Unexpected error in web_search_tool: {str(e)}")
+        logger.error(f"Unexpected error in async_web_search_tool: {str(e)}")
         return []
\ No newline at end of file
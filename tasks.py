@@ -9,10 +9,15 @@ def setup(c):
     print("Setup complete! Edit .env with your API keys")
 
 @task
-def process(c):
-    """Process data and create vector database"""
+def process(c, full=False, data=None, collection=None):
+    """Process data and update the vector database (--full rebuilds it; --data takes a file or directory)"""
+    options = " --full" if full else ""
+    if data:
+        options += f" --data {data}"
+    if collection:
+        options += f" --collection {collection}"
     print("Processing data...")
-    c.run("cd src && python preprocessing/main.py")
+    c.run(f"cd src && python preprocessing/main.py{options}")
     print("Data processing complete!")
 
 @task
@@ -27,6 +32,33 @@ def test(c):
     print("Running tests...")
     c.run("pytest tests/ -v")
 
+@task
+def bench(c):
+    """Run performance benchmarks"""
+    print("Running benchmarks...")
+    c.run("python benchmarks/bench_model_registry.py")
+    c.run("python benchmarks/bench_async_load.py")
+    c.run("python benchmarks/bench_sqlite_concurrency.py")
+    c.run("python benchmarks/bench_chat_db_indexes.py")
+    c.run("python benchmarks/bench_token_budget.py")
+    c.run("python benchmarks/bench_truncate_content.py")
+    c.run("python benchmarks/bench_ingest.py --rows 100000")
+    c.run("python benchmarks/bench_chunker_memory.py")
+    c.run("python benchmarks/bench_filtered_retrieval.py")
+
+@task
+def purge(c, days=None, max_per_user=None, vacuum=False):
+    """Delete old conversations from the chat database and release the space"""
+    options = ""
+    if days:
+        options += f" --days {days}"
+    if max_per_user:
+        options += f" --max-per-user {max_per_user}"
+    if vacuum:
+        options += " --vacuum"
+    print("Purging conversations...")
+    c.run(f"cd src && python app/retention.py{options}")
+
 @task
 def clean(c):
     """Clean up generated files"""
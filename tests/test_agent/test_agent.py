@@ -1,40 +1,42 @@
 import pytest
 import sys
 import os
+import importlib
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
-from unittest.mock import Mock, MagicMock
-
-# Mock ALL the complex dependencies BEFORE importing
-sys.modules['langgraph'] = Mock()
-sys.modules['langgraph.graph'] = Mock()
-sys.modules['agent.agent_state'] = Mock()
-sys.modules['agent.llm_generator'] = Mock()
-sys.modules['loguru'] = Mock()
-
-# Mock tools
-sys.modules['tools'] = Mock()
-sys.modules['tools.rag_tool'] = Mock()
-sys.modules['tools.web_search'] = Mock()
-sys.modules['tools.classifier'] = Mock()
+from unittest.mock import Mock, patch
+# Real dependencies of the agent modules, imported before the stubs so they outlive them
+# (numpy cannot be imported a second time in one process)
+for module in ("concurrent.futures", "numpy"):
+    importlib.import_module(module)
 
 # Mock specific classes that agent imports
 mock_state_graph = Mock()
 mock_end = Mock()
 mock_llm_generator = Mock()
 
-# Set up the mocks properly
-sys.modules['langgraph.graph'].StateGraph = mock_state_graph
-sys.modules['langgraph.graph'].END = mock_end
-sys.modules['agent.llm_generator'].LLMGenerator = mock_llm_generator
-
-# Mock the functions from tools
-sys.modules['tools.rag_tool'].rag_search = Mock(return_value=[])
-sys.modules['tools.web_search'].web_search_tool = Mock(return_value=[])
-sys.modules['tools.classifier'].Classifier = Mock()
+# Mock ALL the complex dependencies, only while the agent modules are imported:
+# left in sys.modules they would replace the real packages for every other test file
+stubs = {
+    'langgraph': Mock(),
+    'langgraph.graph': Mock(StateGraph=mock_state_graph, END=mock_end),
+    'agent.agent_state': Mock(),
+    'agent.llm_generator': Mock(LLMGenerator=mock_llm_generator),
+    'loguru': Mock(),
+    # Mock tools
+    'tools': Mock(),
+    'tools.rag_tool': Mock(rag_search=Mock(return_value=[])),
+    'tools.web_search': Mock(web_search_tool=Mock(return_value=[])),
+    'tools.classifier': Mock(Classifier=Mock()),
+}
 
 # Now import the actual agent
-from agent.agent import LangGraphAgent
+with patch.dict(sys.modules, stubs):
+    from agent.agent import LangGraphAgent
+    from agent.async_agent import AsyncLangGraphAgent
+    agent_modules = {name: sys.modules[name] for name in ('agent.agent', 'agent.async_agent')}
+# Tests patch names on these modules, so they stay importable (bound to the stubs)
+sys.modules.update(agent_modules)
 
 
 def test_agent_can_be_created():
@@ -105,4 +107,282 @@ def test_agent_with_custom_threshold():
     
     agent = LangGraphAgent(threshold=0.8)
     
-    assert agent.threshold == 0.8
\ No newline at end of file
+    assert agent.threshold == 0.8
+
+
+def test_rag_node_shares_query_embedding():
+    """Test the RAG node encodes the query once and reuses the vector."""
+    from unittest.mock import patch
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent()
+    agent.classifier = Mock()
+    agent.classifier.embed_query.return_value = [0.1, 0.2]
+    agent.classifier.score.return_value = 0.9
+    
+    chunks = [{"text": "Remote workers in Denver prefer coffee shops"}]
+    with patch('agent.agent.rag_search', return_value=chunks) as mock_rag:
+        state = agent._rag_node({"original_query": "Denver remote workers"})
+    
+    agent.classifier.embed_query.assert_called_once_with("Denver remote workers")
+    assert mock_rag.call_args.kwargs["query_embedding"] == [0.1, 0.2]
+    # The context packer (on by default) scores chunks from their stored vectors
+    assert mock_rag.call_args.kwargs["include_embeddings"] is True
+    assert agent.classifier.score.call_args.args[2] == [0.1, 0.2]
+    assert state["query_embedding"] == [0.1, 0.2]
+
+
+def test_rag_node_scores_stored_chunk_embeddings():
+    """Test chunk-embedding score mode uses the vectors returned by retrieval."""
+    from unittest.mock import patch
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(rag_score_mode="max")
+    agent.classifier = Mock()
+    agent.classifier.score_chunks.return_value = 0.8
+    
+    chunks = [
+        {"text": "Remote workers in Denver prefer coffee shops", "embedding": [1.0, 0.0]},
+        {"text": "Remote workers in Austin take walking meetings", "embedding": [0.0, 1.0]},
+    ]
+    with patch('agent.agent.rag_search', return_value=chunks) as mock_rag:
+        state = agent._rag_node({"original_query": "Denver", "query_embedding": [1.0, 0.0]})
+    
+    assert mock_rag.call_args.kwargs["include_embeddings"] is True
+    assert agent.classifier.score_chunks.call_args.args[1] == [[1.0, 0.0], [0.0, 1.0]]
+    assert agent.classifier.score_chunks.call_args.kwargs["aggregate"] == "max"
+    agent.classifier.score.assert_not_called()
+    assert state["rag_score"] == 0.8
+
+
+def test_route_rag_cancels_speculative_web_search():
+    """Test a good RAG score cancels the prefetched web search."""
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(threshold=0.5, speculative_web=True)
+    prefetch = Mock()
+    
+    assert agent._route_rag({"rag_score": 0.7, "web_prefetch": prefetch}) == "good"
+    prefetch.cancel.assert_called_once()
+
+
+def test_web_node_uses_speculative_result():
+    """Test the web node waits on the prefetch instead of searching again."""
+    from unittest.mock import patch
+    from concurrent.futures import Future
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(speculative_web=True)
+    agent.classifier = Mock()
+    agent.classifier.score.return_value = 0.6
+    
+    prefetch = Future()
+    prefetch.set_result(([{"content": "Remote workers in Denver prefer coffee shops"}], 1.5))
+    
+    with patch('agent.agent.web_search_tool') as mock_web:
+        state = agent._web_node({"original_query": "Denver", "web_prefetch": prefetch})
+    
+    mock_web.assert_not_called()
+    assert state["web_results"][0]["content"].startswith("Remote workers")
+    assert 0.0 < state["latency_saved"] <= 1.5
+
+
+def test_web_search_stops_after_enough_good_pages():
+    """Test the agent's web search asks for early exit once enough pages are relevant."""
+    from unittest.mock import patch
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(web_num_results=5, web_max_good=2)
+    
+    with patch('agent.agent.web_search_tool', return_value=[]) as mock_web:
+        agent._timed_web_search("Denver")
+    
+    mock_web.assert_called_once_with("Denver", num_results=5, max_good=2)
+
+
+def test_answer_served_from_semantic_cache():
+    """Test a cached standalone question skips the graph, while history bypasses the cache."""
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(semantic_cache=True)
+    agent.classifier = Mock()
+    agent.classifier.embed_query.return_value = [1.0, 0.0]
+    agent.answer_cache.index_version = lambda: 1
+    agent.answer_cache.store("Denver?", [1.0, 0.0], {"answer": "cached", "method": "rag"})
+    
+    result = agent.answer("Denver?")
+    assert result["answer"] == "cached"
+    assert result["cache_hit"] is True
+    agent.graph.invoke.assert_not_called()
+    
+    agent.graph.invoke.return_value = {"final_answer": "fresh", "method_used": "rag", "rag_score": 0.9, "web_score": 0.0}
+    result = agent.answer("Denver?", history=[{"role": "user", "content": "Tell me about Seattle"}])
+    assert result["answer"] == "fresh"
+    agent.graph.invoke.assert_called_once()
+
+
+def test_generate_node_streams_tokens():
+    """Test the generate node forwards deltas and keeps the full answer."""
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    tokens = []
+    agent = LangGraphAgent(on_token=tokens.append)
+    agent.llm = Mock()
+    agent.llm.stream_answer.return_value = iter(["Remote ", "workers"])
+    
+    state = agent._generate_node({"original_query": "q", "rag_score": 0.9, "rag_content": "content", "history": []})
+    
+    assert tokens == ["Remote ", "workers"]
+    assert state["final_answer"] == "Remote workers"
+    agent.llm.generate_answer.assert_not_called()
+
+
+def test_generate_node_packs_selected_content():
+    """Test the answer is generated from the packed passages of the selected results."""
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent()
+    agent.llm = Mock()
+    agent.llm.generate_answer.return_value = "42%"
+    agent.packer = Mock()
+    agent.packer.pack.return_value = "[1] Survey (https://a.example)\n42% prefer coffee shops."
+    
+    agent._generate_node({
+        "original_query": "Denver?", "rag_score": 0.1, "web_content": "whole page", "history": [],
+        "web_results": [{"title": "Survey", "url": "https://a.example", "content": "whole page"}, {"title": "Empty"}]
+    })
+    
+    query, sources, _ = agent.packer.pack.call_args[0]
+    assert sources == [{"text": "whole page", "tag": "Survey (https://a.example)"}]
+    assert agent.llm.generate_answer.call_args[0][1] == "[1] Survey (https://a.example)\n42% prefer coffee shops."
+
+
+def test_response_and_cache_leave_out_chunk_embeddings():
+    """Test stored chunk vectors used for scoring are not returned or cached."""
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = LangGraphAgent(semantic_cache=True)
+    agent.classifier = Mock()
+    agent.classifier.embed_query.return_value = [1.0, 0.0]
+    agent.answer_cache.index_version = lambda: 1
+    agent.graph.invoke.return_value = {
+        "final_answer": "42%", "method_used": "rag", "rag_score": 0.9, "web_score": 0.0,
+        "rag_chunks": [{"text": "Denver | 42%", "score": 0.9, "embedding": [0.1] * 768}]
+    }
+    
+    response = agent.answer("Denver?")
+    cached = agent.answer("Denver?")
+    
+    assert response["rag_chunks"] == [{"text": "Denver | 42%", "score": 0.9}]
+    assert cached["cache_hit"] is True
+    assert cached["rag_chunks"] == [{"text": "Denver | 42%", "score": 0.9}]
+
+
+def test_async_answer_awaits_graph():
+    """Test the async agent runs the graph with ainvoke and builds the same response."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = AsyncLangGraphAgent()
+    agent.graph.ainvoke = AsyncMock(return_value={"final_answer": "async", "method_used": "rag", "rag_score": 0.9, "web_score": 0.0})
+    
+    result = asyncio.run(agent.answer("Denver?"))
+    
+    assert result["answer"] == "async"
+    assert result["cache_hit"] is False
+    agent.graph.invoke.assert_not_called()
+
+
+def test_async_answer_cache_runs_off_the_event_loop():
+    """Test semantic cache lookups and stores, which may read the index version, run on the CPU pool."""
+    import asyncio
+    import threading
+    from unittest.mock import AsyncMock
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = AsyncLangGraphAgent(semantic_cache=True)
+    agent.classifier = Mock()
+    agent.classifier.embed_query.return_value = [1.0, 0.0]
+    agent.graph.ainvoke = AsyncMock(return_value={"final_answer": "async", "method_used": "rag", "rag_score": 0.9, "web_score": 0.0})
+    threads = []
+    agent.answer_cache.version_ttl = 0
+    agent.answer_cache.index_version = lambda: threads.append(threading.current_thread().name)
+    
+    first = asyncio.run(agent.answer("Denver?"))
+    second = asyncio.run(agent.answer("Denver?"))
+    
+    assert first["cache_hit"] is False
+    assert second["cache_hit"] is True
+    assert len(threads) == 3
+    assert all(name.startswith("agent-cpu") for name in threads)
+
+
+def test_async_speculative_prefetch_is_cancelled():
+    """Test a good RAG score cancels the prefetch task on the event loop."""
+    import asyncio
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    agent = AsyncLangGraphAgent(speculative_web=True)
+    
+    async def route_with_prefetch():
+        prefetch = asyncio.ensure_future(asyncio.sleep(10))
+        route = await agent._route_rag({"rag_score": 0.7, "web_prefetch": prefetch})
+        await asyncio.sleep(0)
+        return route, prefetch.cancelled()
+    
+    assert asyncio.run(route_with_prefetch()) == ("good", True)
+
+
+def test_async_generate_node_streams_tokens():
+    """Test the async generate node forwards deltas from the async stream."""
+    import asyncio
+
+    mock_workflow = Mock()
+    mock_workflow.compile.return_value = Mock()
+    mock_state_graph.return_value = mock_workflow
+    
+    async def deltas(*args):
+        for delta in ["Remote ", "workers"]:
+            yield delta
+    
+    tokens = []
+    agent = AsyncLangGraphAgent(on_token=tokens.append)
+    agent.llm = Mock()
+    agent.llm.astream_answer.side_effect = deltas
+    
+    state = asyncio.run(agent._generate_node({"original_query": "q", "rag_score": 0.9, "rag_content": "content", "history": []}))
+    
+    assert tokens == ["Remote ", "workers"]
+    assert state["final_answer"] == "Remote workers"
\ No newline at end of file
@@ -0,0 +1,72 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+import numpy as np
+from unittest.mock import Mock
+
+from agent.context_packer import ContextPacker
+
+VOCABULARY = ["denver", "coffee", "remote", "furniture", "lighting", "seattle"]
+
+
+def bag_of_words(texts):
+    """Stand-in encoder: one dimension per vocabulary word."""
+    return np.array([[text.lower().count(word) for word in VOCABULARY] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def packer():
+    classifier = Mock()
+    classifier.model.encode.side_effect = bag_of_words
+    classifier.embed_query.side_effect = lambda query: bag_of_words([query])[0].tolist()
+    llm = Mock()
+    llm.count_tokens.side_effect = lambda text: len(text.split())
+    return ContextPacker(classifier, llm, max_tokens=30)
+
+
+def test_pack_keeps_relevant_passages_with_tags(packer):
+    """Test the passages closest to the query fill the budget, tagged and in source order."""
+    sources = [
+        {"text": "Office furniture and lighting matter.\n\nRemote workers in Denver like coffee shops.", "tag": "Survey (https://a.example)"},
+        {"text": "Lighting and furniture again, lighting everywhere.", "tag": "Blog (https://b.example)"},
+        {"text": "Seattle remote workers prefer coffee at home.", "tag": "News (https://c.example)"},
+    ]
+
+    packed = packer.pack("Do remote workers in Denver like coffee?", sources)
+
+    assert packed == ("[1] Survey (https://a.example)\nRemote workers in Denver like coffee shops.\n\n"
+                      "[3] News (https://c.example)\nSeattle remote workers prefer coffee at home.")
+
+
+def test_pack_reuses_stored_chunk_embeddings(packer):
+    """Test single-passage chunks are scored from their stored embedding without re-encoding."""
+    sources = [
+        {"text": "Denver coffee shops.", "tag": "Knowledge base, chunk 0", "embedding": bag_of_words(["denver coffee"])[0].tolist()},
+        {"text": "Furniture.", "tag": "Knowledge base, chunk 1", "embedding": bag_of_words(["furniture"])[0].tolist()},
+    ]
+
+    packed = packer.pack("Denver coffee?", sources, query_embedding=bag_of_words(["denver coffee"])[0].tolist())
+
+    packer.classifier.model.encode.assert_not_called()
+    assert packed.startswith("[1] Knowledge base, chunk 0\nDenver coffee shops.")
+
+
+def test_pack_encodes_at_most_max_encoded_passages(packer):
+    """Test long pages only have the max_encoded passages sharing most words with the question encoded."""
+    packer.max_encoded = 2
+    sources = [{"text": "Remote work.\n\nFurniture.\n\nLighting.\n\nDenver coffee shops.", "tag": "Web"}]
+
+    packed = packer.pack("Remote work in Denver, coffee?", sources)
+
+    assert packer.classifier.model.encode.call_args.args[0] == ["Remote work.", "Denver coffee shops."]
+    assert "Denver coffee shops." in packed
+    assert "Furniture." not in packed
+
+
+def test_pack_falls_back_without_encoder(packer):
+    """Test packing gives up (None) when the encoder is unavailable."""
+    packer.classifier.model = None
+
+    assert packer.pack("Denver?", [{"text": "Denver coffee shops.", "tag": "Web"}]) is None
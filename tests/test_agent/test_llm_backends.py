@@ -0,0 +1,77 @@
+import pytest
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from unittest.mock import patch, Mock
+
+from agent.llm_backends import FakeBackend, LLMBackend, OpenAIBackend, create_backend
+from agent.llm_generator import LLMGenerator
+
+
+@pytest.fixture
+def fake_generator(monkeypatch):
+    """LLMGenerator on the fake backend chosen through LLM_BACKEND."""
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    tokenizer = Mock()
+    tokenizer.encode.side_effect = lambda text: text.split()
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        yield LLMGenerator()
+
+
+def test_create_backend_reads_environment(monkeypatch):
+    """Test LLM_BACKEND selects the backend and unknown names are rejected."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY", "0.25")
+
+    backend = create_backend()
+
+    assert isinstance(backend, FakeBackend)
+    assert backend.latency == 0.25
+    assert isinstance(create_backend("openai"), OpenAIBackend)
+    with pytest.raises(ValueError):
+        create_backend("local")  # no base_url
+    with pytest.raises(ValueError):
+        create_backend("llamas")
+
+
+def test_incomplete_backend_cannot_be_created():
+    """Test a backend missing interface methods fails at construction, not mid-answer."""
+    class CompleteOnly(LLMBackend):
+        def complete(self, prompt, temperature, max_tokens):
+            return "answer"
+
+    with pytest.raises(TypeError):
+        CompleteOnly()
+
+
+def test_fake_backend_answers_deterministically(fake_generator):
+    """Test the fake backend answers the prompt's question the same way on every path."""
+    answer = fake_generator.generate_answer("Where do Denver workers go?", "Coffee shops.")
+    deltas = list(fake_generator.stream_answer("Where do Denver workers go?", "Coffee shops."))
+
+    async def run():
+        return await fake_generator.agenerate_answer("Where do Denver workers go?", "Coffee shops.")
+
+    assert answer == "Offline answer to: Where do Denver workers go?"
+    assert "".join(deltas) == answer
+    assert len(deltas) == len(answer.split())
+    assert asyncio.run(run()) == answer
+
+
+def test_fake_backend_latency_is_simulated():
+    """Test the configured latency is awaited before the first delta."""
+    backend = FakeBackend(latency=0.05)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = await backend.astream("Current Question: hi", 0.3, 100).__anext__()
+        return first, loop.time() - start
+
+    first, elapsed = asyncio.run(run())
+
+    assert first == "Offline"
+    assert elapsed >= 0.05
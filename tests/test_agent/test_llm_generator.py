@@ -0,0 +1,195 @@
+import pytest
+import sys
+import os
+import json
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, Mock
+
+from agent.llm_generator import LLMGenerator
+
+
+ANSWER_DELTAS = ["42% of remote ", "workers in Denver ", "prefer coffee shops."]
+
+
+@pytest.fixture
+def fake_openai_server():
+    """Local stand-in for the OpenAI chat completions endpoint."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.server.requests.append(body)
+
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for delta in ANSWER_DELTAS:
+                    chunk = {
+                        "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                return
+
+            payload = json.dumps({
+                "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(ANSWER_DELTAS)}}]
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def generator(fake_openai_server, monkeypatch):
+    """LLMGenerator pointed at the fake server, with a whitespace tokenizer."""
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    tokenizer = Mock()
+    tokenizer.encode.side_effect = lambda text: text.split()
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        yield LLMGenerator(base_url=f"http://127.0.0.1:{fake_openai_server.server_address[1]}/v1")
+
+
+def test_stream_answer_yields_deltas(generator, fake_openai_server):
+    """Test the streaming API yields every delta in order."""
+    deltas = list(generator.stream_answer("Denver?", "Remote workers in Denver like coffee shops."))
+
+    assert deltas == ANSWER_DELTAS
+    assert fake_openai_server.requests[0]["stream"] is True
+
+
+def test_generate_answer_matches_stream(generator):
+    """Test blocking and streaming generation produce the same text."""
+    answer = generator.generate_answer("Denver?", "Remote workers in Denver like coffee shops.")
+
+    assert answer == "".join(ANSWER_DELTAS)
+
+
+def test_stream_answer_reports_errors(generator):
+    """Test a failed request yields an error message instead of raising."""
+    generator.backend.client = Mock()
+    generator.backend.client.chat.completions.create.side_effect = Exception("boom")
+
+    deltas = list(generator.stream_answer("Denver?", "content"))
+
+    assert deltas == ["Error generating answer: boom"]
+
+
+def test_async_generation_matches_sync(generator):
+    """Test the AsyncOpenAI path returns the same answer and deltas."""
+    import asyncio
+
+    async def run():
+        answer = await generator.agenerate_answer("Denver?", "Remote workers in Denver like coffee shops.")
+        deltas = [delta async for delta in generator.astream_answer("Denver?", "Remote workers in Denver like coffee shops.")]
+        return answer, deltas
+
+    answer, deltas = asyncio.run(run())
+
+    assert answer == "".join(ANSWER_DELTAS)
+    assert deltas == ANSWER_DELTAS
+
+
+def test_local_backend_sends_configured_model_and_sampling(fake_openai_server, monkeypatch):
+    """Test the local-server backend uses LLM_* settings and needs no API key."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_BACKEND", "local")
+    monkeypatch.setenv("LLM_MODEL", "llama-3-8b")
+    monkeypatch.setenv("LLM_TEMPERATURE", "0")
+    monkeypatch.setenv("LLM_MAX_TOKENS", "256")
+    tokenizer = Mock()
+    tokenizer.encode.side_effect = lambda text: text.split()
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=tokenizer):
+        generator = LLMGenerator(base_url=f"http://127.0.0.1:{fake_openai_server.server_address[1]}/v1")
+
+    answer = generator.generate_answer("Denver?", "Remote workers in Denver like coffee shops.")
+
+    assert answer == "".join(ANSWER_DELTAS)
+    request = fake_openai_server.requests[0]
+    assert (request["model"], request["temperature"], request["max_tokens"]) == ("llama-3-8b", 0, 256)
+
+
+def test_token_counts_are_cached_and_stored_counts_reused(generator):
+    """Test repeated text and stored message counts are not re-encoded."""
+    encode = generator.tokenizer.encode
+    history = [
+        {"role": "user", "content": "Coffee shops in Denver?", "token_count": 4},
+        {"role": "assistant", "content": "Forty two percent.", "token_count": 3, "feedback": "like"},
+    ]
+
+    generator.build_prompt("Denver?", "Remote workers in Denver like coffee shops.", history)
+    encoded = [call.args[0] for call in encode.call_args_list]
+    prompt = generator.build_prompt("Denver?", "Remote workers in Denver like coffee shops.", history)
+
+    assert not any("Coffee shops in Denver?" in text for text in encoded)
+    assert not any("Current Question" in text and "Information" in text for text in encoded)
+    assert encode.call_count == len(encoded)
+    assert "Assistant: Forty two percent. [User liked this response]" in prompt
+
+
+@pytest.fixture
+def byte_generator(monkeypatch):
+    """LLMGenerator with an offline byte-level tiktoken encoding (one token per byte)."""
+    import tiktoken
+    import tiktoken_ext.openai_public
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    encoding = tiktoken.Encoding(
+        name="byte_level",
+        pat_str=tiktoken_ext.openai_public.r50k_pat_str,
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={}
+    )
+    with patch('agent.llm_generator.tiktoken.encoding_for_model', return_value=encoding):
+        yield LLMGenerator()
+
+
+def test_truncate_content_keeps_whole_sentences(byte_generator):
+    """Test the beginning is cut at a sentence end within the budget."""
+    content = " ".join(f"Sentence number {i} is about remote work." for i in range(500))
+
+    truncated, tokens = byte_generator._truncate_content(content, 300)
+
+    kept = truncated[:-len("\n\n[Content truncated due to length...]")]
+    assert truncated.endswith("[Content truncated due to length...]")
+    assert kept.endswith("remote work.") and content.startswith(kept)
+    assert tokens == len(truncated.encode()) <= 300
+
+
+def test_truncate_content_without_budget(byte_generator):
+    """Test a zero token budget returns only the truncation note."""
+    truncated, tokens = byte_generator._truncate_content("Some content.", 0)
+
+    assert truncated == "\n\n[Content truncated due to length...]"
+    assert tokens == len(truncated.encode())
+
+
+def test_truncate_content_keeps_best_passages(byte_generator):
+    """Test passages matching the question survive even when they come last."""
+    filler = "\n\n".join(f"Paragraph {i} covers office furniture and lighting." for i in range(200))
+    content = filler + "\n\nIn Denver, 42% of remote workers prefer coffee shops."
+
+    truncated = byte_generator.truncate_content(content, 200, query="Do remote workers in Denver like coffee shops?")
+
+    assert "In Denver, 42% of remote workers prefer coffee shops." in truncated
+    assert len(truncated.encode()) <= 200
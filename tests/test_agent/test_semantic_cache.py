@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from unittest.mock import patch
+from agent.semantic_cache import SemanticAnswerCache
+
+
+RESPONSE = {"answer": "42% of remote workers in Denver prefer coffee shops.", "method": "rag"}
+
+
+def test_lookup_returns_similar_question():
+    """Test a near-identical question hits and an unrelated one misses."""
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("Denver coffee shops?", [1.0, 0.0, 0.0], RESPONSE)
+
+    assert cache.lookup([0.99, 0.05, 0.0]) == RESPONSE
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_entries_expire():
+    """Test entries older than the TTL are not returned."""
+    cache = SemanticAnswerCache(ttl=60)
+
+    with patch('agent.semantic_cache.time.time', return_value=1000.0):
+        cache.store("q", [1.0, 0.0], RESPONSE)
+    with patch('agent.semantic_cache.time.time', return_value=1061.0):
+        assert cache.lookup([1.0, 0.0]) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Test the size bound evicts the least recently used answer."""
+    cache = SemanticAnswerCache(max_size=2)
+    cache.store("a", [1.0, 0.0, 0.0], {"answer": "a"})
+    cache.store("b", [0.0, 1.0, 0.0], {"answer": "b"})
+    cache.lookup([1.0, 0.0, 0.0])
+    cache.store("c", [0.0, 0.0, 1.0], {"answer": "c"})
+
+    assert cache.lookup([1.0, 0.0, 0.0]) == {"answer": "a"}
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+
+
+def test_reindex_invalidates_entries():
+    """Test a new knowledge base index version clears the cache."""
+    version = {"value": 1}
+    cache = SemanticAnswerCache(index_version=lambda: version["value"], version_ttl=0)
+    cache.store("q", [1.0, 0.0], RESPONSE)
+    assert cache.lookup([1.0, 0.0]) == RESPONSE
+
+    version["value"] = 2
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_index_version_is_reread_after_version_ttl():
+    """Test the index version is read once per version_ttl, not on every lookup and store."""
+    reads = []
+    version = {"value": 1}
+    def index_version():
+        reads.append(version["value"])
+        return version["value"]
+
+    cache = SemanticAnswerCache(index_version=index_version, version_ttl=30)
+    with patch('agent.semantic_cache.time.monotonic', return_value=1000.0):
+        cache.store("q", [1.0, 0.0], RESPONSE)
+        version["value"] = 2
+        for _ in range(5):
+            assert cache.lookup([1.0, 0.0]) == RESPONSE
+    assert reads == [1]
+
+    with patch('agent.semantic_cache.time.monotonic', return_value=1031.0):
+        assert cache.lookup([1.0, 0.0]) is None
+    assert reads == [1, 2]
+
+
+def test_missing_embedding_is_ignored():
+    """Test a failed question embedding neither stores nor hits."""
+    cache = SemanticAnswerCache()
+    cache.store("q", None, RESPONSE)
+    assert cache.lookup(None) is None
+    assert cache.stats()["size"] == 0
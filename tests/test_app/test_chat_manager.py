@@ -3,14 +3,21 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 
-sys.modules['app.database'] = Mock()
-sys.modules['agent.agent'] = Mock()
-sys.modules['loguru'] = Mock()
+# Stubbed only while the managers are imported, so test_database still gets the real app.database
+stubs = {
+    'app.database': Mock(),
+    'agent.agent': Mock(),
+    'agent.async_agent': Mock(),
+    'loguru': Mock(),
+}
 
-from app.chat_manager import ChatManager
+with patch.dict(sys.modules, stubs):
+    from app.chat_manager import ChatManager
+    from app.async_chat_manager import AsyncChatManager
+    from app.history_cache import HistoryCache
 
 
 def test_capture_thought():
@@ -25,6 +32,18 @@ def test_capture_thought():
     assert manager.current_thoughts[0] == "test thought"
 
 
+def test_capture_token_streams_to_callback():
+    """Test answer tokens are forwarded to the streaming callback."""
+    manager = object.__new__(ChatManager)
+    received = []
+    manager.streaming_callback = lambda kind, content: received.append((kind, content))
+    
+    manager._capture_token("Hel")
+    manager._capture_token("lo")
+    
+    assert received == [("token", "Hel"), ("token", "lo")]
+
+
 def test_generate_simple_title():
     """Test simple title generation."""
     manager = object.__new__(ChatManager)
@@ -48,4 +67,119 @@ def test_title_logic():
         title += "..."
     result = title.title()
     
-    assert result == "What Is Machine Learning And..."
\ No newline at end of file
+    assert result == "What Is Machine Learning And..."
+
+
+def test_async_chats_keep_turns_apart():
+    """Test concurrent async chats each get only their own thoughts and stream."""
+    import asyncio
+
+    manager = object.__new__(AsyncChatManager)
+    manager.db = Mock()
+    manager.history_cache = HistoryCache()
+    manager.db.get_conversation_messages.return_value = []
+    manager.db.persist_turn.return_value = 7
+
+    async def answer(message, history):
+        manager._capture_thought(f"thinking about {message}")
+        await asyncio.sleep(0.01)
+        manager._capture_token(message)
+        return {"answer": message.upper(), "method": "fallback"}
+
+    manager.agent = Mock()
+    manager.agent.answer = answer
+    streams = {"a": [], "b": []}
+
+    async def run():
+        return await asyncio.gather(
+            manager.chat(1, "a", conversation_id=1, streaming_callback=lambda *event: streams["a"].append(event)),
+            manager.chat(1, "b", conversation_id=2, streaming_callback=lambda *event: streams["b"].append(event))
+        )
+
+    first, second = asyncio.run(run())
+
+    assert first["thoughts"] == ["thinking about a"]
+    assert second["thoughts"] == ["thinking about b"]
+    assert streams["a"] == [("thought", "thinking about a"), ("token", "a"), ("answer", "A")]
+    assert streams["b"] == [("thought", "thinking about b"), ("token", "b"), ("answer", "B")]
+
+
+def test_chat_persists_turn_once():
+    """Test a turn is saved with one persist_turn call after the answer."""
+    manager = object.__new__(ChatManager)
+    manager.db = Mock()
+    manager.history_cache = HistoryCache()
+    manager.db.get_conversation_messages.return_value = [{"role": "user", "content": "Earlier"}]
+    manager.db.persist_turn.return_value = 11
+    manager.agent = Mock()
+    manager.agent.answer.return_value = {
+        "answer": "42%", "method": "web", "rag_score": 0.2, "web_score": 0.7,
+        "web_results": [{"url": "https://example.com", "title": "Denver", "content": "42%", "date": "2024"}]
+    }
+
+    result = manager.chat(1, "Coffee shops?", conversation_id=5)
+
+    assert result["message_id"] == 11
+    manager.agent.answer.assert_called_once_with("Coffee shops?", [{"role": "user", "content": "Earlier"}])
+    manager.db.add_message.assert_not_called()
+    args = manager.db.persist_turn.call_args[0]
+    assert args[:3] == (5, "Coffee shops?", "42%")
+    assert args[6][0]["type"] == "web"
+    assert args[6][0]["source"] == "https://example.com"
+
+def test_history_is_read_from_database_only_on_cold_miss():
+    """Test later turns reuse the cached window, including saved turns and feedback."""
+    manager = object.__new__(ChatManager)
+    manager.db = Mock()
+    manager.history_cache = HistoryCache(window=3)
+    manager.db.get_conversation_messages.return_value = [
+        {"id": 1, "role": "user", "content": "Earlier"},
+        {"id": 2, "role": "assistant", "content": "Answer", "feedback": None}
+    ]
+    manager.db.persist_turn.side_effect = [12, 14]
+    manager.agent = Mock()
+    manager.agent.answer.return_value = {"answer": "42%", "method": "fallback"}
+
+    manager.chat(1, "Coffee shops?", conversation_id=5)
+    manager.add_message_feedback(12, "like")
+    manager.chat(1, "And libraries?", conversation_id=5)
+
+    manager.db.get_conversation_messages.assert_called_once_with(5, limit=3)
+    history = manager.agent.answer.call_args[0][1]
+    assert [(m["role"], m["content"]) for m in history] == [
+        ("assistant", "Answer"), ("user", "Coffee shops?"), ("assistant", "42%")
+    ]
+    assert history[-1]["feedback"] == "like"
+
+
+def test_sessions_share_the_history_cache():
+    """Test a turn saved from one session is in the history another session sends."""
+    ChatManager.history_cache.clear()
+    db = Mock()
+    db.get_conversation_messages.return_value = [{"id": 1, "role": "user", "content": "Earlier"}]
+    db.persist_turn.side_effect = [12, 14]
+    sessions = []
+    for _ in range(2):
+        manager = object.__new__(ChatManager)
+        manager.db = db
+        manager.agent = Mock()
+        manager.agent.answer.return_value = {"answer": "42%", "method": "fallback"}
+        sessions.append(manager)
+
+    sessions[0].chat(1, "Coffee shops?", conversation_id=5)
+    sessions[1].chat(1, "And libraries?", conversation_id=5)
+
+    history = sessions[1].agent.answer.call_args[0][1]
+    assert [m["content"] for m in history] == ["Earlier", "Coffee shops?", "42%"]
+    db.get_conversation_messages.assert_called_once()
+    ChatManager.history_cache.clear()
+
+
+def test_history_saved_out_of_order_is_reloaded():
+    """Test a window is dropped when a turn that finished later saved older messages."""
+    cache = HistoryCache()
+    cache.set(5, [{"id": 1, "role": "user", "content": "Earlier"}])
+    cache.extend(5, [{"id": 3, "role": "assistant", "content": "B"}])
+    cache.extend(5, [{"id": 2, "role": "assistant", "content": "A"}])
+
+    assert cache.get(5) is None
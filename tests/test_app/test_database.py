@@ -0,0 +1,270 @@
+import pytest
+import sys
+import os
+import sqlite3
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from app.database import SQLiteChatDB, MIGRATIONS, SCHEMA_VERSION
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = SQLiteChatDB(str(tmp_path / "chat.db"))
+    yield database
+    database.close()
+
+
+def test_connections_use_wal_and_foreign_keys(db):
+    """Test pooled connections carry the configured pragmas."""
+    with db._connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_connections_are_reused(db):
+    """Test sequential calls borrow the same connection instead of reopening."""
+    with db._connection() as first:
+        pass
+    with db._connection() as second:
+        pass
+
+    assert first is second
+
+
+def test_failed_block_rolls_back(db):
+    """Test an exception inside a borrowed connection leaves no partial writes."""
+    user_id = db.get_or_create_user("dev@example.com")
+
+    with pytest.raises(RuntimeError):
+        with db._connection() as conn:
+            conn.execute("INSERT INTO conversations (user_id, title) VALUES (?, ?)", (user_id, "half"))
+            raise RuntimeError("boom")
+
+    assert db.get_user_conversations(user_id) == []
+
+
+def test_concurrent_writers_and_readers(db):
+    """Test writer and reader threads share the database without lock errors."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Load")
+    errors = []
+
+    def writer():
+        try:
+            for i in range(25):
+                db.add_message(conversation_id, 'user', f"message {i}")
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            for _ in range(25):
+                db.get_conversation_messages(conversation_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(4)] + [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(db.get_conversation_messages(conversation_id)) == 100
+
+
+def test_legacy_database_is_upgraded_in_place(tmp_path):
+    """Test an unversioned database keeps its rows and gains indexes and cascades."""
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    for statement in MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.execute("INSERT INTO users (email) VALUES ('dev@example.com')")
+    conn.execute("INSERT INTO conversations (user_id, title) VALUES (1, 'Denver')")
+    conn.execute("INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'Coffee shops?')")
+    conn.execute("INSERT INTO message_sources (message_id, type, score) VALUES (1, 'rag', 0.8)")
+    conn.commit()
+    conn.close()
+
+    db = SQLiteChatDB(db_path)
+    with db._connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM message_sources WHERE message_id = 1 ORDER BY score DESC"))
+        assert "idx_message_sources_message_score" in plan
+
+    assert db.get_conversation_messages(1)[0]["content"] == "Coffee shops?"
+    assert db.get_user_conversations(1)[0]["message_count"] == 1
+
+    # Reopening an up-to-date database is a no-op
+    SQLiteChatDB(db_path).close()
+    db.close()
+
+
+def test_deleting_conversation_cascades(db):
+    """Test messages and sources go with their conversation."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Denver")
+    message_id = db.add_message(conversation_id, 'assistant', "42%", "rag", 0.9, 0.0)
+    db.add_message_source(message_id, 'rag', "Knowledge Base", "Chunk", "42%", 0.9)
+
+    with db._connection() as conn:
+        conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    assert db.get_conversation_messages(conversation_id) == []
+    assert db.get_message_sources(message_id) == []
+
+
+def test_persist_turn_saves_everything_or_nothing(db):
+    """Test a turn is stored in one transaction, including its sources."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Denver")
+    sources = [
+        {"type": "rag", "source": "Knowledge Base", "title": "Chunk", "text": "Denver | 42%", "score": 0.9, "metadata": {"row": 3}},
+        {"type": "rag", "source": "Knowledge Base", "title": "Chunk", "text": "Seattle | 31%", "score": 0.4}
+    ]
+
+    message_id = db.persist_turn(conversation_id, "Coffee shops?", "42%", "rag", 0.9, 0.0, sources)
+
+    messages = db.get_conversation_messages(conversation_id)
+    assert [m["role"] for m in messages] == ["user", "assistant"]
+    assert messages[1]["id"] == message_id
+    assert [s["metadata"] for s in db.get_message_sources(message_id)] == [{"row": 3}, {}]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.persist_turn(conversation_id, "Again?", "No", "rag", 0.9, 0.0, [{"type": "invalid"}])
+
+    assert len(db.get_conversation_messages(conversation_id)) == 2
+
+
+def test_purge_by_age_and_quota_in_batches(db):
+    """Test retention removes stale and over-quota conversations across several batches."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_ids = [db.create_conversation(user_id, f"Chat {i}") for i in range(6)]
+    for cid in conversation_ids:
+        db.persist_turn(cid, "q", "a", "rag", 0.9, 0.0, [{"type": "rag", "text": "chunk", "score": 0.9}])
+    with db._connection() as conn:
+        conn.executemany("UPDATE conversations SET updated_at = datetime('now', ?) WHERE id = ?",
+                         [(f"-{10 - i} minutes", cid) for i, cid in enumerate(conversation_ids)])
+        conn.execute("UPDATE conversations SET updated_at = datetime('now', '-100 days') WHERE id IN (?, ?)",
+                     tuple(conversation_ids[:2]))
+
+    assert db.purge_conversations(older_than_days=30, batch_size=1) == 2
+    assert db.purge_conversations(max_per_user=3, batch_size=1) == 1
+
+    remaining = [c["id"] for c in db.get_user_conversations(user_id)]
+    assert remaining == conversation_ids[:2:-1]
+    with db._connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 6
+        assert conn.execute("SELECT COUNT(*) FROM message_sources").fetchone()[0] == 3
+
+
+def test_incremental_vacuum_releases_pages(db):
+    """Test deleted conversations give their pages back to the filesystem."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Big")
+    for _ in range(50):
+        db.persist_turn(conversation_id, "q", "x" * 20000)
+
+    db.delete_conversation(conversation_id)
+
+    assert db.incremental_vacuum() > 0
+    with db._connection() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_vacuum_enables_incremental_vacuum_on_older_files(tmp_path):
+    """Test a database created without incremental auto-vacuum releases space after one vacuum()."""
+    path = str(tmp_path / "old_chat.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE legacy (id INTEGER)")
+    conn.close()
+    db = SQLiteChatDB(path)
+    user_id = db.get_or_create_user("dev@example.com")
+
+    def add_and_delete_conversation():
+        conversation_id = db.create_conversation(user_id, "Big")
+        for _ in range(20):
+            db.persist_turn(conversation_id, "q", "x" * 20000)
+        db.delete_conversation(conversation_id)
+
+    add_and_delete_conversation()
+    assert db.incremental_vacuum() == 0
+    assert db.vacuum() > 0
+
+    add_and_delete_conversation()
+    assert db.incremental_vacuum() > 0
+    db.close()
+
+
+def test_keyset_pages_cover_conversations_and_messages(db):
+    """Test following the cursor returns every row once, newest pages first."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_ids = [db.create_conversation(user_id, f"Chat {i}") for i in range(5)]
+    # Equal timestamps make the id the tie-breaker
+    with db._connection() as conn:
+        conn.execute("UPDATE conversations SET updated_at = '2024-01-01 00:00:00'")
+
+    pages, before = [], None
+    while True:
+        page = db.get_user_conversations(user_id, limit=2, before=before)
+        if not page:
+            break
+        pages.append([c["id"] for c in page])
+        before = (page[-1]["updated_at"], page[-1]["id"])
+    assert pages == [conversation_ids[:2:-1], conversation_ids[2:0:-1], conversation_ids[:1]]
+
+    for i in range(5):
+        db.add_message(conversation_ids[0], 'user', f"message {i}")
+    latest = db.get_conversation_messages(conversation_ids[0], limit=2)
+    older = db.get_conversation_messages(conversation_ids[0], limit=2,
+                                         before=(latest[0]["created_at"], latest[0]["id"]))
+    assert [m["content"] for m in older + latest] == [f"message {i}" for i in range(1, 5)]
+
+
+def test_message_count_is_kept_current(db):
+    """Test the denormalized counter follows single messages and whole turns."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Denver")
+
+    db.add_message(conversation_id, 'user', "Coffee shops?")
+    db.persist_turn(conversation_id, "And libraries?", "12%")
+
+    assert db.get_conversation(conversation_id)["message_count"] == 3
+    assert db.get_user_conversations(user_id)[0]["message_count"] == 3
+    assert db.get_conversation(conversation_id + 1) is None
+
+
+def test_sources_for_messages_in_one_call(db):
+    """Test bulk source loading matches per-message loading, batches included."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Denver")
+    message_ids = [
+        db.persist_turn(conversation_id, "q", "a", "rag", 0.9, 0.0,
+                        [{"type": "rag", "text": f"chunk {i}", "score": s, "metadata": {"i": i}} for s in (0.2, 0.8)])
+        for i in range(3)
+    ]
+    bare_id = db.persist_turn(conversation_id, "q", "no sources")
+
+    import app.database
+    app.database.SOURCES_BATCH_SIZE, batch_size = 2, app.database.SOURCES_BATCH_SIZE
+    try:
+        sources = db.get_sources_for_messages(message_ids + [bare_id])
+    finally:
+        app.database.SOURCES_BATCH_SIZE = batch_size
+
+    assert sources == {message_id: db.get_message_sources(message_id) for message_id in message_ids + [bare_id]}
+    assert [s["score"] for s in sources[message_ids[0]]] == [0.8, 0.2]
+    assert sources[bare_id] == []
+
+
+def test_token_counts_are_stored_with_messages(db):
+    """Test per-message token counts round-trip, NULL when unknown."""
+    user_id = db.get_or_create_user("dev@example.com")
+    conversation_id = db.create_conversation(user_id, "Denver")
+    db.add_message(conversation_id, 'user', "Legacy question")
+    db.persist_turn(conversation_id, "Coffee shops?", "42%", user_tokens=3, answer_tokens=2)
+
+    assert [m["token_count"] for m in db.get_conversation_messages(conversation_id)] == [None, 3, 2]
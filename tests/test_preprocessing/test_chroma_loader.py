@@ -0,0 +1,157 @@
+import pytest
+import sys
+import os
+import json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'preprocessing'))
+
+from unittest.mock import Mock, patch
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+# Imported before the stubs so the encoder stack outlives them
+from tools import model_registry
+
+# langchain is stubbed only while the loader modules are imported
+stubs = {'langchain': Mock(), 'langchain.text_splitter': Mock()}
+with patch.dict(sys.modules, stubs):
+    from preprocessing.chroma_loader import ChromaDBLoader, chunk_ids
+    from preprocessing.main import ingest_directory
+    from tools.rag_tool import rag_search
+    loaded = {name: module for name, module in sys.modules.items() if name not in stubs}
+# Keep the modules imported against the stubs: tests patch them, and directory
+# ingestion pickles functions of the flat chunker module for its worker processes
+sys.modules.update(loaded)
+
+
+class CountingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Tiny deterministic embedder that records every document it embeds."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, input: Documents) -> Embeddings:
+        self.embedded.extend(input)
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in input]
+
+
+@pytest.fixture
+def loader(tmp_path):
+    """ChromaDBLoader on a temporary database with the counting embedder."""
+    embedder = CountingEmbeddingFunction()
+    with patch('preprocessing.chroma_loader.get_embedding_function', return_value=embedder):
+        yield ChromaDBLoader("test_sync", path=str(tmp_path / "chroma_db"))
+
+
+def test_chunk_ids_are_stable_and_unique():
+    """Test ids depend on content, not position, and repeated chunks stay distinct."""
+    first = chunk_ids(["a", "b", "a"])
+    second = chunk_ids(["c", "a", "b", "a"])
+
+    assert len(set(first)) == 3
+    assert second[1:] == first
+    assert chunk_ids(["a"], source="other.md") != chunk_ids(["a"])
+
+
+def test_sync_only_embeds_changed_chunks(loader):
+    """Test re-indexing embeds new rows, deletes removed ones and is idempotent."""
+    rows = [f"row {i} | Denver | coffee shops" for i in range(50)]
+    loader.sync_chunks(rows)
+    loader.embedding_function.embedded.clear()
+
+    assert loader.sync_chunks(rows) == {"added": 0, "removed": 0, "moved": 0, "unchanged": 50}
+    assert loader.embedding_function.embedded == []
+
+    edited = ["inserted row"] + rows[:10] + ["row 10 | Denver | libraries"] + rows[11:49]
+    stats = loader.sync_chunks(edited)
+
+    assert loader.embedding_function.embedded == ["inserted row", "row 10 | Denver | libraries"]
+    assert stats == {"added": 2, "removed": 2, "moved": 48, "unchanged": 0}
+    assert loader.get_count() == 50
+    ids = chunk_ids(edited)
+    stored = loader.collection.get(ids=[ids[0], ids[11]], include=["metadatas"])
+    assert sorted(m["chunk_index"] for m in stored["metadatas"]) == [0, 11]
+
+    with open(loader.manifest_path, encoding="utf-8") as file:
+        assert json.load(file)["sources"]["data.md"] == chunk_ids(edited)
+
+
+def test_sync_replaces_positional_ids_without_manifest(loader):
+    """Test a database indexed before the manifest existed is cleaned up on the first sync."""
+    loader.collection.add(documents=["old a", "old b"], ids=["chunk_0", "chunk_1"])
+
+    stats = loader.sync_chunks(["new a"])
+
+    assert stats["removed"] == 2
+    assert loader.collection.get(include=[])["ids"] == chunk_ids(["new a"])
+
+
+def test_sync_streams_chunks_in_bounded_batches(loader):
+    """Test a lazy iterable is embedded and written batch_size chunks at a time."""
+    calls = []
+    embed = loader.embedding_function
+    loader.embedding_function = lambda documents: calls.append(len(documents)) or embed(documents)
+
+    stats = loader.sync_chunks((f"row {i}" for i in range(25)), batch_size=10)
+
+    assert calls == [10, 10, 5]
+    assert stats["added"] == 25
+    assert loader.get_count() == 25
+
+
+def test_ingest_directory_stores_metadata_and_drops_deleted_files(loader, tmp_path):
+    """Test every markdown file is synced with source, section and row, and deleted files are removed."""
+    docs = tmp_path / "docs"
+    (docs / "cities").mkdir(parents=True)
+    (docs / "cities" / "denver.md").write_text("# Denver\n| text |\n| :--- |\n| 42% prefer coffee shops |\n", encoding="utf-8")
+    (docs / "notes.md").write_text("| text |\n| :--- |\n| Survey ran in 2024 |\n", encoding="utf-8")
+
+    stats = ingest_directory(loader, str(docs), parse_workers=1)
+
+    assert set(stats) == {"cities/denver.md", "notes.md"}
+    stored = loader.collection.get(ids=chunk_ids([("42% prefer coffee shops", {"section": "Denver"})], "cities/denver.md"),
+                                   include=["metadatas"])
+    assert stored["metadatas"] == [{"source": "cities/denver.md", "section": "Denver", "row": 1, "chunk_index": 0}]
+
+    (docs / "notes.md").unlink()
+    ingest_directory(loader, str(docs), parse_workers=1)
+
+    assert loader.get_count() == 1
+    assert set(loader.load_manifest()) == {"cities/denver.md"}
+
+
+def test_rag_search_filters_on_entities_in_the_query(loader):
+    """Test a query naming a city only returns that city's rows, and other queries are not filtered."""
+    cities = ["Denver", "Seattle", "San Francisco", "Boston"]
+    rows = [f"{10 + i}% of remote workers in {cities[i % 4]} prefer libraries." for i in range(20)]
+    loader.sync_chunks(rows)
+    # The vector of a Seattle row, so an unfiltered search ranks that row first
+    query_embedding = loader.embedding_function([rows[1]])[0]
+
+    def search(query, **kwargs):
+        with patch('tools.rag_tool.ChromaDBLoader', return_value=loader):
+            return rag_search(query, similarity_threshold=float("-inf"), query_embedding=query_embedding, **kwargs)
+
+    results = search("What share of remote workers in San Francisco prefer libraries?")
+    assert len(results) == 5
+    assert {chunk["metadata"]["city"] for chunk in results} == {"San Francisco"}
+    assert {chunk["metadata"]["metric"] for chunk in results} == {"share_of_workers"}
+
+    assert {chunk["metadata"]["city"] for chunk in search("Are Denver workers more likely to work late?")} == {"Denver"}
+    # Boise is not in the collection, so the search is not filtered
+    assert search("Remote workers in Boise")[0]["text"] == rows[1]
+    assert search("Remote workers in San Francisco", entity_filters=False)[0]["text"] == rows[1]
+
+
+def test_sync_adds_entities_to_chunks_indexed_before_extraction(loader):
+    """Test a source whose manifest predates entity extraction gets them without re-embedding."""
+    rows = ["42% of remote workers in Denver prefer coffee shops."]
+    loader.sync_chunks(rows)
+    loader.save_manifest(loader.load_manifest(), entities={})
+    loader.collection.update(ids=chunk_ids(rows), metadatas=[{"source": "data.md", "chunk_index": 0}])
+    loader.embedding_function.embedded.clear()
+
+    loader.sync_chunks(rows)
+
+    assert loader.embedding_function.embedded == []
+    assert loader.collection.get(include=["metadatas"])["metadatas"][0]["city"] == "Denver"
+    assert loader.entity_index().recognize("Denver") == {"city": ["Denver"]}
@@ -5,10 +5,12 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
 from unittest.mock import Mock, patch
 
-sys.modules['langchain.text_splitter'] = Mock()
-sys.modules['langchain'] = Mock()
-
-from preprocessing.chunker import chunk_text, load_markdown_file
+# langchain is stubbed only while the chunker is imported
+with patch.dict(sys.modules, {'langchain': Mock(), 'langchain.text_splitter': Mock()}):
+    from preprocessing.chunker import chunk_text, iter_chunks, iter_document_chunks, iter_recursive_chunks, load_markdown_file
+    import preprocessing.chunker as chunker
+# Tests patch names on the chunker module, so it stays importable
+sys.modules['preprocessing.chunker'] = chunker
 
 
 def test_chunk_text_table_rows():
@@ -21,10 +23,10 @@ def test_chunk_text_table_rows():
     result = chunk_text(text, method="table_rows")
     
     assert isinstance(result, list)
-    assert len(result) == 3 
-    assert "Column1 | Column2" in result[0]
-    assert "data1   | data2" in result[1]
-    assert "info1   | info2" in result[2]
+    # The header row is followed by a separator, so neither is data
+    assert len(result) == 2
+    assert "data1   | data2" in result[0]
+    assert "info1   | info2" in result[1]
 
 
 def test_chunk_text_recursive():
@@ -95,4 +97,72 @@ def test_load_markdown_file():
         result = load_markdown_file("test.md")
     
     assert result == test_content
-    mock_file.assert_called_once_with("test.md", 'r', encoding='utf-8')
\ No newline at end of file
+    mock_file.assert_called_once_with("test.md", 'r', encoding='utf-8')
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_iter_chunks_streams_table_rows_from_file(tmp_path, use_mmap):
+    """Test streamed table rows match chunk_text, read directly or memory-mapped."""
+    text = "| text |\n| :--- |\n| 42% of remote workers in Denver |\n\n| Caf\u00e9s in Seattle |\n"
+    path = tmp_path / "data.md"
+    path.write_text(text, encoding="utf-8")
+
+    chunks = iter_chunks(str(path), method="table_rows", use_mmap=use_mmap)
+
+    assert not isinstance(chunks, list)
+    assert list(chunks) == chunk_text(text, method="table_rows")
+
+
+def test_iter_recursive_chunks_splits_bounded_blocks():
+    """Test streamed prose is split in blocks that end at paragraph breaks."""
+    mock_splitter = Mock()
+    mock_splitter.split_text.side_effect = lambda block: [block]
+    lines = ["first paragraph line\n", "\n", "second paragraph\n", "\n", "tail\n"]
+
+    with patch('preprocessing.chunker.RecursiveCharacterTextSplitter', return_value=mock_splitter):
+        blocks = list(iter_recursive_chunks(iter(lines), block_chars=15))
+
+    assert blocks == ["first paragraph line\n\n", "second paragraph\n\n", "tail\n"]
+    assert "".join(blocks) == "".join(lines)
+
+
+def test_iter_document_chunks_tags_sections_and_rows(tmp_path):
+    """Test tables are chunked by row and prose recursively, with section and row metadata."""
+    path = tmp_path / "cities.md"
+    path.write_text(
+        "Intro paragraph.\n\n# Denver\n| text |\n| :--- |\n| 42% prefer coffee shops |\n| 18% start before 9 AM |\n"
+        "\n## Notes\nSurvey ran in 2024.\n",
+        encoding="utf-8"
+    )
+    mock_splitter = Mock()
+    mock_splitter.split_text.side_effect = lambda text: [text.strip()]
+
+    with patch('preprocessing.chunker.RecursiveCharacterTextSplitter', return_value=mock_splitter):
+        chunks = list(iter_document_chunks(str(path)))
+
+    assert chunks == [
+        ("Intro paragraph.", {"section": ""}),
+        ("42% prefer coffee shops", {"section": "Denver", "row": 1}),
+        ("18% start before 9 AM", {"section": "Denver", "row": 2}),
+        ("Survey ran in 2024.", {"section": "Notes"}),
+    ]
+
+
+def test_iter_document_chunks_reads_multi_column_tables(tmp_path):
+    """Test the header is found from the separator row, not from its wording."""
+    path = tmp_path / "shares.md"
+    path.write_text(
+        "# Shares\n| City | Share |\n|------|-------|\n| Denver | 42% |\n| Boston | text messages |\n"
+        "\n| No | header |\n| Austin | 35% |\n",
+        encoding="utf-8"
+    )
+
+    with patch('preprocessing.chunker.RecursiveCharacterTextSplitter'):
+        chunks = list(iter_document_chunks(str(path)))
+
+    assert chunks == [
+        ("Denver | 42%", {"section": "Shares", "row": 1}),
+        ("Boston | text messages", {"section": "Shares", "row": 2}),
+        ("No | header", {"section": "Shares", "row": 1}),
+        ("Austin | 35%", {"section": "Shares", "row": 2}),
+    ]
@@ -0,0 +1,38 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from preprocessing.entities import ENTITY_FIELDS, EntityIndex, extract_entities, where_filter
+
+
+def test_extract_entities_from_rows():
+    """Test city and metric are read from both kinds of survey row."""
+    assert extract_entities("Remote workers in Salt Lake City are 73% more likely to work early.") == {
+        "city": "Salt Lake City", "metric": "relative_likelihood"}
+    assert extract_entities("42% of remote workers in Denver prefer coffee shops.") == {
+        "city": "Denver", "metric": "share_of_workers"}
+    assert extract_entities("The survey ran in 2024.") == {}
+
+
+def test_entity_index_matches_longest_names():
+    """Test multi-word names win over their prefixes and matching ignores case."""
+    index = EntityIndex({"city": ["Salt Lake City", "Salt", "Denver"], "metric": ["share_of_workers"]})
+
+    assert index.recognize("What percentage of remote workers in salt lake city or Denver?") == {
+        "metric": ["share_of_workers"], "city": ["Salt Lake City", "Denver"]}
+    assert index.recognize("tips for remote work") == {}
+
+
+def test_filters_relax_from_most_specific_to_none():
+    """Test filters drop the metric, then everything, and several values become $in."""
+    index = EntityIndex({"city": ["Denver", "Boston"], "metric": ["relative_likelihood"]})
+    question = "Are workers in Denver more likely to use standing desks?"
+
+    assert index.filters(question, fields=ENTITY_FIELDS) == [
+        {"$and": [{"city": "Denver"}, {"metric": "relative_likelihood"}]}, {"city": "Denver"}, None]
+    assert index.filters(question) == [{"city": "Denver"}, None]
+    assert index.filters("Which habits are more likely?") == [None]
+    assert index.filters("Denver vs Boston") == [{"city": {"$in": ["Denver", "Boston"]}}, None]
+    assert index.filters("hello") == [None]
+    assert where_filter({}) is None
@@ -0,0 +1,76 @@
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from unittest.mock import patch
+from tools.cache import TTLCache, SQLiteTTLCache, create_cache
+
+
+def test_ttl_cache_hit_and_miss():
+    """Test counters track hits and misses."""
+    cache = TTLCache("test", max_size=10, ttl=60)
+
+    assert cache.get("a") is None
+    cache.set("a", {"value": 1})
+    assert cache.get("a") == {"value": 1}
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_ttl_cache_expiry_keeps_stale_for_peek():
+    """Test expired entries miss on get but stay available to peek."""
+    cache = TTLCache("test", max_size=10, ttl=60)
+
+    with patch('tools.cache.time.time', return_value=1000.0):
+        cache.set("a", "old")
+    with patch('tools.cache.time.time', return_value=1061.0):
+        assert cache.get("a") is None
+        assert cache.peek("a") == "old"
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Test the size bound drops the least recently used entry."""
+    cache = TTLCache("test", max_size=2, ttl=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_sqlite_cache_survives_restart(tmp_path):
+    """Test the SQLite backend keeps entries across instances."""
+    db_path = str(tmp_path / "cache.db")
+
+    SQLiteTTLCache("search", db_path, max_size=10, ttl=60).set("q", {"articles": [1, 2]})
+    cache = SQLiteTTLCache("search", db_path, max_size=10, ttl=60)
+
+    assert cache.get("q") == {"articles": [1, 2]}
+    assert SQLiteTTLCache("page", db_path).get("q") is None
+
+
+def test_sqlite_cache_size_bound(tmp_path):
+    """Test the SQLite backend evicts down to max_size."""
+    cache = SQLiteTTLCache("search", str(tmp_path / "cache.db"), max_size=3, ttl=60)
+
+    for i in range(5):
+        with patch('tools.cache.time.time', return_value=1000.0 + i):
+            cache.set(f"k{i}", i)
+
+    assert cache.stats()["size"] == 3
+    assert cache.peek("k0") is None
+    assert cache.peek("k4") == 4
+
+
+def test_create_cache_defaults_to_memory():
+    """Test no path gives an in-memory cache."""
+    cache = create_cache("test", max_size=5, ttl=10)
+    assert type(cache) is TTLCache
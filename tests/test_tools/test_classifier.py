@@ -6,17 +6,27 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
 from unittest.mock import patch
 from tools.classifier import Classifier
+from tools import model_registry
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    """Keep the shared encoder from leaking between tests."""
+    model_registry.reset()
+    yield
+    model_registry.reset()
+
 
 def test_classifier_init():
     """Test classifier can be created."""
-    with patch('tools.classifier.SentenceTransformer'):
+    with patch('tools.model_registry.SentenceTransformer'):
         classifier = Classifier()
         assert classifier is not None
 
 
 def test_score_short_content():
     """Test score returns 0 for short content."""
-    with patch('tools.classifier.SentenceTransformer'):
+    with patch('tools.model_registry.SentenceTransformer'):
         classifier = Classifier()
         score = classifier.score("test", "short")
         assert score == 0.0
@@ -24,7 +34,7 @@ def test_score_short_content():
 
 def test_score_long_content():
     """Test score works with long content."""
-    with patch('tools.classifier.SentenceTransformer'):
+    with patch('tools.model_registry.SentenceTransformer'):
         classifier = Classifier()
         score = classifier.score("test", "this is a long content that has more than ten characters")
         assert 0.0 <= score <= 1.0
@@ -32,7 +42,7 @@ def test_score_long_content():
 
 def test_keyword_overlap():
     """Test keyword overlap calculation."""
-    with patch('tools.classifier.SentenceTransformer'):
+    with patch('tools.model_registry.SentenceTransformer'):
         classifier = Classifier()
         score = classifier._keyword_overlap("machine learning", "machine learning is great")
         assert score == 1.0
@@ -40,8 +50,55 @@ def test_keyword_overlap():
 
 def test_embedding_without_model():
     """Test embedding similarity without model."""
-    with patch('tools.classifier.SentenceTransformer'):
+    with patch('tools.model_registry.SentenceTransformer'):
         classifier = Classifier()
         classifier.model = None
         score = classifier._embedding_similarity("test", "content")
-        assert score == 0.0
\ No newline at end of file
+        assert score == 0.0
+
+
+def test_embedding_similarity_reuses_query_embedding():
+    """Test a precomputed query vector skips the second query encode."""
+    import numpy as np
+
+    with patch('tools.model_registry.SentenceTransformer'):
+        classifier = Classifier()
+        classifier.model.encode.return_value = np.array([[1.0, 0.0]])
+
+        score = classifier._embedding_similarity("test", "content", query_embedding=[1.0, 0.0])
+
+        assert score == pytest.approx(1.0)
+        classifier.model.encode.assert_called_once_with(["content"])
+
+
+def test_embed_query_without_model():
+    """Test embed_query returns None when the model failed to load."""
+    with patch('tools.model_registry.SentenceTransformer'):
+        classifier = Classifier()
+        classifier.model = None
+        assert classifier.embed_query("test") is None
+
+
+def test_score_chunks_aggregates():
+    """Test stored chunk vectors are aggregated without calling the model."""
+    with patch('tools.model_registry.SentenceTransformer'):
+        classifier = Classifier()
+        query_embedding = [1.0, 0.0]
+        chunk_embeddings = [[1.0, 0.0], [0.0, 1.0]]
+
+        assert classifier._aggregate_similarity(query_embedding, chunk_embeddings, "max") == pytest.approx(1.0)
+        assert classifier._aggregate_similarity(query_embedding, chunk_embeddings, "mean") == pytest.approx(0.5)
+        assert classifier._aggregate_similarity(query_embedding, chunk_embeddings, "weighted") == pytest.approx(1.0)
+
+        score = classifier.score_chunks("remote workers", chunk_embeddings, "remote workers in Denver",
+                                        query_embedding, aggregate="max")
+        assert score == pytest.approx(1.0)
+        classifier.model.encode.assert_not_called()
+
+
+def test_score_chunks_invalid_aggregate():
+    """Test an unknown aggregate is rejected."""
+    with patch('tools.model_registry.SentenceTransformer'):
+        classifier = Classifier()
+        with pytest.raises(ValueError):
+            classifier.score_chunks("q", [[1.0]], "long enough content", [1.0], aggregate="median")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import pytest
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+from unittest.mock import patch, Mock
+from tools import model_registry
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    """Start every test with an empty registry."""
+    model_registry.reset()
+    yield
+    model_registry.reset()
+
+
+def test_get_encoder_loads_once():
+    """Test the encoder is loaded once and then reused."""
+    with patch('tools.model_registry.SentenceTransformer') as mock_st:
+        first = model_registry.get_encoder("all-mpnet-base-v2")
+        second = model_registry.get_encoder("all-mpnet-base-v2")
+
+        assert first is second
+        mock_st.assert_called_once_with("all-mpnet-base-v2")
+
+
+def test_get_encoder_loads_once_across_threads():
+    """Test concurrent first calls still load the model a single time."""
+    with patch('tools.model_registry.SentenceTransformer') as mock_st:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(model_registry.get_encoder("m")))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert mock_st.call_count == 1
+        assert all(result is results[0] for result in results)
+
+
+def test_get_chroma_client_is_shared_per_path(tmp_path):
+    """Test one client is opened per persistence path."""
+    with patch('tools.model_registry.chromadb.PersistentClient') as mock_client:
+        first = model_registry.get_chroma_client(str(tmp_path))
+        second = model_registry.get_chroma_client(str(tmp_path))
+
+        assert first is second
+        mock_client.assert_called_once()
+
+
+def test_embedding_function_uses_shared_encoder():
+    """Test the Chroma embedding function encodes with the shared model."""
+    import numpy as np
+
+    with patch('tools.model_registry.SentenceTransformer') as mock_st:
+        mock_st.return_value.encode.return_value = np.array([[0.1, 0.2], [0.3, 0.4]])
+        ef = model_registry.get_embedding_function("m")
+
+        # Creating the function must not load the model
+        mock_st.assert_not_called()
+
+        embeddings = ef(["a", "b"])
+        assert len(embeddings) == 2
+        assert mock_st.call_count == 1
+
+
+def test_warmup_survives_load_errors():
+    """Test warmup logs and continues when a model fails to load."""
+    with patch('tools.model_registry.SentenceTransformer', side_effect=Exception("offline")), \
+         patch('tools.model_registry.chromadb.PersistentClient', return_value=Mock()) as mock_client:
+        model_registry.warmup(["m"], chroma_path="./chroma_db")
+
+        mock_client.assert_called_once()
@@ -1,6 +1,7 @@
 import pytest
 import sys
 import os
+import time
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
 
 from unittest.mock import patch, Mock
@@ -9,10 +10,21 @@ from tools.web_search import (
     content_is_relevant, 
     get_urls_from_google_search,
     extract_content_from_url,
-    web_search_tool
+    fetch_contents,
+    web_search_tool,
+    web_cache_stats,
+    clear_web_caches
 )
 
 
+@pytest.fixture(autouse=True)
+def empty_web_caches():
+    """Keep cached searches and pages from leaking between tests."""
+    clear_web_caches()
+    yield
+    clear_web_caches()
+
+
 def test_url_is_accepted_default():
     """Test URL acceptance with no lists."""
     result = url_is_accepted("https://example.com")
@@ -101,7 +113,7 @@ def test_extract_content_from_url_failure():
 def test_web_search_tool_success():
     """Test web search tool with successful results."""
     with patch('tools.web_search.get_urls_from_google_search') as mock_search, \
-         patch('tools.web_search.extract_content_from_url') as mock_extract:
+         patch('tools.web_search.fetch_contents') as mock_fetch:
         
         mock_search.return_value = {
             "status": "Success",
@@ -115,7 +127,7 @@ def test_web_search_tool_success():
                 }
             ]
         }
-        mock_extract.return_value = "Extracted content"
+        mock_fetch.return_value = {"https://example.com": "Extracted content"}
         
         result = web_search_tool("test query")
         
@@ -133,4 +145,200 @@ def test_web_search_tool_empty_results():
         }
         
         result = web_search_tool("test query")
-        assert result == []
\ No newline at end of file
+        assert result == []
+
+
+ARTICLE_HTML = """<html><head><title>{title}</title></head><body><article>
+<h1>{title}</h1>
+<p>Remote workers in Denver prefer working from coffee shops at least once a week, according to a survey of more than two thousand people across the city.</p>
+<p>The same survey found that flexible schedules and quiet neighbourhood cafes were the main reasons given, with most respondents citing fewer interruptions than at home.</p>
+</article></body></html>"""
+
+
+@pytest.fixture
+def page_server():
+    """Local HTTP stand-in serving article, slow, missing and oversized pages."""
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path.startswith("/etag") and self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if self.path.startswith("/huge"):
+                # No Content-Length: the size is only known by reading the body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for _ in range(200):
+                        self.wfile.write(b"<p>" + b"x" * 65536 + b"</p>")
+                except OSError:
+                    pass
+                self.close_connection = True
+                return
+            if self.path.startswith("/no-charset"):
+                # UTF-8 without a charset in the header, which requests would read as ISO-8859-1
+                body = ARTICLE_HTML.format(title="Caf\u00e9 na\u00efve \u2014 r\u00e9sum\u00e9").encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.path.startswith("/slow"):
+                time.sleep(2)
+            if self.path.startswith("/missing"):
+                body = b"not found"
+                self.send_response(404)
+            else:
+                body = ARTICLE_HTML.format(title=self.path.strip("/")).encode()
+                self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_contents_from_local_server(page_server):
+    """Test pages are fetched and extracted concurrently."""
+    urls = [f"{page_server}/first", f"{page_server}/second", f"{page_server}/missing"]
+
+    contents = fetch_contents(urls)
+
+    assert "coffee shops" in contents[urls[0]]
+    assert "coffee shops" in contents[urls[1]]
+    assert contents[urls[2]] is None
+
+
+def test_fetch_contents_stops_after_enough_good_pages(page_server):
+    """Test early exit does not wait for slow pages."""
+    import time
+
+    urls = [f"{page_server}/slow", f"{page_server}/fast"]
+
+    start = time.monotonic()
+    contents = fetch_contents(urls, max_good=1)
+
+    assert time.monotonic() - start < 1.5
+    assert contents[urls[1]] is not None
+    assert contents[urls[0]] is None
+
+
+def test_fetch_contents_respects_deadline(page_server):
+    """Test the overall deadline returns whatever is ready."""
+    import time
+
+    urls = [f"{page_server}/slow"]
+
+    start = time.monotonic()
+    contents = fetch_contents(urls, deadline=0.5)
+
+    assert time.monotonic() - start < 1.5
+    assert contents[urls[0]] is None
+
+
+def test_search_results_are_cached():
+    """Test a repeated, differently formatted query is served from the cache."""
+    with patch('tools.web_search.serpapi') as mock_serpapi:
+        mock_search = Mock()
+        mock_search.as_dict.return_value = {
+            "search_metadata": {"status": "Success"},
+            "organic_results": [{"title": "Test Title", "link": "https://example.com"}]
+        }
+        mock_serpapi.search.return_value = mock_search
+
+        first = get_urls_from_google_search("Remote workers in Denver?")
+        second = get_urls_from_google_search("  remote workers in   denver ")
+
+        assert first == second
+        assert mock_serpapi.search.call_count == 1
+        assert web_cache_stats()["search"]["hits"] == 1
+
+
+def test_page_cache_and_etag_revalidation(page_server):
+    """Test cached pages skip the network and expired ones revalidate with ETag."""
+    from tools.web_search import fetch_page
+
+    url = f"{page_server}/etag-page"
+    first = fetch_contents([url])
+    assert first[url] is not None
+
+    pages = []
+    def recording_fetch(*args):
+        page = fetch_page(*args)
+        pages.append(page)
+        return page
+
+    with patch('tools.web_search.fetch_page', side_effect=recording_fetch):
+        assert fetch_contents([url])[url] == first[url]
+        assert pages == []
+
+        # Expire the entry: the next fetch is conditional and answered with 304
+        with patch('tools.cache.time.time', return_value=time.time() + 10 * 24 * 3600):
+            assert fetch_contents([url])[url] == first[url]
+
+    assert len(pages) == 1
+    assert pages[0]["not_modified"] is True
+
+
+def test_fetch_page_stops_at_byte_cap(page_server):
+    """Test oversized pages are skipped, whether declared by Content-Length or found while streaming."""
+    import asyncio
+    from tools.web_search import fetch_page, async_fetch_page
+
+    with patch('tools.web_search.MAX_PAGE_BYTES', 100_000):
+        assert fetch_page(f"{page_server}/huge")["html"] is None
+        assert asyncio.run(async_fetch_page(f"{page_server}/huge"))["html"] is None
+        assert b"coffee shops" in fetch_page(f"{page_server}/first")["html"]
+
+    with patch('tools.web_search.MAX_PAGE_BYTES', 100):
+        assert fetch_page(f"{page_server}/first")["html"] is None
+        assert asyncio.run(async_fetch_page(f"{page_server}/first"))["html"] is None
+
+
+def test_fetch_contents_detects_charset_missing_from_header(page_server):
+    """Test a UTF-8 page served as plain text/html is not decoded as ISO-8859-1."""
+    import asyncio
+    from tools.web_search import async_fetch_contents
+
+    url = f"{page_server}/no-charset"
+
+    assert "Caf\u00e9 na\u00efve \u2014 r\u00e9sum\u00e9" in fetch_contents([url])[url]
+    clear_web_caches()
+    assert "Caf\u00e9 na\u00efve \u2014 r\u00e9sum\u00e9" in asyncio.run(async_fetch_contents([url]))[url]
+
+
+def test_async_fetch_contents_matches_sync(page_server):
+    """Test the httpx path extracts the same pages and honours max_good."""
+    import asyncio
+    from tools.web_search import async_fetch_contents
+
+    urls = [f"{page_server}/first", f"{page_server}/missing", f"{page_server}/slow"]
+
+    start = time.monotonic()
+    contents = asyncio.run(async_fetch_contents(urls, max_good=1))
+
+    assert time.monotonic() - start < 1.5
+    assert "coffee shops" in contents[urls[0]]
+    assert contents[urls[1]] is None
+    assert contents[urls[2]] is None
\ No newline at end of file